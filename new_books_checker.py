@@ -6,358 +6,463 @@
 """
 
 import asyncio
-import json
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime
+import sys
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from playwright.async_api import async_playwright
 
-# 設定
-PET_CATEGORY_URL = "https://www.eslite.com/category/3/123"
-DATA_FILE = "previous_books.json"
+from pet_books_adaptive import (
+    CRAWL_MAX_CONCURRENCY, THROTTLE_STATUSES, FetchError, parse_retry_after, retry_with_backoff,
+)
+from pet_books_catalog import CATALOG_DB, Catalog, now_iso, parse_product_id
+from pet_books_delta import EVENT_ADDED, diff_catalog, events_of_type, format_event_summary
+from pet_books_crawler import (
+    BROWSER_RETRYABLE_ERRORS, MAX_CONSECUTIVE_FAILURES, ResourcePolicy, build_page_url, extract_product_cards, format_wait_summary,
+    get_total_pages, wait_for_product_grid,
+)
+from pet_books_http import HttpConnectionPool, HttpListingBackend
+from pet_books_journal import CHECK_JOURNAL_FILE, CrawlJournal
+from pet_books_mailer import (
+    OUTBOX_DB, Outbox, SmtpMailer, deliver_pending, render_new_books_email,
+)
+from pet_books_schedule import CRAWL_CATEGORIES, CrawlScheduler, merge_category_books
+from pet_books_scraper import KeywordMatcher
+from pet_books_subscribers import (
+    GoogleSheetsSource, SubscriberDirectory, format_preference, group_by_preference, plan_digests,
+)
 
-# Email 設定 (從環境變數讀取)
-SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
-SENDER_EMAIL = os.environ.get("SENDER_EMAIL", "")
-SENDER_PASSWORD = os.environ.get("SENDER_PASSWORD", "")  # Gmail 應用程式密碼
+# 設定
+DATA_FILE = "previous_books.json"  # 舊版資料檔，僅用於匯入書目資料庫
 
-# Google Sheets 設定
-GOOGLE_SHEETS_ID = os.environ.get("GOOGLE_SHEETS_ID", "")  # Google Sheets 的 ID
-GOOGLE_CREDENTIALS_JSON = os.environ.get("GOOGLE_CREDENTIALS_JSON", "")  # Service Account JSON
+# 分類頁面排序參數（例如依上架日期由新到舊）；增量模式需要新書排在前面，未設定時一律完整爬取
+LISTING_SORT_QUERY = os.environ.get("LISTING_SORT_QUERY", "")
 
-# 向下相容：如果有設定 RECIPIENT_EMAIL，也加入訂閱者名單
-RECIPIENT_EMAIL = os.environ.get("RECIPIENT_EMAIL", "")
 
+def listing_url(category_url: str) -> str:
+    """加上排序參數的分類頁面網址"""
+    if not LISTING_SORT_QUERY:
+        return category_url
+    separator = "&" if "?" in category_url else "?"
+    return f"{category_url}{separator}{LISTING_SORT_QUERY}"
 
-def get_subscribers_from_google_sheets() -> list:
-    """從 Google Sheets 讀取訂閱者 Email 名單"""
-    subscribers = []
 
-    # 如果沒有設定 Google Sheets，返回空列表
-    if not GOOGLE_SHEETS_ID or not GOOGLE_CREDENTIALS_JSON:
-        print("未設定 Google Sheets，跳過從試算表讀取訂閱者")
-        return subscribers
+# 要檢查的分類（見 pet_books_schedule.CRAWL_CATEGORIES），網址加上排序參數
+LISTING_CATEGORIES = [(name, listing_url(url)) for name, url in CRAWL_CATEGORIES]
 
-    try:
-        import gspread
-        from google.oauth2.service_account import Credentials
+# 增量模式：連續幾頁都是已知書籍就停止；每隔幾天做一次完整爬取
+INCREMENTAL_STOP_PAGES = int(os.environ.get("INCREMENTAL_STOP_PAGES", "2"))
+FULL_CRAWL_INTERVAL_DAYS = int(os.environ.get("FULL_CRAWL_INTERVAL_DAYS", "7"))
+FULL_CRAWL = os.environ.get("FULL_CRAWL", "") == "1"
 
-        # 解析 credentials JSON
-        credentials_dict = json.loads(GOOGLE_CREDENTIALS_JSON)
+# 舊版 scrape_books_from_page 每張卡片的瀏覽器往返次數，用於比較
+LEGACY_CALLS_PER_CARD = 10
 
-        # 設定 Google Sheets API 權限範圍
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets.readonly'
-        ]
+# 改用就緒等待前每頁的固定等待秒數，用於比較
+FIXED_PAGE_DELAY = 4
 
-        credentials = Credentials.from_service_account_info(credentials_dict, scopes=scopes)
-        client = gspread.authorize(credentials)
+# 分類頁面抓取方式：http（先以 HTTP 解析，失敗的頁面改用瀏覽器）或 browser
+FETCH_BACKEND = os.environ.get("FETCH_BACKEND", "http")
 
-        # 開啟試算表
-        spreadsheet = client.open_by_key(GOOGLE_SHEETS_ID)
-        worksheet = spreadsheet.sheet1  # 使用第一個工作表
+# Email 設定 (從環境變數讀取)
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SENDER_EMAIL = os.environ.get("SENDER_EMAIL", "")
+SENDER_PASSWORD = os.environ.get("SENDER_PASSWORD", "")  # Gmail 應用程式密碼
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
 
-        # 讀取所有資料（假設 Email 在第一欄，第一列是標題）
-        all_values = worksheet.get_all_values()
+# 同時使用的 SMTP 連線數與每分鐘寄送上限
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "2"))
+SMTP_RATE_PER_MINUTE = int(os.environ.get("SMTP_RATE_PER_MINUTE", "60"))
 
-        if len(all_values) > 1:  # 有資料（除了標題）
-            for row in all_values[1:]:  # 跳過標題列
-                if row and row[0]:  # 確保有 Email
-                    email = row[0].strip()
-                    if '@' in email:  # 簡單驗證是否為 Email
-                        subscribers.append(email)
+# Google Sheets 設定
+GOOGLE_SHEETS_ID = os.environ.get("GOOGLE_SHEETS_ID", "")  # Google Sheets 的 ID
+GOOGLE_CREDENTIALS_JSON = os.environ.get("GOOGLE_CREDENTIALS_JSON", "")  # Service Account JSON
 
-        print(f"從 Google Sheets 讀取到 {len(subscribers)} 位訂閱者")
+# 向下相容：如果有設定 RECIPIENT_EMAIL，也加入訂閱者名單
+RECIPIENT_EMAIL = os.environ.get("RECIPIENT_EMAIL", "")
 
-    except ImportError:
-        print("警告: 未安裝 gspread 或 google-auth，無法讀取 Google Sheets")
-    except Exception as e:
-        print(f"讀取 Google Sheets 時發生錯誤: {e}")
 
-    return subscribers
+@lru_cache(maxsize=None)
+def get_subscriber_directory() -> SubscriberDirectory:
+    """訂閱者名單（同一次執行共用，Google Sheets 最多讀取一次）"""
+    source = None
+    if GOOGLE_SHEETS_ID and GOOGLE_CREDENTIALS_JSON:
+        source = GoogleSheetsSource(GOOGLE_SHEETS_ID, GOOGLE_CREDENTIALS_JSON)
+    # 加入環境變數中的收件人（向下相容）
+    return SubscriberDirectory(source, extra_recipients=[RECIPIENT_EMAIL])
 
 
 def get_all_subscribers() -> list:
     """取得所有訂閱者（Google Sheets + 環境變數）"""
-    subscribers = set()  # 使用 set 避免重複
+    return get_subscriber_directory().subscribers()
 
-    # 從 Google Sheets 讀取
-    sheets_subscribers = get_subscribers_from_google_sheets()
-    subscribers.update(sheets_subscribers)
 
-    # 加入環境變數中的收件人（向下相容）
-    if RECIPIENT_EMAIL:
-        subscribers.add(RECIPIENT_EMAIL)
-
-    return list(subscribers)
+async def scrape_books_from_page(page) -> list:
+    """從當前頁面抓取書籍資料（單次 page.evaluate 取得所有產品卡片）"""
+    return await extract_product_cards(page)
 
 
-async def get_total_pages(page) -> int:
-    """取得總頁數"""
+async def scrape_pages_http(should_stop=None, journal=None) -> dict:
+    """以 HTTP 抓取所有分類頁面，回傳 {分類名稱: {頁碼: 書籍列表}}（解析失敗的頁面為 None）"""
+    print(f"正在以 HTTP 抓取 {len(LISTING_CATEGORIES)} 個分類頁面...")
+    backend = HttpListingBackend(HttpConnectionPool(max_per_host=CRAWL_MAX_CONCURRENCY))
+    scheduler = CrawlScheduler(backend, LISTING_CATEGORIES, journal=journal)
     try:
-        pagination = await page.query_selector_all('.pagination button, .pagination a')
-        max_page = 1
-        for btn in pagination:
-            text = await btn.inner_text()
-            if text.isdigit():
-                max_page = max(max_page, int(text))
-        return max_page
-    except Exception:
-        return 1
+        results = await scheduler.run(should_stop)
+    finally:
+        backend.close()
+    print(scheduler.summary())
+    return results
+
+
+def format_extract_summary(extract_times: dict, page_results: dict) -> str:
+    """每頁擷取時間，並與舊版逐欄位查詢的瀏覽器往返次數比較"""
+    if not extract_times:
+        return "卡片擷取: 無紀錄"
+    average_ms = sum(extract_times.values()) / len(extract_times) * 1000
+    cards = sum(len(page_results.get(n) or []) for n in extract_times)
+    # 舊版每張卡片 query_selector ×5 加上 inner_text / get_attribute ×5
+    legacy_calls = len(extract_times) + cards * LEGACY_CALLS_PER_CARD
+    return (f"卡片擷取: {len(extract_times)} 頁，平均 {average_ms:.0f} ms/頁，"
+            f"共 {len(extract_times)} 次 evaluate（舊版逐欄位查詢約 {legacy_calls} 次往返）")
+
+
+def make_incremental_stop(known_ids: set, stop_after: int):
+    """增量模式的停止條件：從第 1 頁起連續 stop_after 頁都只有已知商品"""
+    def should_stop(page_results: dict) -> bool:
+        streak = 0
+        for page_number in sorted(page_results):
+            books = page_results[page_number]
+            if books and all(parse_product_id(book['url']) in known_ids for book in books):
+                streak += 1
+                if streak >= stop_after:
+                    return True
+            else:
+                streak = 0
+        return False
+    return should_stop
 
 
-async def scrape_books_from_page(page) -> list:
-    """從當前頁面抓取書籍資料"""
-    books = []
+def is_full_crawl_due(catalog: Catalog) -> bool:
+    """是否需要完整爬取（未設定排序參數、首次執行、FULL_CRAWL=1，或距上次完整爬取超過設定天數）
 
-    await page.wait_for_selector('.product-card, [class*="product"]', timeout=15000)
-    await asyncio.sleep(2)
+    網站預設排序不保證新書在前，沒有 LISTING_SORT_QUERY 時增量模式可能漏掉後面頁面的新書。
+    """
+    if not LISTING_SORT_QUERY or FULL_CRAWL or catalog.count() == 0:
+        return True
+    last_full = catalog.last_crawl('checker-full')
+    if not last_full:
+        return True
+    return datetime.now() - datetime.fromisoformat(last_full) >= timedelta(days=FULL_CRAWL_INTERVAL_DAYS)
 
-    product_cards = await page.query_selector_all('.product-card')
 
-    for card in product_cards:
-        try:
-            # 書名
-            name_el = await card.query_selector('.product-name')
-            name = await name_el.inner_text() if name_el else ""
-
-            # 作者
-            author_el = await card.query_selector('.product-author')
-            author = await author_el.inner_text() if author_el else ""
-
-            # 售價
-            price_el = await card.query_selector('.slider-price')
-            price = await price_el.inner_text() if price_el else ""
-            price = price.replace('$', '').replace(',', '').strip() if price else ""
-
-            # 連結
-            link_el = await card.query_selector('a')
-            link = await link_el.get_attribute('href') if link_el else ""
-            if link and not link.startswith('http'):
-                link = f"https://www.eslite.com{link}"
-
-            # 圖片
-            img_el = await card.query_selector('img')
-            img_src = await img_el.get_attribute('src') if img_el else ""
-
-            if name:
-                books.append({
-                    'name': name.strip(),
-                    'author': author.strip(),
-                    'price': price,
-                    'link': link,
-                    'image': img_src
-                })
-        except Exception as e:
-            continue
+async def scrape_all_books(should_stop=None, context=None, journal=None) -> list:
+    """抓取所有分類的書籍（HTTP 模式優先，解析失敗的頁面才啟動瀏覽器）
+
+    傳入 should_stop 時為增量模式，各分類條件成立後不再抓取後面的頁面。
+    跨分類重複的商品只保留一筆，並記錄來源分類。
+    context 為常駐模式已啟動的瀏覽器 context。
+    journal（CrawlJournal）記錄每頁結果，已完成的頁面不再抓取；瀏覽器爬取失敗時
+    保留已取得的頁面，缺少的頁面列在日誌摘要中。
+    """
+    results = {name: {} for name, _ in LISTING_CATEGORIES}
+    if FETCH_BACKEND == "http":
+        results = await scrape_pages_http(should_stop, journal)
+
+    category_books = {}
+    for name, url in LISTING_CATEGORIES:
+        page_results = results[name]
+        if page_results and all(books is not None for books in page_results.values()):
+            print(f"[{name}] HTTP 模式已取得所需頁面，未啟動瀏覽器")
+        else:
+            try:
+                await scrape_pages_with_browser(page_results, should_stop, url, context, journal)
+            except Exception as e:
+                print(f"[{name}] 瀏覽器爬取失敗: {e}")
+                if journal is not None and not page_results:
+                    journal.record_abort(url, 1)
+
+        category_books[name] = []
+        for page_number in sorted(page_results):
+            category_books[name].extend(page_results[page_number] or [])
+
+    all_books, duplicates = merge_category_books(category_books, LISTING_CATEGORIES)
+    if duplicates:
+        print(f"跨分類重複 {duplicates} 本，已合併")
+    if journal is not None:
+        print(journal.summary({url: name for name, url in LISTING_CATEGORIES}))
+    return all_books
 
-    return books
 
+async def scrape_pages_with_browser(page_results: dict, should_stop=None, category_url: str = None,
+                                    context=None, journal=None):
+    """以瀏覽器抓取一個分類的書籍（預設為第一個分類），結果寫入 page_results
 
-async def scrape_all_books() -> list:
-    """抓取所有書籍"""
-    all_books = []
+    page_results 已有 HTTP 結果時只補抓其中為 None 的頁面，否則抓取整個分類
+    （增量模式下 should_stop 成立即停止）。
+    傳入 context（常駐模式已啟動的瀏覽器）時直接開新分頁，否則啟動新的瀏覽器。
+    """
+    category_url = category_url or LISTING_CATEGORIES[0][1]
+    if context is not None:
+        page = await context.new_page()
+        try:
+            await scrape_pages_with_page(page, page_results, should_stop, category_url, journal)
+        finally:
+            await page.close()
+        return
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
         context = await browser.new_context(
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         )
+        # 攔截圖片、字型與追蹤腳本
+        resource_policy = await ResourcePolicy().install(context)
         page = await context.new_page()
+        try:
+            await scrape_pages_with_page(page, page_results, should_stop, category_url, journal)
+        finally:
+            await browser.close()
 
-        print(f"正在載入第一頁...")
-        await page.goto(PET_CATEGORY_URL, wait_until='domcontentloaded', timeout=60000)
-        await asyncio.sleep(3)
-
-        max_pages = await get_total_pages(page)
-        print(f"共 {max_pages} 頁")
-
-        current_page = 1
-        while current_page <= max_pages:
-            if current_page > 1:
-                url = f"{PET_CATEGORY_URL}?page={current_page}"
-                print(f"正在抓取第 {current_page}/{max_pages} 頁...")
-                await page.goto(url, wait_until='domcontentloaded', timeout=60000)
-                await asyncio.sleep(2)
-
-            books = await scrape_books_from_page(page)
-            all_books.extend(books)
-            print(f"  已收集 {len(books)} 本，累計 {len(all_books)} 本")
-
-            current_page += 1
-
-        await browser.close()
-
-    return all_books
-
-
-def load_previous_books() -> dict:
-    """載入上次的書籍資料"""
-    if Path(DATA_FILE).exists():
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {'books': [], 'last_check': None}
-
-
-def save_current_books(books: list):
-    """儲存當前書籍資料"""
-    data = {
-        'books': books,
-        'last_check': datetime.now().isoformat()
-    }
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(resource_policy.summary())
 
 
-def find_new_books(current_books: list, previous_books: list) -> list:
-    """找出新書"""
-    previous_names = {book['name'] for book in previous_books}
-    new_books = [book for book in current_books if book['name'] not in previous_names]
-    return new_books
+async def load_listing_page(page, url: str) -> float:
+    """載入分類頁面並等待產品卡片，回傳等待秒數（伺服器回應 429 / 503 時拋出 FetchError）"""
+    response = await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+    if response is not None and response.status in THROTTLE_STATUSES:
+        raise FetchError(url, response.status, parse_retry_after(response.headers.get('retry-after')))
+    return await wait_for_product_grid(page)
 
 
-def send_email_to_subscriber(new_books: list, recipient_email: str) -> bool:
-    """發送新書通知 Email 給單一訂閱者"""
-    # 建立郵件
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = f'📚 誠品寵物書籍新書通知 - {len(new_books)} 本新書上架！'
-    msg['From'] = SENDER_EMAIL
-    msg['To'] = recipient_email
+async def scrape_pages_with_page(page, page_results: dict, should_stop, category_url: str, journal=None):
+    """以單一瀏覽器分頁依序抓取分類頁面，結果寫入 page_results
 
-    # 純文字版本
-    text_content = f"誠品寵物書籍有 {len(new_books)} 本新書上架！\n\n"
-    for book in new_books:
-        text_content += f"書名：{book['name']}\n"
-        text_content += f"作者：{book['author']}\n"
-        text_content += f"售價：${book['price']}\n"
-        text_content += f"連結：{book['link']}\n\n"
-
-    # HTML 版本
-    html_content = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; background: #f5f5f5; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 20px; }}
-            h1 {{ color: #E8913A; }}
-            .book-card {{ border: 1px solid #ddd; border-radius: 8px; padding: 15px; margin: 15px 0; display: flex; gap: 15px; }}
-            .book-card img {{ width: 80px; height: 120px; object-fit: cover; border-radius: 4px; }}
-            .book-info h3 {{ margin: 0 0 8px 0; color: #333; }}
-            .book-info p {{ margin: 4px 0; color: #666; font-size: 14px; }}
-            .price {{ color: #e53935; font-weight: bold; font-size: 18px; }}
-            .btn {{ display: inline-block; background: #E8913A; color: white; padding: 8px 16px; border-radius: 5px; text-decoration: none; margin-top: 10px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>📚 誠品寵物書籍新書通知</h1>
-            <p>有 <strong>{len(new_books)}</strong> 本新書上架！</p>
-    """
-
-    for book in new_books:
-        html_content += f"""
-            <div class="book-card">
-                <img src="{book['image']}" alt="{book['name']}" onerror="this.style.display='none'">
-                <div class="book-info">
-                    <h3>{book['name']}</h3>
-                    <p>作者：{book['author']}</p>
-                    <p class="price">${book['price']}</p>
-                    <a href="{book['link']}" class="btn">前往購買</a>
-                </div>
-            </div>
-        """
-
-    html_content += """
-            <p style="color: #999; font-size: 12px; margin-top: 30px;">
-                此郵件由誠品寵物書籍新書通知系統自動發送<br>
-                如需取消訂閱，請回覆此郵件
-            </p>
-        </div>
-    </body>
-    </html>
+    有 journal 時每頁結果寫入爬取日誌，日誌中已完成的頁面直接沿用；
+    載入失敗的頁面以指數退避重試，仍失敗時記錄後略過（值為 None），
+    連續 MAX_CONSECUTIVE_FAILURES 頁失敗即停止。
     """
+    wait_times = {}
+    extract_times = {}
+    fill_in = bool(page_results)
+    incremental = should_stop is not None and not fill_in
 
-    msg.attach(MIMEText(text_content, 'plain', 'utf-8'))
-    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+    async def load_and_extract(page_number, url):
+        try:
+            if page_number not in wait_times:
+                wait_times[page_number] = await load_listing_page(page, url)
+            started = time.monotonic()
+            books = await scrape_books_from_page(page)
+        except Exception:
+            # 重試時重新載入頁面
+            wait_times.pop(page_number, None)
+            raise
+        extract_times[page_number] = time.monotonic() - started
+        return books
+
+    if fill_in:
+        page_numbers = [n for n, books in page_results.items() if books is None]
+        max_pages = max(page_results)
+        print(f"以瀏覽器補抓 {len(page_numbers)} 頁: {page_numbers}")
+    else:
+        print(f"正在載入第一頁...")
+        wait_times[1] = await retry_with_backoff(
+            lambda: load_listing_page(page, category_url), "第 1 頁", retry_on=BROWSER_RETRYABLE_ERRORS)
 
-    # 發送郵件
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.sendmail(SENDER_EMAIL, recipient_email, msg.as_string())
-        return True
-    except Exception as e:
-        print(f"  ❌ 發送給 {recipient_email} 失敗: {e}")
-        return False
+        max_pages = await get_total_pages(page)
+        print(f"共 {max_pages} 頁")
+        completed = journal.completed(category_url) if journal is not None else {}
+        completed.pop(1, None)
+        if completed:
+            print(f"沿用爬取日誌中的 {len(completed)} 頁")
+            page_results.update(completed)
+        page_numbers = [n for n in range(1, max_pages + 1) if n not in completed]
+
+    collected = 0
+    failures = 0
+    for current_page in page_numbers:
+        if incremental and should_stop(page_results):
+            print(f"  連續 {INCREMENTAL_STOP_PAGES} 頁皆為已知書籍，停止抓取")
+            break
+        url = build_page_url(category_url, current_page)
+        if current_page not in wait_times:
+            print(f"正在抓取第 {current_page}/{max_pages} 頁...")
+        try:
+            books = await retry_with_backoff(
+                lambda: load_and_extract(current_page, url), f"第 {current_page} 頁",
+                retry_on=BROWSER_RETRYABLE_ERRORS)
+        except Exception as e:
+            print(f"  第 {current_page} 頁載入失敗: {e}")
+            page_results[current_page] = None
+            failures += 1
+            if journal is not None:
+                journal.record_failure(category_url, current_page, e)
+            if failures >= MAX_CONSECUTIVE_FAILURES:
+                print(f"  連續 {failures} 頁載入失敗，停止抓取")
+                if journal is not None and not fill_in and current_page < max_pages:
+                    journal.record_abort(category_url, current_page + 1)
+                break
+            continue
+        failures = 0
+        page_results[current_page] = books
+        if journal is not None:
+            journal.record_page(category_url, current_page, books)
+        collected += len(books)
+        print(f"  已收集 {len(books)} 本，累計 {collected} 本"
+              f"（等待 {wait_times[current_page]:.1f} 秒，擷取 {extract_times[current_page] * 1000:.0f} ms）")
+
+    # 原本第 1 頁固定等待 3 + 2 秒，之後每頁 2 + 2 秒
+    print(format_wait_summary(wait_times, FIXED_PAGE_DELAY))
+    print(format_extract_summary(extract_times, page_results))
+
+
+def open_catalog() -> Catalog:
+    """開啟書目資料庫；資料庫為空且有舊版 previous_books.json 時先匯入"""
+    catalog = Catalog(CATALOG_DB)
+    if catalog.count() == 0 and Path(DATA_FILE).exists():
+        imported = catalog.import_previous_books_json(DATA_FILE)
+        print(f"已從 {DATA_FILE} 匯入 {imported} 本書到 {CATALOG_DB}")
+    return catalog
+
+
+def make_mailer() -> SmtpMailer:
+    """依環境變數建立 SMTP 寄件器"""
+    return SmtpMailer(
+        SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD, SENDER_EMAIL,
+        pool_size=SMTP_POOL_SIZE, per_minute=SMTP_RATE_PER_MINUTE, starttls=SMTP_STARTTLS,
+    )
+
+
+def flush_outbox() -> bool:
+    """寄出寄件匣中待寄的信（含先前執行失敗、尚未達重試上限的收件人）"""
+    with Outbox(OUTBOX_DB) as outbox:
+        if not outbox.pending():
+            return False
+        if not all([SENDER_EMAIL, SENDER_PASSWORD]):
+            print("Email 發送設定不完整（SENDER_EMAIL 或 SENDER_PASSWORD），待寄信件保留到下次執行")
+            return False
+
+        print("\n📧 寄出寄件匣中的信件...")
+        sent, failed = deliver_pending(outbox, make_mailer())
+        counts = outbox.counts()
+
+    print(f"\n📊 發送結果: {sent}/{sent + failed} 封成功")
+    if counts['pending']:
+        print(f"   {counts['pending']} 封寄送失敗，將於下次執行重寄")
+    return sent > 0
+
+
+def categorize_new_books(new_books: list):
+    """以爬蟲的分類規則為新書加上 animal_types / topics"""
+    matcher = KeywordMatcher()
+    for book in new_books:
+        animal_types, topics = matcher.match(book)
+        book['animal_types'] = list(animal_types) if animal_types else ["通用"]
+        book['topics'] = list(topics) if topics else ["其他"]
 
 
 def send_email(new_books: list):
-    """發送新書通知 Email 給所有訂閱者"""
-    # 取得所有訂閱者
-    subscribers = get_all_subscribers()
+    """發送新書通知 Email 給所有訂閱者
 
-    if not subscribers:
+    訂閱者依試算表中的分類偏好分組，每組只篩選、產生一次信件並放入寄件匣，
+    再以共用的 SMTP 連線寄給組內所有訂閱者。
+    """
+    # 取得所有訂閱者與分類偏好
+    preferences = get_subscriber_directory().preferences()
+
+    if not preferences:
         print("沒有訂閱者，跳過發送 Email")
         print("新書清單：")
         for book in new_books:
-            print(f"  - {book['name']} ({book['author']})")
+            print(f"  - {book['title']} ({book['author']})")
         return False
 
     if not all([SENDER_EMAIL, SENDER_PASSWORD]):
         print("Email 發送設定不完整（SENDER_EMAIL 或 SENDER_PASSWORD），跳過發送")
         print("新書清單：")
         for book in new_books:
-            print(f"  - {book['name']} ({book['author']})")
+            print(f"  - {book['title']} ({book['author']})")
         return False
 
-    print(f"\n📧 準備發送 Email 給 {len(subscribers)} 位訂閱者...")
-
-    success_count = 0
-    for subscriber in subscribers:
-        if send_email_to_subscriber(new_books, subscriber):
-            print(f"  ✅ 已發送給 {subscriber}")
-            success_count += 1
-
-    print(f"\n📊 發送結果: {success_count}/{len(subscribers)} 封成功")
-    return success_count > 0
+    categorize_new_books(new_books)
+    segments = group_by_preference(preferences)
+    digests = plan_digests(new_books, segments)
+    recipient_count = sum(len(emails) for _, _, emails in digests)
+    print(f"\n📧 準備發送 Email 給 {recipient_count}/{len(preferences)} 位訂閱者"
+          f"（{len(segments)} 種分類偏好，{len(digests)} 種信件內容）...")
+    with Outbox(OUTBOX_DB) as outbox:
+        for signature, books, emails in digests:
+            label = format_preference(signature)
+            print(f"  {label or '不限分類'}: {len(books)} 本新書 → {len(emails)} 位訂閱者")
+            outbox.enqueue(*render_new_books_email(books, label), emails)
+    return flush_outbox()
 
 
-async def main():
-    print("=" * 50)
-    print("誠品寵物書籍 - 新書檢查")
-    print(f"時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 50)
+def load_check_state():
+    """讀取訂閱者與書目資料庫並決定爬取模式，回傳 (是否完整爬取, should_stop, 上次書目, 上次書籍數)
 
+    會讀取 Google Sheets 與 SQLite，由 run_check 在執行緒中執行。
+    """
     # 顯示訂閱者資訊
     subscribers = get_all_subscribers()
     print(f"訂閱者數量: {len(subscribers)}")
 
-    # 載入上次資料
-    previous_data = load_previous_books()
-    previous_books = previous_data.get('books', [])
-    last_check = previous_data.get('last_check', '從未檢查')
-    print(f"上次檢查: {last_check}")
-    print(f"上次書籍數: {len(previous_books)}")
+    # 開啟書目資料庫
+    with open_catalog() as catalog:
+        previous_count = catalog.count()
+        last_check = catalog.last_crawl() or '從未檢查'
+        print(f"上次檢查: {last_check}")
+        print(f"資料庫書籍數: {previous_count}")
+
+        # 決定完整或增量爬取
+        full_crawl = is_full_crawl_due(catalog)
+        should_stop = None
+        if full_crawl:
+            print("爬取模式: 完整" if LISTING_SORT_QUERY else "爬取模式: 完整（未設定 LISTING_SORT_QUERY，不使用增量模式）")
+            # 只有上次完整爬取時仍在架上的書才可能被判定為下架
+            previous_books = catalog.load_books(seen_since=catalog.last_crawl('checker-full'))
+        else:
+            print(f"爬取模式: 增量（連續 {INCREMENTAL_STOP_PAGES} 頁皆為已知書籍即停止）")
+            should_stop = make_incremental_stop(catalog.product_ids(), INCREMENTAL_STOP_PAGES)
+            previous_books = catalog.load_books()
+    return full_crawl, should_stop, previous_books, previous_count
 
-    # 抓取當前書籍
-    print("\n正在抓取最新書籍資料...")
-    current_books = await scrape_all_books()
-    print(f"當前書籍數: {len(current_books)}")
+
+def save_check_results(current_books, previous_books, previous_count, full_crawl) -> list:
+    """比對並寫入書目資料庫、寄出新書通知，回傳新書列表
+
+    會寫入 SQLite 並連線 SMTP，由 run_check 在執行緒中執行。
+    """
+    if not current_books:
+        print("\n未抓取到任何書籍，保留原有資料")
+        flush_outbox()
+        return []
+
+    with open_catalog() as catalog:
+        # 以商品 ID 比對差異，只儲存變動事件
+        run_at = now_iso()
+        events = diff_catalog(current_books, previous_books, detect_removed=full_crawl)
+        inserted, updated = catalog.upsert_books(current_books, run_at)
+        catalog.record_crawl('checker-full' if full_crawl else 'checker-incremental',
+                             len(current_books), run_at)
+        if previous_count:
+            catalog.record_events(events, run_at)
 
     # 比對新書
-    if previous_books:
-        new_books = find_new_books(current_books, previous_books)
+    new_books = []
+    if previous_count:
+        print(f"\n📊 書目變動: {format_event_summary(events)}")
+
+        new_books = [event['book'] for event in events_of_type(events, EVENT_ADDED)]
         print(f"\n🆕 發現 {len(new_books)} 本新書")
 
         if new_books:
             print("\n新書清單:")
             for i, book in enumerate(new_books, 1):
-                print(f"  {i}. {book['name']}")
+                print(f"  {i}. {book['title']}")
                 print(f"     作者: {book['author']}")
                 print(f"     售價: ${book['price']}")
 
@@ -365,13 +470,46 @@ async def main():
             send_email(new_books)
         else:
             print("沒有新書上架")
+            flush_outbox()
     else:
         print("\n首次執行，建立基準資料")
 
-    # 儲存當前資料
-    save_current_books(current_books)
-    print(f"\n✅ 資料已更新，共 {len(current_books)} 本書")
+    print(f"\n✅ 資料已更新，共 {len(current_books)} 本書（新增 {inserted}，更新 {updated}）")
+    return new_books
+
+
+async def run_check(context=None, resume=False) -> list:
+    """執行一次新書檢查並寄出通知，回傳新書列表
+
+    context 為常駐模式已啟動的瀏覽器 context（未傳入時需要時才啟動瀏覽器）。
+    resume 時從上次中斷的爬取日誌繼續，只抓取尚未完成的頁面。
+    讀寫資料庫、Google Sheets 與寄信在執行緒中執行，常駐模式的控制介面在檢查期間仍可回應。
+    """
+    print("=" * 50)
+    print("誠品寵物書籍 - 新書檢查")
+    print(f"時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("=" * 50)
+
+    full_crawl, should_stop, previous_books, previous_count = await asyncio.to_thread(load_check_state)
+
+    # 抓取當前書籍
+    print("\n正在抓取最新書籍資料...")
+    with CrawlJournal.open(CHECK_JOURNAL_FILE, resume) as journal:
+        current_books = await scrape_all_books(should_stop, context, journal)
+    print(f"當前書籍數: {len(current_books)}")
+
+    # 有頁面缺少時不判定下架，也不算完成一次完整爬取
+    if full_crawl and not journal.complete:
+        print("部分頁面未完成，本次不判定下架書籍")
+        full_crawl = False
+
+    return await asyncio.to_thread(
+        save_check_results, current_books, previous_books, previous_count, full_crawl)
+
+
+async def main(resume=False):
+    await run_check(resume=resume)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(resume='--resume' in sys.argv[1:]))
@@ -0,0 +1,217 @@
+"""
+誠品寵物書籍 - 自適應並行控制
+依觀察到的回應延遲與錯誤 / 429 比例，以 AIMD（加法增加、乘法減少）調整同時抓取的頁數；
+失敗的頁面以帶抖動的指數退避重試，每次調整與重試都寫入執行紀錄
+"""
+
+import asyncio
+import http.client
+import os
+import random
+import time
+
+# 同時抓取頁數的上下限與起始值，以及可接受的回應延遲（秒）
+CRAWL_MIN_CONCURRENCY = int(os.environ.get("CRAWL_MIN_CONCURRENCY", "1"))
+CRAWL_MAX_CONCURRENCY = int(os.environ.get("CRAWL_MAX_CONCURRENCY", "12"))
+CRAWL_LATENCY_TARGET = float(os.environ.get("CRAWL_LATENCY_TARGET", "3"))
+
+# 一個調整週期內錯誤比例超過此值就減少並行數
+CRAWL_ERROR_THRESHOLD = float(os.environ.get("CRAWL_ERROR_THRESHOLD", "0.1"))
+
+# 每頁失敗後的重試次數，以及指數退避的起始與最長秒數
+PAGE_RETRIES = int(os.environ.get("PAGE_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "30"))
+
+# 表示伺服器要求降速的狀態碼
+THROTTLE_STATUSES = {429, 503}
+
+
+class FetchError(Exception):
+    """頁面請求失敗：status 為 None 表示連線錯誤或逾時，retry_after 為伺服器要求的等待秒數"""
+
+    def __init__(self, url, status=None, retry_after=None, reason=""):
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+        super().__init__(f"HTTP {status}" if status else (reason or "連線失敗"))
+
+    @property
+    def throttled(self):
+        return self.status in THROTTLE_STATUSES
+
+    @property
+    def retryable(self):
+        """連線錯誤、429 與 5xx 可以重試，其他 4xx 重試也不會成功"""
+        return self.status is None or self.throttled or self.status >= 500
+
+
+def parse_retry_after(value):
+    """Retry-After 標頭的秒數（只支援秒數格式，無法解析時為 None）"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# retry_with_backoff 預設重試的例外：請求失敗與網路錯誤；其他例外（程式錯誤、解析錯誤）直接拋出
+RETRYABLE_ERRORS = (FetchError, OSError, http.client.HTTPException)
+
+
+def is_retryable(error):
+    return error.retryable if isinstance(error, FetchError) else True
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY, retry_after=None, rng=random):
+    """第 attempt 次（從 0 起算）重試前的等待秒數
+
+    指數退避 base × 2^attempt（上限 cap），取一半固定、一半隨機，避免多個頁面同時重試；
+    伺服器有給 Retry-After 時至少等待該秒數。
+    """
+    delay = min(cap, base * 2 ** attempt)
+    delay = delay / 2 + rng.uniform(0, delay / 2)
+    if retry_after is not None:
+        delay = max(delay, min(cap, retry_after))
+    return delay
+
+
+class AdaptiveConcurrency:
+    """以 AIMD 調整同時進行的請求數
+
+    每個請求前 acquire()、結束後 release(started, error)。每累積 limit 筆（至少 min_samples 筆）結果評估一次：
+    錯誤比例超過 error_threshold，或成功請求的延遲中位數超過 latency_target 時，
+    並行數乘以 decrease；否則加 1。收到 429 / 503 時立即減少，
+    但減少之前就已送出的請求再收到 429 不會重複減少。
+    每次調整記錄在 decisions 並印出。
+    """
+
+    def __init__(self, initial=4, minimum=CRAWL_MIN_CONCURRENCY, maximum=CRAWL_MAX_CONCURRENCY,
+                 latency_target=CRAWL_LATENCY_TARGET, error_threshold=CRAWL_ERROR_THRESHOLD,
+                 decrease=0.5, min_samples=4, label="並行數"):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.initial = self.limit = min(self.maximum, max(self.minimum, initial))
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.decrease = decrease
+        self.min_samples = min_samples
+        self.label = label
+        self.in_flight = 0
+        self.peak = self.limit
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.retries = 0
+        self.decisions = []
+        self._window = []
+        self._created = time.monotonic()
+        self._last_decrease = self._created
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """等到進行中的請求數低於目前的並行數，回傳開始時間（交給 release）"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def cancel(self):
+        """歸還 acquire() 取得但未送出請求的名額（不列入統計）"""
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def release(self, started, error=None):
+        """回報一個請求的結果（error 為 None 表示成功），並視情況調整並行數"""
+        latency = time.monotonic() - started
+        throttled = isinstance(error, FetchError) and error.throttled
+        async with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+            if throttled:
+                self.throttled += 1
+            elif error is not None:
+                self.errors += 1
+
+            if throttled:
+                if started >= self._last_decrease:
+                    self._set_limit(int(self.limit * self.decrease), f"收到 HTTP {error.status}")
+            elif started >= self._last_decrease:
+                # 上次減少之前送出的請求反映的是舊的並行數，不列入評估
+                self._window.append((latency, error is None))
+                if len(self._window) >= max(self.limit, self.min_samples):
+                    self._evaluate()
+            self._condition.notify_all()
+
+    def _evaluate(self):
+        window, self._window = self._window, []
+        latencies = sorted(latency for latency, ok in window if ok)
+        error_rate = 1 - len(latencies) / len(window)
+        median = latencies[len(latencies) // 2] if latencies else None
+
+        if error_rate > self.error_threshold:
+            self._set_limit(int(self.limit * self.decrease),
+                            f"錯誤比例 {error_rate:.0%} > {self.error_threshold:.0%}")
+        elif median is not None and median > self.latency_target:
+            self._set_limit(int(self.limit * self.decrease),
+                            f"延遲中位數 {median:.2f} 秒 > {self.latency_target:g} 秒")
+        elif median is not None:
+            self._set_limit(self.limit + 1, f"延遲中位數 {median:.2f} 秒，錯誤比例 {error_rate:.0%}")
+
+    def _set_limit(self, limit, reason):
+        limit = min(self.maximum, max(self.minimum, limit))
+        if limit == self.limit:
+            return
+        elapsed = time.monotonic() - self._created
+        if limit < self.limit:
+            self._last_decrease = time.monotonic()
+            self._window = []
+        self.decisions.append((round(elapsed, 2), self.limit, limit, reason))
+        print(f"  [{elapsed:6.1f}s] {self.label} {self.limit} → {limit}：{reason}")
+        self.limit = limit
+        self.peak = max(self.peak, limit)
+
+    def summary(self):
+        return (f"自適應{self.label}: {self.requests} 次請求，{self.initial} → {self.limit}"
+                f"（最高 {self.peak}，調整 {len(self.decisions)} 次），重試 {self.retries} 次，"
+                f"錯誤 {self.errors} 次，429/503 {self.throttled} 次")
+
+
+async def retry_with_backoff(attempt, label, retries=PAGE_RETRIES, controller=None, before_attempt=None,
+                             retry_on=RETRYABLE_ERRORS):
+    """執行 attempt()，retry_on 中的例外以帶抖動的指數退避重試，最後一次仍失敗就拋出該例外
+
+    其他例外不重試，直接拋出（仍會回報給 controller）。
+
+    有 controller（AdaptiveConcurrency）時每次嘗試佔用一個並行名額並回報結果；
+    before_attempt 為每次嘗試前要等待的協程函式（例如主機速率限制），不計入延遲。
+    先取得並行名額再等待 before_attempt，速率限制的額度在送出前才取用，
+    不會在等待名額時累積，名額釋出後再一起送出。
+    """
+    for attempt_number in range(retries + 1):
+        if controller is not None:
+            await controller.acquire()
+        try:
+            if before_attempt is not None:
+                await before_attempt()
+        except BaseException:
+            if controller is not None:
+                await controller.cancel()
+            raise
+        started = time.monotonic()
+        try:
+            result = await attempt()
+        except Exception as e:
+            if controller is not None:
+                await controller.release(started, e)
+            if attempt_number >= retries or not isinstance(e, retry_on) or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt_number, retry_after=getattr(e, 'retry_after', None))
+            if controller is not None:
+                controller.retries += 1
+            print(f"  {label} 失敗（{e}），{delay:.1f} 秒後重試（{attempt_number + 1}/{retries}）")
+            await asyncio.sleep(delay)
+            continue
+        if controller is not None:
+            await controller.release(started)
+        return result
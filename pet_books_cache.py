@@ -0,0 +1,107 @@
+"""
+誠品寵物書籍 - 分類結果快取
+以書名 + 作者文字為鍵，將分類結果存到本機 JSON，分類規則變更時自動失效
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+CATEGORY_CACHE_FILE = "category_cache.json"
+
+
+def taxonomy_hash(*taxonomies) -> str:
+    """計算分類規則（含關鍵字順序）的雜湊值"""
+    payload = json.dumps(taxonomies, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def text_key(text: str) -> str:
+    """分類文字的快取鍵"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class CategoryCache:
+    """分類結果的磁碟快取
+
+    每筆資料存 [animal_types, topics, combined_category]。檔案中記錄產生時的
+    分類規則雜湊值，載入時若與目前規則不同，舊資料全部捨棄。
+    完整爬取後以 retain() 移除已不在書目中的書籍，快取大小與目前書目相同。
+    """
+
+    def __init__(self, path=CATEGORY_CACHE_FILE, version=""):
+        self.path = Path(path)
+        self.version = version
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path=CATEGORY_CACHE_FILE, version=""):
+        """載入快取檔案；檔案不存在、損毀或規則版本不同時從空快取開始"""
+        cache = cls(path, version)
+        if not cache.path.exists():
+            return cache
+        try:
+            with open(cache.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"分類快取無法讀取，將重新建立: {e}")
+            return cache
+
+        entries = data.get('entries', {})
+        if data.get('taxonomy_hash') == version:
+            cache.entries = entries
+        else:
+            cache.evicted = len(entries)
+            cache._dirty = True
+            print(f"分類規則已變更，清除 {cache.evicted} 筆舊快取")
+        return cache
+
+    def get(self, text):
+        """取得快取的 (animal_types, topics, combined_category)，未命中回傳 None"""
+        entry = self.entries.get(text_key(text))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, text, animal_types, topics, combined_category):
+        self.entries[text_key(text)] = [list(animal_types), list(topics), combined_category]
+        self._dirty = True
+
+    def retain(self, texts):
+        """只保留 texts 的快取（已下架書籍的分類不再保存），回傳移除的筆數"""
+        keep = {text_key(text) for text in texts}
+        stale = [key for key in self.entries if key not in keep]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def save(self):
+        """寫回磁碟（先寫暫存檔再取代，避免中斷時留下損毀的檔案）"""
+        if not self._dirty:
+            return
+        data = {'taxonomy_hash': self.version, 'entries': self.entries}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def summary(self):
+        """本次執行的命中率"""
+        total = self.hits + self.misses
+        return (f"分類快取: 命中 {self.hits}/{total} ({self.hit_rate:.1%})，"
+                f"新分類 {self.misses} 本，快取共 {len(self.entries)} 筆")
@@ -0,0 +1,288 @@
+"""
+誠品寵物書籍 - 本機 SQLite 書目資料庫
+以商品 ID 為主鍵，每次爬取時 upsert，記錄首次與最後出現時間
+取代時間戳記 CSV 檔案與 previous_books.json 作為書目的主要來源
+"""
+
+import json
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+CATALOG_DB = "pet_books.db"
+
+PRODUCT_ID_PATTERN = re.compile(r"/product/([^/?#]+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    product_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL DEFAULT '',
+    price TEXT NOT NULL DEFAULT '',
+    price_value INTEGER,
+    original_price TEXT NOT NULL DEFAULT '',
+    discount TEXT NOT NULL DEFAULT '',
+    image TEXT NOT NULL DEFAULT '',
+    animal_type_str TEXT,
+    topic_str TEXT,
+    combined_category TEXT,
+    source_category TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_books_price ON books(price_value);
+CREATE INDEX IF NOT EXISTS idx_books_first_seen ON books(first_seen);
+CREATE INDEX IF NOT EXISTS idx_books_last_seen ON books(last_seen);
+
+CREATE TABLE IF NOT EXISTS book_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    field TEXT,
+    old_value TEXT,
+    new_value TEXT,
+    occurred_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_occurred_at ON book_events(occurred_at);
+CREATE INDEX IF NOT EXISTS idx_events_product ON book_events(product_id);
+
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL,
+    finished_at TEXT NOT NULL,
+    book_count INTEGER NOT NULL
+);
+"""
+
+BOOK_COLUMNS = (
+    "product_id, url, title, author, price, original_price, discount, image, "
+    "animal_type_str, topic_str, combined_category, source_category, first_seen, last_seen"
+)
+
+# 舊版資料庫缺少的欄位（開啟時補上）
+ADDED_BOOK_COLUMNS = {
+    'source_category': "TEXT",
+}
+
+# 舊版資料庫中已不使用的資料表（開啟時刪除；分類篩選改由記憶體中的 BookIndex / BookFrame 處理）
+OBSOLETE_TABLES = ('book_animal_types', 'book_topics')
+
+
+def parse_product_id(url):
+    """從 /product/<id> 網址取出商品 ID，無法解析時以完整網址代替"""
+    match = PRODUCT_ID_PATTERN.search(url or "")
+    return match.group(1) if match else (url or "")
+
+
+def parse_price(price):
+    """將售價文字轉為整數（無法解析時回傳 None）"""
+    digits = re.sub(r"[^\d]", "", str(price or ""))
+    return int(digits) if digits else None
+
+
+def now_iso():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def _split(value):
+    return [part for part in (value or "").split(", ") if part]
+
+
+class Catalog:
+    """SQLite 書目資料庫
+
+    書籍欄位使用爬蟲的格式（title / url / animal_types ...），
+    也接受新書通知腳本的 name / link 欄位。
+    """
+
+    def __init__(self, path=CATALOG_DB):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self):
+        """補上舊版資料庫缺少的欄位，刪除已不使用的資料表"""
+        existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(books)")}
+        with self.conn:
+            for column, column_type in ADDED_BOOK_COLUMNS.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE books ADD COLUMN {column} {column_type}")
+            for table in OBSOLETE_TABLES:
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # ===== 寫入 =====
+
+    def upsert_books(self, books, seen_at=None):
+        """新增或更新書籍，回傳 (新增數, 更新數)
+
+        沒有分類欄位的書籍（例如新書通知腳本抓取的資料）不會覆蓋既有分類；
+        有 discount 欄位時一律寫入（空字串表示折扣已結束），與 diff_catalog 的比對一致。
+        """
+        seen_at = seen_at or now_iso()
+        inserted = updated = 0
+        with self.conn:
+            for book in books:
+                url = book.get('url') or book.get('link') or ''
+                title = book.get('title') or book.get('name') or ''
+                if not url or not title:
+                    continue
+                product_id = parse_product_id(url)
+                has_categories = 'animal_types' in book
+                row = {
+                    'product_id': product_id,
+                    'url': url,
+                    'title': title,
+                    'author': book.get('author') or '',
+                    'price': str(book.get('price') or ''),
+                    'price_value': parse_price(book.get('price')),
+                    'original_price': str(book.get('originalPrice') or ''),
+                    'discount': (book.get('discount') or '') if 'discount' in book else None,
+                    'image': book.get('image') or '',
+                    'animal_type_str': book.get('animal_type_str') if has_categories else None,
+                    'topic_str': book.get('topic_str') if has_categories else None,
+                    'combined_category': book.get('combined_category') if has_categories else None,
+                    'source_category': book.get('source_category') or None,
+                    'seen_at': seen_at,
+                }
+                exists = self.conn.execute(
+                    "SELECT 1 FROM books WHERE product_id = ?", (product_id,)
+                ).fetchone()
+                if exists:
+                    self.conn.execute("""
+                        UPDATE books SET url = :url, title = :title, author = :author,
+                            price = :price, price_value = :price_value,
+                            original_price = CASE WHEN :original_price != '' THEN :original_price ELSE original_price END,
+                            discount = COALESCE(:discount, discount),
+                            image = :image,
+                            animal_type_str = COALESCE(:animal_type_str, animal_type_str),
+                            topic_str = COALESCE(:topic_str, topic_str),
+                            combined_category = COALESCE(:combined_category, combined_category),
+                            source_category = COALESCE(:source_category, source_category),
+                            first_seen = MIN(first_seen, :seen_at),
+                            last_seen = MAX(last_seen, :seen_at)
+                        WHERE product_id = :product_id
+                    """, row)
+                    updated += 1
+                else:
+                    self.conn.execute("""
+                        INSERT INTO books (product_id, url, title, author, price, price_value,
+                            original_price, discount, image, animal_type_str, topic_str,
+                            combined_category, source_category, first_seen, last_seen)
+                        VALUES (:product_id, :url, :title, :author, :price, :price_value,
+                            :original_price, COALESCE(:discount, ''), :image, :animal_type_str, :topic_str,
+                            :combined_category, :source_category, :seen_at, :seen_at)
+                    """, row)
+                    inserted += 1
+        return inserted, updated
+
+    def record_crawl(self, source, book_count, finished_at=None):
+        """記錄一次爬取"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO crawl_runs (source, finished_at, book_count) VALUES (?, ?, ?)",
+                (source, finished_at or now_iso(), book_count))
+
+    def record_events(self, events, occurred_at=None):
+        """記錄書目變動事件（只存差異，不存整份書目）"""
+        occurred_at = occurred_at or now_iso()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO book_events (product_id, event_type, field, old_value, new_value, occurred_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(event['product_id'], event['type'], event.get('field'),
+                  event.get('old'), event.get('new'), occurred_at) for event in events])
+
+    # ===== 讀取 =====
+
+    def _row_to_book(self, row):
+        book = {
+            'title': row['title'],
+            'author': row['author'],
+            'price': row['price'],
+            'originalPrice': row['original_price'],
+            'discount': row['discount'],
+            'url': row['url'],
+            'image': row['image'],
+            'first_seen': row['first_seen'],
+            'last_seen': row['last_seen'],
+        }
+        if row['source_category']:
+            book['source_category'] = row['source_category']
+        if row['animal_type_str'] is not None:
+            book['animal_type_str'] = row['animal_type_str']
+            book['topic_str'] = row['topic_str'] or ''
+            book['combined_category'] = row['combined_category'] or ''
+            book['animal_types'] = _split(row['animal_type_str'])
+            book['topics'] = _split(row['topic_str'])
+            # 保留舊欄位供相容性
+            book['categories'] = book['topics']
+            book['category_str'] = book['topic_str']
+        return book
+
+    def _query(self, sql, params=()):
+        return [self._row_to_book(row) for row in self.conn.execute(sql, params)]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    def load_books(self, seen_since=None):
+        """讀取書籍（可只取 seen_since 之後仍出現的書），依首次出現時間排序"""
+        if seen_since:
+            return self._query(
+                f"SELECT {BOOK_COLUMNS} FROM books WHERE last_seen >= ? ORDER BY first_seen, rowid",
+                (seen_since,))
+        return self._query(f"SELECT {BOOK_COLUMNS} FROM books ORDER BY first_seen, rowid")
+
+    def product_ids(self):
+        """所有商品 ID"""
+        return {row[0] for row in self.conn.execute("SELECT product_id FROM books")}
+
+    def events_since(self, since, event_type=None, product_id=None):
+        """since 之後的變動事件（可只取某種事件或某本書），依發生順序排列，附上目前的書名"""
+        sql = ("SELECT e.product_id, e.event_type, e.field, e.old_value, e.new_value, e.occurred_at,"
+               " COALESCE(b.title, '') AS title"
+               " FROM book_events e LEFT JOIN books b ON b.product_id = e.product_id"
+               " WHERE e.occurred_at >= ?")
+        params = [since]
+        if event_type:
+            sql += " AND e.event_type = ?"
+            params.append(event_type)
+        if product_id:
+            sql += " AND e.product_id = ?"
+            params.append(product_id)
+        return [dict(row) for row in self.conn.execute(sql + " ORDER BY e.id", params)]
+
+    def last_crawl(self, source=None):
+        """最近一次爬取的完成時間"""
+        if source:
+            row = self.conn.execute(
+                "SELECT MAX(finished_at) FROM crawl_runs WHERE source = ?", (source,)).fetchone()
+        else:
+            row = self.conn.execute("SELECT MAX(finished_at) FROM crawl_runs").fetchone()
+        return row[0]
+
+    # ===== 舊資料匯入 =====
+
+    def import_previous_books_json(self, path):
+        """匯入舊版 previous_books.json（name / link 欄位），回傳匯入數量"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        books = data.get('books', [])
+        seen_at = data.get('last_check') or now_iso()
+        inserted, _ = self.upsert_books(books, seen_at)
+        if books:
+            self.record_crawl('import', len(books), seen_at)
+        return inserted
@@ -0,0 +1,334 @@
+"""
+誠品書籍爬蟲共用工具
+分頁網址、總頁數判斷、頁面就緒等待、產品卡片擷取、資源攔截與多分頁並行抓取
+"""
+
+import asyncio
+import os
+import time
+from urllib.parse import urlparse
+
+from playwright.async_api import Error as PlaywrightError
+
+from pet_books_adaptive import RETRYABLE_ERRORS
+
+BASE_URL = "https://www.eslite.com"
+
+# 瀏覽器載入頁面時可重試的例外（另加上 Playwright 的逾時與連線錯誤）
+BROWSER_RETRYABLE_ERRORS = (*RETRYABLE_ERRORS, PlaywrightError)
+
+# 產品卡片選擇器（分類頁面兩種版型）
+PRODUCT_CARD_SELECTOR = 'a.product-item[href*="/product/"], .product-card'
+
+# 等待產品卡片的上限秒數，以及卡片數量維持不變多久視為載入完成
+PAGE_READY_TIMEOUT = float(os.environ.get("PAGE_READY_TIMEOUT", "10"))
+PAGE_READY_SETTLE = float(os.environ.get("PAGE_READY_SETTLE", "0.5"))
+
+# 逐頁爬取時連續幾頁載入失敗就停止（通常是瀏覽器已當掉），失敗的頁面記錄在爬取日誌中
+MAX_CONSECUTIVE_FAILURES = int(os.environ.get("MAX_CONSECUTIVE_FAILURES", "2"))
+
+# 在頁面中一次抓取所有產品卡片的腳本
+EXTRACT_BOOKS_SCRIPT = """
+    (selector) => {
+        const books = [];
+
+        // 找所有產品卡片（巢狀的卡片只取最外層）
+        const productCards = Array.from(document.querySelectorAll(selector)).filter(
+            card => !(card.parentElement && card.parentElement.closest(selector))
+        );
+
+        productCards.forEach(card => {
+            try {
+                let href = '';
+                if (card.matches('a')) {
+                    href = card.href || '';
+                } else {
+                    const linkEl = card.querySelector('a[href*="/product/"]');
+                    href = linkEl ? linkEl.href : '';
+                }
+                if (!href.includes('/product/')) return;
+
+                // 取得書名 - 使用 product-name class
+                let title = '';
+                const nameEl = card.querySelector('.product-name');
+                if (nameEl) {
+                    title = nameEl.textContent.trim();
+                }
+                // 備用：從 title 屬性取得
+                if (!title) {
+                    const imgWrap = card.querySelector('.product-image');
+                    if (imgWrap) {
+                        title = imgWrap.getAttribute('title') || '';
+                    }
+                }
+
+                // 取得作者 - 使用 product-author class
+                let author = '';
+                const authorEl = card.querySelector('.product-author');
+                if (authorEl) {
+                    author = authorEl.textContent.trim();
+                }
+
+                // 取得價格 - 使用 slider-price class (折後價)
+                let price = '';
+                let originalPrice = '';
+                let discount = '';
+
+                const priceEl = card.querySelector('.slider-price');
+                if (priceEl) {
+                    price = priceEl.textContent.trim().replace(/[$,]/g, '');
+                }
+
+                // 取得折扣
+                const discountEl = card.querySelector('.discount');
+                if (discountEl) {
+                    discount = discountEl.textContent.trim() + '折';
+                }
+
+                // 取得原價 (從 pre-price 屬性)
+                const priceWrap = card.querySelector('[pre-price]');
+                if (priceWrap) {
+                    originalPrice = priceWrap.getAttribute('pre-price') || '';
+                }
+
+                // 取得圖片
+                let image = '';
+                const imgEl = card.querySelector('img');
+                if (imgEl) {
+                    image = imgEl.src || imgEl.dataset.src || '';
+                }
+
+                if (title && title.length > 2) {
+                    books.push({
+                        title: title.substring(0, 200),
+                        author: author,
+                        price: price,
+                        originalPrice: originalPrice,
+                        discount: discount,
+                        url: href,
+                        image: image
+                    });
+                }
+            } catch (e) {}
+        });
+
+        return books;
+    }
+"""
+
+
+def build_page_url(category_url, page_number):
+    """構建分頁 URL（第 1 頁不加 page 參數）"""
+    if page_number <= 1:
+        return category_url
+    separator = "&" if "?" in category_url else "?"
+    return f"{category_url}{separator}page={page_number}"
+
+
+async def get_total_pages(page) -> int:
+    """取得總頁數"""
+    try:
+        pagination = await page.query_selector_all('.pagination button, .pagination a')
+        max_page = 1
+        for btn in pagination:
+            text = await btn.inner_text()
+            if text.isdigit():
+                max_page = max(max_page, int(text))
+        return max_page
+    except Exception:
+        return 1
+
+
+async def wait_for_product_grid(page, selector=PRODUCT_CARD_SELECTOR,
+                                timeout=None, settle=None, poll=0.2, scroll=True) -> float:
+    """等待產品卡片出現且數量不再變化，回傳實際等待的秒數
+
+    取代固定的 asyncio.sleep：卡片出現後（可選）捲動到頁尾觸發延遲載入，
+    接著每 poll 秒計數一次，連續 settle 秒數量不變即視為完成；
+    整體等待不超過 timeout 秒，逾時不拋出例外，由呼叫端依抓到的卡片判斷。
+    """
+    timeout = PAGE_READY_TIMEOUT if timeout is None else timeout
+    settle = PAGE_READY_SETTLE if settle is None else settle
+    start = time.monotonic()
+
+    try:
+        await page.wait_for_selector(selector, timeout=timeout * 1000)
+    except Exception:
+        return time.monotonic() - start
+
+    if scroll:
+        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+
+    last_count = -1
+    stable_since = time.monotonic()
+    while time.monotonic() - start < timeout:
+        count = await page.evaluate(
+            "(selector) => document.querySelectorAll(selector).length", selector
+        )
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            stable_since = now
+        elif now - stable_since >= settle:
+            break
+        await asyncio.sleep(poll)
+
+    return time.monotonic() - start
+
+
+async def extract_product_cards(page, selector=PRODUCT_CARD_SELECTOR):
+    """以單次 page.evaluate 取得頁面上所有產品卡片
+
+    回傳書籍列表，欄位為 title / author / price / originalPrice / discount / url / image。
+    """
+    return await page.evaluate(EXTRACT_BOOKS_SCRIPT, selector)
+
+
+def format_wait_summary(wait_times, fixed_delay):
+    """整理每頁實際等待時間，並與原本固定等待秒數比較"""
+    if not wait_times:
+        return "頁面等待: 無紀錄"
+    waits = list(wait_times.values()) if isinstance(wait_times, dict) else list(wait_times)
+    total = sum(waits)
+    saved = fixed_delay * len(waits) - total
+    return (f"頁面等待: {len(waits)} 頁，平均 {total / len(waits):.2f} 秒，"
+            f"最長 {max(waits):.2f} 秒（固定等待 {fixed_delay} 秒/頁，節省約 {saved:.1f} 秒）")
+
+
+# ===== 資源攔截預設值（分類列表頁只需要 DOM 文字與屬性）=====
+# 圖片網址仍可從 img 的 src / data-src 讀取，不需要真的下載圖片
+DEFAULT_BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# 分析、廣告與追蹤腳本
+DEFAULT_BLOCKED_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "googleadservices.com",
+    "doubleclick.net", "googlesyndication.com", "facebook.net", "facebook.com",
+    "connect.facebook.net", "hotjar.com", "clarity.ms", "criteo.com", "criteo.net",
+    "scorecardresearch.com", "appier.net", "tagtoo.co",
+]
+
+# 各資源類型的平均大小（位元組），用來估算被攔截而省下的流量
+ESTIMATED_RESOURCE_BYTES = {
+    "image": 35_000,
+    "media": 500_000,
+    "font": 60_000,
+    "script": 45_000,
+    "stylesheet": 20_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+
+
+def _match_domain(host, domains):
+    """host 等於或為 domains 中任一網域的子網域"""
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+class ResourcePolicy:
+    """以 Playwright routing 攔截不需要的資源
+
+    判斷順序：allow_domains 一律放行 → block_types 依資源類型攔截 →
+    block_domains 依網域攔截 → 其餘放行。
+    """
+
+    def __init__(self, block_types=None, block_domains=None, allow_domains=None,
+                 estimated_bytes=None):
+        self.block_types = set(DEFAULT_BLOCKED_RESOURCE_TYPES if block_types is None else block_types)
+        self.block_domains = list(DEFAULT_BLOCKED_DOMAINS if block_domains is None else block_domains)
+        self.allow_domains = list(allow_domains or [])
+        self.estimated_bytes = {**ESTIMATED_RESOURCE_BYTES, **(estimated_bytes or {})}
+        self.blocked = {}
+        self.allowed = 0
+
+    def should_block(self, resource_type, url):
+        """判斷此請求是否應被攔截"""
+        host = (urlparse(url).hostname or "").lower()
+        if _match_domain(host, self.allow_domains):
+            return False
+        if resource_type in self.block_types:
+            return True
+        return _match_domain(host, self.block_domains)
+
+    async def install(self, target):
+        """在 browser context（或單一 page）上啟用攔截"""
+        await target.route("**/*", self._handle_route)
+        return self
+
+    async def _handle_route(self, route):
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            self.blocked[request.resource_type] = self.blocked.get(request.resource_type, 0) + 1
+            await route.abort()
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+    @property
+    def blocked_requests(self):
+        return sum(self.blocked.values())
+
+    @property
+    def estimated_bytes_saved(self):
+        return sum(self.estimated_bytes.get(resource_type, 0) * count
+                   for resource_type, count in self.blocked.items())
+
+    def summary(self):
+        """本次執行攔截的請求數與估計節省流量"""
+        total = self.blocked_requests + self.allowed
+        detail = ", ".join(f"{resource_type} {count}" for resource_type, count
+                           in sorted(self.blocked.items(), key=lambda x: -x[1]))
+        return (f"資源攔截: 攔截 {self.blocked_requests}/{total} 個請求"
+                f"（{detail or '無'}），估計節省 {self.estimated_bytes_saved / 1024 / 1024:.1f} MB")
+
+
+class PagePool:
+    """同一個瀏覽器 context 內的固定大小分頁池
+
+    每個 worker 各自持有一個 Playwright page，依序從佇列取出工作，
+    因此同時進行中的頁面數量不會超過 size。
+    """
+
+    def __init__(self, context, size=4):
+        self.context = context
+        self.size = max(1, size)
+        self.pages = []
+        self._owned = []
+
+    async def open(self, first_page=None):
+        """開啟分頁；可傳入既有的 page 作為第一個分頁重複使用"""
+        if first_page is not None:
+            self.pages.append(first_page)
+        while len(self.pages) < self.size:
+            page = await self.context.new_page()
+            self.pages.append(page)
+            self._owned.append(page)
+        return self
+
+    async def close(self):
+        """關閉分頁池自行開啟的分頁（外部傳入的 page 不會被關閉）"""
+        for page in self._owned:
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._owned = []
+        self.pages = []
+
+    async def map(self, items, worker):
+        """以分頁池並行執行 worker(page, item)，結果依 items 原順序回傳"""
+        items = list(items)
+        results = [None] * len(items)
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+
+        async def run(page):
+            while True:
+                try:
+                    index, item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results[index] = await worker(page, item)
+
+        await asyncio.gather(*(run(page) for page in self.pages[:max(1, len(items))]))
+        return results
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+誠品寵物書籍 - 常駐模式
+瀏覽器 context、分類快取與分類後的書目常駐在記憶體中，依排程執行新書檢查，
+並在本機提供 HTTP 控制介面，互動版與排程工作改為送出工作，不必每次重新啟動瀏覽器與載入資料
+
+    python pet_books_daemon.py serve              # 啟動常駐服務
+    python pet_books_daemon.py submit check       # 送出工作（collect / check / status / query / events）
+    python pet_books_daemon.py submit check '{"resume": true}'   # 從中斷的爬取日誌繼續
+    python pet_books_daemon.py submit query '{"animal": "貓", "topic": "照護飼養"}'
+    python pet_books_daemon.py submit events '{"days": 7, "type": "price_changed"}'
+    python pet_books_daemon.py status             # 各工作的單次執行估計 / 常駐耗時
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pet_books_cache import CATEGORY_CACHE_FILE, CategoryCache, taxonomy_hash
+from pet_books_catalog import CATALOG_DB, Catalog
+from pet_books_model import Book
+from pet_books_scraper import (
+    ANIMAL_TYPES, TOPIC_CATEGORIES, EslitePetBooksScraper, collect_and_export, launch_browser_context,
+)
+
+# 控制介面只監聽本機
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = int(os.environ.get("DAEMON_PORT", "8765"))
+
+# 排程新書檢查的間隔（分鐘），0 表示不排程、只接受送出的工作
+DAEMON_CHECK_INTERVAL_MINUTES = int(os.environ.get("DAEMON_CHECK_INTERVAL_MINUTES", "360"))
+
+# 送出工作時等待結果的秒數（完整爬取可能需要數分鐘）
+DAEMON_JOB_TIMEOUT = int(os.environ.get("DAEMON_JOB_TIMEOUT", "3600"))
+
+# query 工作最多回傳的書籍數
+QUERY_LIMIT = 20
+
+# events 工作未指定 since 時查詢最近幾天的變動
+EVENTS_DAYS = 7
+
+
+class WarmBrowser:
+    """常駐的 Chromium 與 context：第一次需要時啟動，之後的工作共用"""
+
+    def __init__(self):
+        self.launches = 0
+        self.launch_seconds = None
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._resource_policy = None
+        self._lock = asyncio.Lock()
+
+    async def context(self):
+        async with self._lock:
+            # 瀏覽器程序結束或當掉後 context 已無法使用，先清掉再重新啟動
+            if self._browser is not None and not self._browser.is_connected():
+                print("常駐瀏覽器已中斷連線，重新啟動")
+                await self._shutdown()
+            if self._context is None:
+                from playwright.async_api import async_playwright
+
+                started = time.monotonic()
+                print("正在啟動常駐瀏覽器...")
+                self._playwright = await async_playwright().start()
+                try:
+                    self._browser, self._context, self._resource_policy = \
+                        await launch_browser_context(self._playwright)
+                except Exception:
+                    await self._shutdown()
+                    raise
+                self.launches += 1
+                self.launch_seconds = time.monotonic() - started
+                print(f"瀏覽器已啟動（{self.launch_seconds:.1f} 秒）")
+            return self._context
+
+    async def _shutdown(self):
+        """關閉瀏覽器與 playwright（呼叫端需持有鎖）；已中斷連線的瀏覽器關閉失敗時忽略"""
+        try:
+            if self._browser is not None:
+                if self._resource_policy is not None:
+                    print(self._resource_policy.summary())
+                await self._browser.close()
+        except Exception as e:
+            print(f"關閉瀏覽器失敗: {e}")
+        finally:
+            if self._playwright is not None:
+                await self._playwright.stop()
+            self._playwright = self._browser = self._context = self._resource_policy = None
+
+    async def close(self):
+        async with self._lock:
+            await self._shutdown()
+
+
+class JobTimer:
+    """各工作的耗時：第一次執行為首次（first），之後為常駐（warm）
+
+    常駐服務啟動時已載入書目並啟動瀏覽器，首次執行並不是冷啟動；
+    單獨執行一次腳本的成本沒有實際量測，以「服務啟動耗時 + 首次執行」估計（standalone_estimate）。
+    """
+
+    def __init__(self):
+        self.runs = {}
+
+    def record(self, name, elapsed):
+        self.runs.setdefault(name, []).append(elapsed)
+        return len(self.runs[name]) > 1
+
+    def summary(self, startup_seconds=0.0):
+        """{工作: {'runs': 次數, 'first': 第一次秒數, 'standalone_estimate': 啟動 + 第一次秒數（估計值）, 'warm': 之後的平均秒數}}"""
+        summary = {}
+        for name, runs in self.runs.items():
+            warm = runs[1:]
+            summary[name] = {
+                'runs': len(runs),
+                'first': round(runs[0], 3),
+                'standalone_estimate': round(startup_seconds + runs[0], 3),
+                'warm': round(sum(warm) / len(warm), 3) if warm else None,
+            }
+        return summary
+
+
+class CrawlDaemon:
+    """常駐服務：持有 scraper、瀏覽器、分類快取與書目，依序執行工作
+
+    會修改書目的工作（collect、check）一次只執行一個；status、query 只讀取記憶體中的書目，
+    events 在執行緒中查詢資料庫的變動事件，都不必等待正在執行的爬取。
+    工作中讀寫資料庫、Google Sheets 與寄信的步驟都在執行緒中執行，不會阻塞控制介面。
+    """
+
+    def __init__(self, browser=None):
+        self.scraper = EslitePetBooksScraper()
+        self.browser = browser or WarmBrowser()
+        self.timer = JobTimer()
+        self.cache = None
+        self.books = []
+        self.started_at = None
+        self.startup_seconds = None
+        self.last_results = {}
+        self._lock = asyncio.Lock()
+        self.jobs = {
+            'collect': (self.job_collect, True),
+            'check': (self.job_check, True),
+            'status': (self.job_status, False),
+            'query': (self.job_query, False),
+            'events': (self.job_events, False),
+        }
+
+    async def start(self, warm_browser=True):
+        """載入分類快取與書目，並預先啟動瀏覽器（啟動失敗時需要時再試）"""
+        started = time.monotonic()
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.cache = await asyncio.to_thread(
+            CategoryCache.load, CATEGORY_CACHE_FILE, taxonomy_hash(ANIMAL_TYPES, TOPIC_CATEGORIES))
+        await self.load_catalog()
+        if warm_browser:
+            try:
+                await self.browser.context()
+            except Exception as e:
+                print(f"瀏覽器啟動失敗，需要時再試: {e}")
+        self.startup_seconds = time.monotonic() - started
+        print(f"常駐服務已就緒（{self.startup_seconds:.1f} 秒）")
+
+    async def close(self):
+        await self.browser.close()
+
+    def read_catalog(self):
+        """從書目資料庫讀取書籍並轉為 Book（阻塞，於執行緒中執行）"""
+        taxonomy = self.scraper.taxonomy
+        with Catalog(CATALOG_DB) as catalog:
+            return [
+                Book.from_mapping(
+                    book, taxonomy.encode(book.get('animal_types', ()), book.get('topics', ())), taxonomy)
+                for book in catalog.load_books()
+            ]
+
+    async def load_catalog(self):
+        """在執行緒中讀取書目資料庫，再於事件迴圈中替換常駐書目並建立分類索引"""
+        books = await asyncio.to_thread(self.read_catalog)
+        self.books = books
+        self.scraper.book_index(self.books, rebuild=True)
+        print(f"從 {CATALOG_DB} 載入 {len(self.books)} 本書籍")
+
+    async def run_job(self, name, params=None):
+        """執行工作，回傳 {'job', 'result', 'elapsed', 'warm'}"""
+        if name not in self.jobs:
+            raise KeyError(f"未知的工作: {name}")
+        handler, exclusive = self.jobs[name]
+        if exclusive:
+            async with self._lock:
+                return await self._timed(name, handler, params or {})
+        return await self._timed(name, handler, params or {})
+
+    async def _timed(self, name, handler, params):
+        started = time.monotonic()
+        result = await handler(params)
+        elapsed = time.monotonic() - started
+        warm = self.timer.record(name, elapsed)
+        self.last_results[name] = datetime.now().isoformat(timespec='seconds')
+        print(f"[{name}] 完成，耗時 {elapsed:.2f} 秒（{'常駐' if warm else '首次'}）")
+        return {'job': name, 'result': result, 'elapsed': round(elapsed, 3), 'warm': warm}
+
+    async def _context_or_none(self):
+        try:
+            return await self.browser.context()
+        except Exception as e:
+            print(f"無法使用常駐瀏覽器，改為需要時啟動: {e}")
+            return None
+
+    async def job_collect(self, params):
+        """完整收集、分類、寫入書目資料庫並匯出"""
+        books = await collect_and_export(
+            self.scraper, await self._context_or_none(), self.cache, source='daemon',
+            resume=bool(params.get('resume')))
+        await self.load_catalog()
+        return {'books': len(books)}
+
+    async def job_check(self, params):
+        """新書檢查並寄出通知，完成後重新載入書目"""
+        import new_books_checker
+
+        # 訂閱者名單每次檢查重新確認是否有變動（SubscriberDirectory 仍會使用快照與 TTL）
+        new_books_checker.get_subscriber_directory.cache_clear()
+        new_books = await new_books_checker.run_check(
+            await self._context_or_none(), resume=bool(params.get('resume')))
+        await self.load_catalog()
+        return {'new_books': len(new_books), 'titles': [book.get('title', '') for book in new_books]}
+
+    async def job_status(self, params):
+        index = self.scraper.book_index(self.books)
+        return {
+            'started_at': self.started_at,
+            'startup_seconds': round(self.startup_seconds or 0, 3),
+            'browser_launches': self.browser.launches,
+            'browser_launch_seconds': self.browser.launch_seconds,
+            'books': len(index),
+            'animal_types': index.value_counts('animal_types'),
+            'topics': index.value_counts('topics'),
+            'timings': self.timer.summary(self.startup_seconds or 0),
+            'last_runs': self.last_results,
+        }
+
+    async def job_query(self, params):
+        """依動物種類（animal）與主題分類（topic）篩選，兩者皆指定時取交集"""
+        index = self.scraper.book_index(self.books)
+        conditions = [(field, params[key]) for key, field in (('animal', 'animal_types'), ('topic', 'topics'))
+                      if params.get(key)]
+        bits = index.match(all_of=conditions)
+        limit = int(params.get('limit', QUERY_LIMIT))
+        return {
+            'count': index.count(bits),
+            'books': [{'title': book['title'], 'price': book['price'], 'url': book['url']}
+                      for book in index.books_of(bits, limit=limit)],
+        }
+
+    def read_events(self, since, event_type=None, product_id=None):
+        """從書目資料庫讀取變動事件（阻塞，於執行緒中執行）"""
+        with Catalog(CATALOG_DB) as catalog:
+            return catalog.events_since(since, event_type, product_id)
+
+    async def job_events(self, params):
+        """書目變動事件：since（ISO 時間）或 days 之後的事件，可依 type（事件種類）與 product（商品 ID）篩選，
+        回傳最近的 limit 筆"""
+        since = params.get('since') or (
+            datetime.now() - timedelta(days=float(params.get('days', EVENTS_DAYS)))).isoformat(timespec='seconds')
+        events = await asyncio.to_thread(self.read_events, since, params.get('type'), params.get('product'))
+        limit = int(params.get('limit', QUERY_LIMIT))
+        return {
+            'since': since,
+            'count': len(events),
+            'counts': dict(Counter(event['event_type'] for event in events)),
+            'events': events[-limit:],
+        }
+
+    async def schedule(self, interval_minutes):
+        """每隔 interval_minutes 分鐘執行一次新書檢查"""
+        while True:
+            await asyncio.sleep(interval_minutes * 60)
+            try:
+                await self.run_job('check')
+            except Exception as e:
+                print(f"排程檢查失敗: {e}")
+
+    # ===== 控制介面 =====
+
+    async def handle_connection(self, reader, writer):
+        """處理一個 HTTP 請求：GET /status，POST /jobs/<工作>（內容為 JSON 參數）"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+
+            method, path = request_line[0], request_line[1]
+            if method == 'GET' and path == '/status':
+                status, payload = 200, await self.run_job('status')
+            elif method == 'POST' and path.startswith('/jobs/'):
+                params = json.loads(body) if body else {}
+                status, payload = 200, await self.run_job(path[len('/jobs/'):], params)
+            else:
+                status, payload = 404, {'error': f"不支援的請求: {' '.join(request_line[:2])}"}
+        except KeyError as e:
+            status, payload = 404, {'error': str(e.args[0])}
+        except Exception as e:
+            status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host=DAEMON_HOST, port=DAEMON_PORT,
+                    interval_minutes=DAEMON_CHECK_INTERVAL_MINUTES, warm_browser=True):
+        """啟動控制介面與排程，直到被中斷"""
+        await self.start(warm_browser)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"控制介面: http://{host}:{port}（GET /status，POST /jobs/<collect|check|status|query|events>）")
+        scheduler = None
+        if interval_minutes > 0:
+            print(f"每 {interval_minutes} 分鐘執行一次新書檢查")
+            scheduler = asyncio.create_task(self.schedule(interval_minutes))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if scheduler is not None:
+                scheduler.cancel()
+            await self.close()
+
+
+def _request(method, path, params=None, host=DAEMON_HOST, port=DAEMON_PORT, timeout=DAEMON_JOB_TIMEOUT):
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        body = json.dumps(params or {}, ensure_ascii=False).encode('utf-8') if method == 'POST' else None
+        conn.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        payload = json.loads(response.read() or b'{}')
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(payload.get('error', f"HTTP {response.status}"))
+    return payload
+
+
+def submit_job(name, params=None, host=DAEMON_HOST, port=DAEMON_PORT, timeout=DAEMON_JOB_TIMEOUT):
+    """送出工作給常駐服務並等待結果（連不上時拋出 OSError）"""
+    return _request('POST', f"/jobs/{name}", params, host, port, timeout)
+
+
+def daemon_status(host=DAEMON_HOST, port=DAEMON_PORT, timeout=DAEMON_JOB_TIMEOUT):
+    return _request('GET', "/status", host=host, port=port, timeout=timeout)
+
+
+def daemon_available(host=DAEMON_HOST, port=DAEMON_PORT):
+    """常駐服務是否正在執行"""
+    try:
+        daemon_status(host, port, timeout=2)
+    except (OSError, RuntimeError, ValueError):
+        return False
+    return True
+
+
+def format_timings(timings):
+    lines = []
+    for name, timing in timings.items():
+        warm = f"{timing['warm']:.2f} 秒" if timing['warm'] is not None else "—"
+        lines.append(f"  {name}: 單次執行約 {timing['standalone_estimate']:.2f} 秒（估計值 = 服務啟動 + 首次 {timing['first']:.2f} 秒），"
+                     f"常駐平均 {warm}（{timing['runs']} 次）")
+    return "\n".join(lines)
+
+
+def main(argv):
+    command = argv[0] if argv else 'serve'
+    if command in ('submit', 'status') and not daemon_available():
+        print(f"無法連線到常駐服務 {DAEMON_HOST}:{DAEMON_PORT}，請先執行 python pet_books_daemon.py serve")
+        return 1
+    if command == 'serve':
+        interval = DAEMON_CHECK_INTERVAL_MINUTES
+        if '--interval' in argv:
+            interval = int(argv[argv.index('--interval') + 1])
+        asyncio.run(CrawlDaemon().serve(interval_minutes=interval))
+    elif command == 'submit' and len(argv) >= 2:
+        params = json.loads(argv[2]) if len(argv) >= 3 else None
+        started = time.monotonic()
+        payload = submit_job(argv[1], params)
+        print(json.dumps(payload['result'], ensure_ascii=False, indent=2))
+        print(f"工作 {payload['job']} 耗時 {payload['elapsed']:.2f} 秒"
+              f"（{'常駐' if payload['warm'] else '首次'}），含往返 {time.monotonic() - started:.2f} 秒")
+    elif command == 'status':
+        status = daemon_status()['result']
+        print(f"啟動時間: {status['started_at']}（啟動耗時 {status['startup_seconds']:.1f} 秒，"
+              f"瀏覽器啟動 {status['browser_launches']} 次）")
+        print(f"常駐書籍: {status['books']} 本")
+        print(format_timings(status['timings']) or "  尚未執行任何工作")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,96 @@
+"""
+誠品寵物書籍 - 書目差異比對
+以商品 ID 比對本次與上次的書目，產生新增、下架、價格與折扣變動等事件
+"""
+
+from pet_books_catalog import parse_price, parse_product_id
+
+EVENT_ADDED = "added"
+EVENT_REMOVED = "removed"
+EVENT_PRICE_CHANGED = "price_changed"
+EVENT_DISCOUNT_CHANGED = "discount_changed"
+EVENT_METADATA_CHANGED = "metadata_changed"
+
+EVENT_TYPES = (
+    EVENT_ADDED, EVENT_REMOVED, EVENT_PRICE_CHANGED,
+    EVENT_DISCOUNT_CHANGED, EVENT_METADATA_CHANGED,
+)
+
+EVENT_LABELS = {
+    EVENT_ADDED: "新上架",
+    EVENT_REMOVED: "已下架",
+    EVENT_PRICE_CHANGED: "價格變動",
+    EVENT_DISCOUNT_CHANGED: "折扣變動",
+    EVENT_METADATA_CHANGED: "資料變動",
+}
+
+# 比對的書目欄位（封面圖片網址常因縮圖參數改變，不列入）
+METADATA_FIELDS = ("title", "author", "originalPrice")
+
+
+def _event(event_type, product_id, book, field=None, old=None, new=None):
+    return {
+        'type': event_type,
+        'product_id': product_id,
+        'title': book.get('title', ''),
+        'field': field,
+        'old': old,
+        'new': new,
+        'book': book,
+    }
+
+
+def diff_catalog(current_books, previous_books, detect_removed=True):
+    """比對兩份書目，回傳事件列表
+
+    以上次書目建立 {商品 ID: 書籍} 雜湊表，本次書目逐一查表並移除，
+    剩下的即為下架書籍，整體為 O(n)。增量爬取只看到部分頁面，
+    此時應傳入 detect_removed=False，避免把沒爬到的書當成下架。
+    """
+    previous_index = {parse_product_id(book['url']): book for book in previous_books}
+    events = []
+    seen = set()
+
+    for book in current_books:
+        product_id = parse_product_id(book['url'])
+        if product_id in seen:
+            continue
+        seen.add(product_id)
+
+        old = previous_index.pop(product_id, None)
+        if old is None:
+            events.append(_event(EVENT_ADDED, product_id, book))
+            continue
+
+        if parse_price(old.get('price')) != parse_price(book.get('price')):
+            events.append(_event(EVENT_PRICE_CHANGED, product_id, book, 'price',
+                                 old.get('price', ''), book.get('price', '')))
+        if (old.get('discount') or '') != (book.get('discount') or ''):
+            events.append(_event(EVENT_DISCOUNT_CHANGED, product_id, book, 'discount',
+                                 old.get('discount', ''), book.get('discount', '')))
+        for field in METADATA_FIELDS:
+            old_value = str(old.get(field) or '')
+            new_value = str(book.get(field) or '')
+            # 舊資料沒有的欄位（例如從舊版 previous_books.json 匯入）不視為變動
+            if old_value and new_value and old_value != new_value:
+                events.append(_event(EVENT_METADATA_CHANGED, product_id, book, field,
+                                     old_value, new_value))
+
+    if detect_removed:
+        for product_id, book in previous_index.items():
+            events.append(_event(EVENT_REMOVED, product_id, book))
+
+    return events
+
+
+def events_of_type(events, event_type):
+    """篩選指定類型的事件"""
+    return [event for event in events if event['type'] == event_type]
+
+
+def format_event_summary(events):
+    """各類事件數量"""
+    counts = {event_type: 0 for event_type in EVENT_TYPES}
+    for event in events:
+        counts[event['type']] += 1
+    return "，".join(f"{EVENT_LABELS[t]} {counts[t]}" for t in EVENT_TYPES)
@@ -0,0 +1,374 @@
+"""
+誠品寵物書籍 - 匯出
+書籍資料整理成欄式表格一次，再同時寫出 CSV、Excel、JSON Lines 與網頁用的 books_data.js
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# 匯出欄位（欄名, 書籍欄位）
+EXPORT_COLUMNS = [
+    ("書名", 'title'),
+    ("作者", 'author'),
+    ("售價", 'price'),
+    ("原價", 'originalPrice'),
+    ("折扣", 'discount'),
+    ("動物種類", 'animal_type_str'),
+    ("主題分類", 'topic_str'),
+    ("組合分類", 'combined_category'),
+    ("連結", 'url'),
+    ("圖片", 'image'),
+    ("來源分類", 'source_category'),
+]
+
+# index.html 讀取的書籍資料檔
+BOOKS_DATA_JS = "books_data.js"
+
+# index.html 分批載入的分片資料目錄，以及每個分片的書籍數
+CATALOG_DATA_DIR = "catalog_data"
+SHARD_SIZE = int(os.environ.get("SHARD_SIZE", "200"))
+
+# 多值欄位（動物種類、主題分類）的分隔字串
+VALUE_SEPARATOR = ", "
+
+# 分類統計的欄位，以及建立搜尋索引的欄位
+FACET_COLUMNS = ("動物種類", "主題分類", "組合分類")
+SEARCH_COLUMNS = ("書名", "作者")
+
+# 搜尋索引依 n-gram 首字分成的檔案數（查詢只需載入用到的部分）
+SEARCH_BUCKETS = 32
+
+
+class ExportTable:
+    """欄式的匯出資料：{欄名: 該欄所有值}
+
+    每本書只轉換一次，各輸出格式共用同一份資料。
+    """
+
+    def __init__(self, columns, data):
+        self.columns = list(columns)
+        self.data = data
+
+    @classmethod
+    def from_books(cls, books, export_columns=EXPORT_COLUMNS):
+        columns = [column for column, _ in export_columns]
+        data = {column: [book.get(field, '') for book in books]
+                for column, field in export_columns}
+        return cls(columns, data)
+
+    def __len__(self):
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    def with_column(self, column, values):
+        """回傳替換其中一欄的新表格（其餘欄位共用同一份資料）"""
+        return ExportTable(self.columns, {**self.data, column: list(values)})
+
+    def rows(self, positions=None):
+        """逐列產生值的 tuple；傳入 positions 時只產生這些位置的列"""
+        columns = [self.data[column] for column in self.columns]
+        if positions is None:
+            return zip(*columns)
+        return (tuple(values[position] for values in columns) for position in positions)
+
+    def records(self):
+        """逐列產生 {欄名: 值}"""
+        for row in self.rows():
+            yield dict(zip(self.columns, row))
+
+    def positions_by_value(self, column, values):
+        """一次掃描多值欄位，建立 {值: 列位置列表} 的反向索引（只含 values 中的值）"""
+        index = {value: [] for value in values}
+        for position, cell in enumerate(self.data[column]):
+            for value in (cell or '').split(VALUE_SEPARATOR):
+                if value in index:
+                    index[value].append(position)
+        return index
+
+    def value_counts(self, column):
+        """多值欄位中每個值出現的書籍數（依首次出現順序）"""
+        counts = {}
+        for cell in self.data[column]:
+            for value in (cell or '').split(VALUE_SEPARATOR):
+                if value:
+                    counts[value] = counts.get(value, 0) + 1
+        return counts
+
+
+def build_ngram_index(table, columns=SEARCH_COLUMNS, sizes=(1, 2)):
+    """建立 {字元 n-gram: 書籍位置列表} 的反向索引（不分大小寫）
+
+    中文沒有空白斷詞，以單字與相鄰兩字為單位：查詢字串的所有 bigram
+    都出現的書籍才可能包含該字串（單一字元的查詢直接查單字）。
+    """
+    index = {}
+    for position, values in enumerate(zip(*(table.data[column] for column in columns))):
+        # 以出現順序去重：set 的順序隨字串雜湊種子改變，每次執行寫出的索引檔內容會不同
+        grams = {}
+        for value in values:
+            text = str(value or '').lower()
+            for size in sizes:
+                grams.update(dict.fromkeys(text[i:i + size] for i in range(len(text) - size + 1)))
+        for gram in grams:
+            if gram.strip():
+                index.setdefault(gram, []).append(position)
+    return index
+
+
+def delta_encode(positions):
+    """遞增的位置列表改存與前一個位置的差值，縮小 JSON 大小"""
+    previous = 0
+    encoded = []
+    for position in positions:
+        encoded.append(position - previous)
+        previous = position
+    return encoded
+
+
+class CsvSink:
+    """CSV（UTF-8 with BOM，Excel 可直接開啟）"""
+
+    name = "CSV"
+
+    def write(self, table, path):
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(table.columns)
+            writer.writerows(table.rows())
+
+
+class XlsxSink:
+    """Excel，含全部書籍與各分類工作表
+
+    sheet_groups 為 [(欄名, 分類名稱列表, 工作表名稱格式), ...]，依序產生工作表；
+    先以一次掃描建立分類 → 列位置索引，再以 write-only 模式逐列寫入。
+    標題列與 pandas to_excel 相同：粗體、細框線、水平置中、垂直靠上。
+    """
+
+    name = "Excel"
+
+    def __init__(self, sheet_groups=()):
+        self.sheet_groups = list(sheet_groups)
+
+    def sheet_index(self, table):
+        """{工作表名稱: 列位置列表}，不含沒有書籍的分類"""
+        index = {}
+        for column, names, sheet_format in self.sheet_groups:
+            for name, positions in table.positions_by_value(column, names).items():
+                if positions:
+                    # Excel 工作表名稱限制 31 字元
+                    index[sheet_format.format(name)[:31]] = positions
+        return index
+
+    def _header(self, sheet, columns):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Border, Font, Side
+
+        font = Font(bold=True)
+        side = Side(style="thin")
+        border = Border(left=side, right=side, top=side, bottom=side)
+        alignment = Alignment(horizontal="center", vertical="top")
+        cells = []
+        for column in columns:
+            cell = WriteOnlyCell(sheet, value=column)
+            cell.font, cell.border, cell.alignment = font, border, alignment
+            cells.append(cell)
+        return cells
+
+    def write(self, table, path):
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheets = [('全部書籍', None)] + list(self.sheet_index(table).items())
+        for sheet_name, positions in sheets:
+            sheet = workbook.create_sheet(sheet_name)
+            sheet.append(self._header(sheet, table.columns))
+            for row in table.rows(positions):
+                sheet.append(row)
+        workbook.save(path)
+
+
+class JsonLinesSink:
+    """JSON Lines，每行一本書"""
+
+    name = "JSONL"
+
+    def write(self, table, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in table.records():
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+
+
+class BooksDataJsSink:
+    """index.html 使用的 books_data.js（const booksData = [...]）"""
+
+    name = "books_data.js"
+
+    def __init__(self, variable="booksData", indent=2):
+        self.variable = variable
+        self.indent = indent
+
+    def write(self, table, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"const {self.variable} = ")
+            json.dump(list(table.records()), f, ensure_ascii=False, indent=self.indent)
+            f.write(";\n")
+
+
+def _compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class ShardedCatalogSink:
+    """index.html 分批載入用的資料目錄
+
+    目錄內容：
+      manifest.json               總書數、欄名、分片列表、各分類書數（不快取，每次載入）
+      books-0000.json             依原順序每 shard_size 本一個分片，每列為欄位值陣列
+      categories.json             {欄名: {分類: [書籍位置, ...]}}，篩選分類時才載入
+      search-00.json              書名、作者的字元 n-gram 索引（位置以差值編碼），依首字的
+                                  code point 分成 SEARCH_BUCKETS 個檔案，搜尋時只載入用到的部分
+    manifest 的 facet_counts 為預先計算的動物種類、主題、組合分類書數。
+    檔名固定（每次匯出不會產生新檔名，提交到版本庫時只有內容變動的檔案出現差異），
+    manifest 引用的網址帶 ?v=<內容雜湊>，內容不變時網址不變，可設定長期快取；
+    內容未變的檔案不重寫。每個檔案另外產生 .gz（與安裝 brotli 套件時的 .br）預先壓縮版本，
+    供支援 gzip_static 的伺服器直接回傳。寫入完成後刪除 manifest 已不再引用的舊分片。
+    """
+
+    name = "分片資料"
+
+    def __init__(self, category_groups=(), shard_size=SHARD_SIZE, compress=True,
+                 search_columns=SEARCH_COLUMNS):
+        self.category_columns = [(group[0], list(group[1])) for group in category_groups]
+        self.search_columns = list(search_columns)
+        self.shard_size = max(1, shard_size)
+        self.compress = compress
+
+    def _write_file(self, directory, filename, payload):
+        targets = [(directory / filename, lambda data: data)]
+        if self.compress:
+            targets.append((directory / (filename + ".gz"),
+                            lambda data: gzip.compress(data, compresslevel=9, mtime=0)))
+            brotli = _brotli()
+            if brotli is not None:
+                targets.append((directory / (filename + ".br"), brotli.compress))
+
+        written = []
+        for path, encode in targets:
+            tmp_path = path.with_name(path.name + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(encode(payload))
+            os.replace(tmp_path, path)
+            written.append(path.name)
+        return written
+
+    def _write_versioned(self, directory, stem, payload, keep):
+        """以固定檔名寫入檔案，回傳帶內容雜湊的網址（檔名?v=雜湊）；內容相同時不重寫"""
+        filename = f"{stem}.json"
+        path = directory / filename
+        if path.exists() and path.read_bytes() == payload:
+            keep.update(existing.name for existing in directory.glob(filename + "*"))
+        else:
+            keep.update(self._write_file(directory, filename, payload))
+        return f"{filename}?v={hashlib.sha256(payload).hexdigest()[:12]}"
+
+    def write(self, table, path):
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        keep = set()
+
+        shards = []
+        for number, start in enumerate(range(0, len(table), self.shard_size)):
+            positions = range(start, min(start + self.shard_size, len(table)))
+            payload = _compact_json([list(row) for row in table.rows(positions)])
+            shards.append({
+                'file': self._write_versioned(directory, f"books-{number:04d}", payload, keep),
+                'count': len(positions),
+            })
+
+        categories = {column: table.positions_by_value(column, names)
+                      for column, names in self.category_columns}
+        categories_file = self._write_versioned(
+            directory, "categories", _compact_json(categories), keep)
+
+        buckets = [{} for _ in range(SEARCH_BUCKETS)]
+        for gram, positions in build_ngram_index(table, self.search_columns).items():
+            buckets[ord(gram[0]) % SEARCH_BUCKETS][gram] = delta_encode(positions)
+        search_files = [self._write_versioned(directory, f"search-{number:02d}", _compact_json(bucket), keep)
+                        for number, bucket in enumerate(buckets)]
+
+        facet_counts = {column: table.value_counts(column)
+                        for column in FACET_COLUMNS if column in table.data}
+        for column, index in categories.items():
+            facet_counts[column] = {name: len(positions) for name, positions in index.items()}
+
+        manifest = {
+            'version': 1,
+            'total': len(table),
+            'shard_size': self.shard_size,
+            'columns': table.columns,
+            'shards': shards,
+            'categories_file': categories_file,
+            'search_files': search_files,
+            'search_columns': self.search_columns,
+            'facet_counts': facet_counts,
+        }
+        keep.update(self._write_file(directory, "manifest.json", _compact_json(manifest)))
+
+        for stale in directory.iterdir():
+            if stale.is_file() and stale.name not in keep and (
+                    stale.name.startswith(("books-", "categories.", "search-"))):
+                stale.unlink()
+
+
+def _run_sink(sink, table, path):
+    start = time.perf_counter()
+    try:
+        sink.write(table, path)
+        error = None
+    except Exception as e:
+        error = e
+    return {'sink': sink.name, 'path': path, 'seconds': time.perf_counter() - start,
+            'error': error}
+
+
+def run_export(table, targets, max_workers=None):
+    """將同一份 ExportTable 同時寫到多個輸出
+
+    targets 為 [(sink, 檔名), ...]，也可寫成 (sink, 檔名, 表格) 讓該輸出改用另一份表格
+    （例如圖片改為本機路徑的網頁資料）。各輸出在執行緒中並行寫入（檔案 I/O 與壓縮可重疊），
+    單一輸出失敗不影響其他輸出。回傳每個輸出的 {sink, path, seconds, error}，順序同 targets。
+    """
+    if not targets:
+        return []
+    workers = max_workers or len(targets)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_sink, target[0], target[2] if len(target) > 2 else table,
+                                   target[1])
+                   for target in targets]
+        return [future.result() for future in futures]
+
+
+def format_export_report(results):
+    """各輸出的檔名與耗時"""
+    lines = []
+    for result in results:
+        if result['error'] is None:
+            lines.append(f"  {result['sink']}: {result['path']}（{result['seconds']:.2f} 秒）")
+        else:
+            lines.append(f"  {result['sink']}: 匯出失敗 {result['path']} ({result['error']})")
+    return "\n".join(lines)
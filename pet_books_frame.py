@@ -0,0 +1,110 @@
+"""
+誠品寵物書籍 - 欄式書籍資料（互動版使用）
+以 pandas 一次讀入書目資料庫或匯出的 CSV，多值分類欄位只拆解一次並預先建立布林遮罩，
+篩選、統計與匯出都直接以遮罩選取列，不再逐本書掃描
+"""
+
+import pandas as pd
+
+from pet_books_export import EXPORT_COLUMNS, VALUE_SEPARATOR, ExportTable
+
+# 書目資料庫欄位 → 匯出欄名
+CATALOG_COLUMN_NAMES = {
+    'title': "書名",
+    'author': "作者",
+    'price': "售價",
+    'original_price': "原價",
+    'discount': "折扣",
+    'animal_type_str': "動物種類",
+    'topic_str': "主題分類",
+    'combined_category': "組合分類",
+    'url': "連結",
+    'image': "圖片",
+    'source_category': "來源分類",
+}
+
+# 建立遮罩的多值分類欄位，以及未分類時的預設值
+MASK_COLUMNS = {"動物種類": "通用", "主題分類": "其他"}
+
+# 文字欄位（其餘分類欄位以 category 型別存放）
+TEXT_COLUMNS = ["書名", "作者", "售價", "原價", "折扣", "連結", "圖片", "來源分類"]
+
+
+def category_masks(column):
+    """多值分類欄位（category 型別）→ 每個分類一欄的布林 DataFrame
+
+    只拆解不重複的欄位值，再依各列的 category 代碼展開到所有列。
+    """
+    per_value = (column.cat.categories.to_series()
+                 .str.get_dummies(sep=VALUE_SEPARATOR).astype(bool))
+    masks = per_value.to_numpy()[column.cat.codes.to_numpy()]
+    return pd.DataFrame(masks, columns=per_value.columns, index=column.index)
+
+
+class BookFrame:
+    """書籍 DataFrame 與預先建立的分類遮罩
+
+    frame 欄位與匯出欄位相同，另有 售價數值（Int64）；從書目資料庫讀取時另有首次 / 最後出現時間（datetime）。
+    masks 為 {欄名: 布林 DataFrame}，每個分類一欄。
+    """
+
+    def __init__(self, frame):
+        for column, default in MASK_COLUMNS.items():
+            frame[column] = frame[column].fillna('').replace('', default)
+        frame["組合分類"] = frame["組合分類"].fillna('')
+        for column in (*MASK_COLUMNS, "組合分類"):
+            frame[column] = frame[column].astype('category')
+        for column in TEXT_COLUMNS:
+            frame[column] = frame[column].fillna('').astype('string')
+        if "售價數值" not in frame:
+            frame["售價數值"] = pd.to_numeric(
+                frame["售價"].str.replace(r"[^\d]", "", regex=True), errors='coerce')
+        frame["售價數值"] = frame["售價數值"].astype('Int64')
+
+        self.frame = frame.reset_index(drop=True)
+        self.masks = {column: category_masks(self.frame[column]) for column in MASK_COLUMNS}
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """從書目資料庫讀取（依首次出現時間排序）"""
+        frame = pd.read_sql_query(
+            f"SELECT {', '.join(CATALOG_COLUMN_NAMES)}, price_value, first_seen, last_seen"
+            " FROM books ORDER BY first_seen, rowid",
+            catalog.conn,
+            parse_dates=['first_seen', 'last_seen'],
+        )
+        frame = frame.rename(columns={**CATALOG_COLUMN_NAMES, 'price_value': "售價數值"})
+        return cls(frame)
+
+    @classmethod
+    def from_csv(cls, path):
+        """從匯出的 CSV 讀取（欄位為 EXPORT_COLUMNS，缺少的欄位補空字串）"""
+        frame = pd.read_csv(path, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+        for column, _ in EXPORT_COLUMNS:
+            if column not in frame:
+                frame[column] = ''
+        return cls(frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def mask(self, column, value):
+        """某分類的布林遮罩（沒有這個分類時全為 False）"""
+        masks = self.masks[column]
+        if value in masks:
+            return masks[value]
+        return pd.Series(False, index=self.frame.index)
+
+    def select(self, column, value):
+        """某分類的書籍"""
+        return self.frame[self.mask(column, value)]
+
+    def counts(self, column):
+        """各分類的書籍數（由多到少）"""
+        return self.masks[column].sum().sort_values(ascending=False, kind='stable')
+
+    @staticmethod
+    def to_export_table(frame):
+        """轉為匯出用的 ExportTable（只含匯出欄位）"""
+        columns = [column for column, _ in EXPORT_COLUMNS]
+        return ExportTable(columns, {column: frame[column].astype(str).tolist() for column in columns})
@@ -0,0 +1,312 @@
+"""
+誠品書籍分類頁面 - HTTP 抓取後端
+不啟動瀏覽器，以持久連線直接讀取伺服器端渲染的 HTML 並解析產品卡片
+"""
+
+import asyncio
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import queue
+import threading
+import zlib
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from pet_books_adaptive import FetchError, parse_retry_after
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/json;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+# 沒有結束標籤的 HTML 元素
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
+# 卡片內欄位 class 與書籍欄位的對應（與 EXTRACT_BOOKS_SCRIPT 相同）
+CARD_TEXT_FIELDS = (
+    ("product-name", "title"),
+    ("product-author", "author"),
+    ("slider-price", "price"),
+    ("discount", "discount"),
+)
+
+
+class HttpConnectionPool:
+    """依主機保留 keep-alive 連線的簡易連線池（執行緒安全）"""
+
+    def __init__(self, max_per_host=4, timeout=30, headers=None):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(self, scheme, netloc):
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.setdefault(key, queue.LifoQueue())
+        try:
+            return idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection(*key)
+
+    def _release(self, key, conn):
+        # close() 之後歸還的連線（佇列已不存在）或超過上限的連線直接關閉
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle is not None and idle.qsize() < self.max_per_host:
+                idle.put_nowait(conn)
+                return
+        conn.close()
+
+    def get(self, url, max_redirects=3, headers=None):
+        """送出 GET 請求，回傳 (狀態碼, 解壓後的內容, 回應標頭)
+
+        headers 為這次請求額外加上的標頭（例如 If-None-Match）。
+        """
+        request_headers = {**self.headers, **headers} if headers else self.headers
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            path = parts.path or "/"
+            if parts.query:
+                path = f"{path}?{parts.query}"
+
+            # 閒置太久的連線可能已被伺服器關閉，失敗時改用新連線重試一次
+            for attempt in range(2):
+                conn = self._acquire(key)
+                try:
+                    conn.request("GET", path, headers=request_headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    if attempt:
+                        raise
+
+            headers = {k.lower(): v for k, v in response.getheaders()}
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+
+            if response.status in (301, 302, 303, 307, 308) and headers.get("location"):
+                url = urljoin(url, headers["location"])
+                continue
+
+            encoding = headers.get("content-encoding", "")
+            if encoding == "gzip":
+                body = gzip.decompress(body)
+            elif encoding == "deflate":
+                body = zlib.decompress(body)
+            return response.status, body, headers
+
+        raise http.client.HTTPException(f"重新導向次數過多: {url}")
+
+    def close(self):
+        """關閉所有閒置連線"""
+        with self._lock:
+            for idle in self._idle.values():
+                while not idle.empty():
+                    idle.get_nowait().close()
+            self._idle = {}
+
+
+class ProductCardParser(HTMLParser):
+    """解析分類頁面 HTML 中的產品卡片與分頁按鈕
+
+    規則對應瀏覽器端的 EXTRACT_BOOKS_SCRIPT：卡片為 a.product-item[href*="/product/"]
+    （或 .product-card），欄位取卡片內第一個符合 class 的元素文字。
+    以開啟中的標籤堆疊處理不完整的標記：結束標籤會一併關閉其中未關閉的元素（與瀏覽器相同），
+    沒有對應開始標籤的結束標籤則忽略，未關閉的欄位元素不會讓後面的卡片併入前一張。
+    """
+
+    def __init__(self, page_url):
+        super().__init__(convert_charrefs=True)
+        self.page_url = page_url
+        self.books = []
+        self.page_numbers = []
+        self._depth = 0
+        self._open_tags = []
+        self._card = None
+        self._card_depth = 0
+        self._captures = []
+        self._pagination_depth = 0
+        self._pager = None
+
+    def handle_starttag(self, tag, attrs):
+        # <a> 不能巢狀，瀏覽器遇到新的 <a> 會先關閉前一個（漏寫 </a> 的卡片）
+        if tag == "a" and "a" in self._open_tags:
+            self.handle_endtag("a")
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+        if tag not in VOID_ELEMENTS:
+            self._depth += 1
+            self._open_tags.append(tag)
+        href = attrs.get("href") or ""
+
+        if self._card is None:
+            is_item = tag == "a" and "product-item" in classes and "/product/" in href
+            if is_item or "product-card" in classes:
+                self._card = {"href": href if tag == "a" else ""}
+                self._card_depth = self._depth
+        else:
+            card = self._card
+            if tag == "a" and not card["href"] and "/product/" in href:
+                card["href"] = href
+            if tag not in VOID_ELEMENTS:
+                capturing = {capture[0] for capture in self._captures}
+                for class_name, field in CARD_TEXT_FIELDS:
+                    if class_name in classes and field not in card and field not in capturing:
+                        self._captures.append([field, self._depth, []])
+            if "product-image" in classes and "image_title" not in card:
+                card["image_title"] = attrs.get("title") or ""
+            if "pre-price" in attrs and "originalPrice" not in card:
+                card["originalPrice"] = attrs.get("pre-price") or ""
+            if tag == "img" and "image" not in card:
+                src = attrs.get("src") or attrs.get("data-src") or ""
+                card["image"] = urljoin(self.page_url, src) if src else ""
+
+        if tag not in VOID_ELEMENTS:
+            if "pagination" in classes and not self._pagination_depth:
+                self._pagination_depth = self._depth
+            elif self._pagination_depth and tag in ("a", "button") and self._pager is None:
+                self._pager = [self._depth, []]
+
+    def handle_data(self, data):
+        for capture in self._captures:
+            capture[2].append(data)
+        if self._pager is not None:
+            self._pager[1].append(data)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS or tag not in self._open_tags:
+            return
+        while self._open_tags:
+            closed = self._open_tags.pop()
+            self._close_element()
+            if closed == tag:
+                break
+
+    def close(self):
+        super().close()
+        # 文件結束時關閉所有未關閉的元素（最後一張卡片缺少結束標籤時仍會加入）
+        while self._open_tags:
+            self._open_tags.pop()
+            self._close_element()
+
+    def _close_element(self):
+        """關閉目前深度的元素"""
+        if self._captures:
+            remaining = []
+            for field, depth, chunks in self._captures:
+                if depth == self._depth:
+                    self._card.setdefault(field, "".join(chunks).strip())
+                else:
+                    remaining.append([field, depth, chunks])
+            self._captures = remaining
+
+        if self._pager is not None and self._pager[0] == self._depth:
+            text = "".join(self._pager[1]).strip()
+            if text.isdigit():
+                self.page_numbers.append(int(text))
+            self._pager = None
+        if self._pagination_depth == self._depth:
+            self._pagination_depth = 0
+
+        if self._card is not None and self._card_depth == self._depth:
+            self._finish_card(self._card)
+            self._card = None
+            self._captures = []
+
+        self._depth -= 1
+
+    def _finish_card(self, card):
+        href = urljoin(self.page_url, card["href"]) if card["href"] else ""
+        if "/product/" not in href:
+            return
+        title = card.get("title") or card.get("image_title") or ""
+        if title and len(title) > 2:
+            self.books.append({
+                "title": title[:200],
+                "author": card.get("author", ""),
+                "price": card.get("price", "").replace("$", "").replace(",", ""),
+                "originalPrice": card.get("originalPrice", ""),
+                "discount": card["discount"] + "折" if "discount" in card else "",
+                "url": href,
+                "image": card.get("image", ""),
+            })
+
+
+def parse_listing_html(html, page_url):
+    """解析分類頁面 HTML，回傳 (書籍列表, 總頁數)"""
+    parser = ProductCardParser(page_url)
+    parser.feed(html)
+    parser.close()
+    return parser.books, max(parser.page_numbers, default=1)
+
+
+class HttpListingBackend:
+    """以 HTTP 讀取分類頁面的抓取後端
+
+    fetch_listing(url) 回傳 (書籍列表, 總頁數)；請求失敗或頁面中沒有可解析的產品卡片
+    （例如改為純前端渲染）時回傳 None，由呼叫端改用 Playwright 抓取該頁。
+    raise_errors=True 時請求失敗（連線錯誤、非 200 狀態碼）改為拋出 FetchError，
+    讓呼叫端決定是否重試；解析失敗仍回傳 None。
+    只要提供相同介面的物件都可替換本類別，例如指向本機測試伺服器的後端。
+    """
+
+    def __init__(self, pool=None, parser=parse_listing_html):
+        self.pool = pool or HttpConnectionPool()
+        self.parser = parser
+        # 預設執行緒池只有 CPU 數 + 4 個執行緒，同時進行的請求數會被限制在這裡
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.max_per_host)
+
+    def fetch_listing_sync(self, url, raise_errors=False):
+        try:
+            status, body, headers = self.pool.get(url)
+        except (http.client.HTTPException, OSError, zlib.error) as e:
+            if raise_errors:
+                raise FetchError(url, reason=str(e)) from e
+            print(f"  HTTP 抓取失敗: {url} ({e})")
+            return None
+        if status != 200:
+            if raise_errors:
+                raise FetchError(url, status, parse_retry_after(headers.get("retry-after")))
+            print(f"  HTTP 狀態碼 {status}: {url}")
+            return None
+
+        charset = "utf-8"
+        content_type = headers.get("content-type", "")
+        if "charset=" in content_type:
+            charset = content_type.split("charset=")[-1].split(";")[0].strip()
+        html = body.decode(charset, errors="replace")
+
+        try:
+            books, total_pages = self.parser(html, url)
+        except Exception as e:
+            print(f"  HTML 解析失敗: {url} ({e})")
+            return None
+        if not books:
+            return None
+        return books, total_pages
+
+    async def fetch_listing(self, url, raise_errors=False):
+        """非同步版本：在執行緒中送出請求，不阻塞事件迴圈"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.fetch_listing_sync, url, raise_errors)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.pool.close()
@@ -0,0 +1,206 @@
+"""
+誠品寵物書籍 - 封面圖片鏡像
+將書籍封面下載到本機，以內容雜湊命名去除重複，之後執行時以 ETag / Last-Modified 重新驗證
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from pet_books_catalog import now_iso
+from pet_books_http import HttpConnectionPool
+
+# 圖片存放目錄（與 index.html 同層，網頁以相對路徑讀取）
+IMAGE_DIR = "images"
+IMAGE_INDEX_FILE = "index.json"
+
+# 同時下載的圖片數
+IMAGE_CONCURRENCY = int(os.environ.get("IMAGE_CONCURRENCY", "8"))
+
+IMAGE_HEADERS = {'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'}
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif",
+    "image/svg+xml": ".svg",
+}
+
+
+def image_extension(content_type, url):
+    """依 Content-Type（或網址副檔名）決定檔案副檔名"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in CONTENT_TYPE_EXTENSIONS:
+        return CONTENT_TYPE_EXTENSIONS[content_type]
+    suffix = Path(url.split("?")[0]).suffix.lower()
+    return suffix if suffix in CONTENT_TYPE_EXTENSIONS.values() else ".img"
+
+
+class ImageMirror:
+    """封面圖片的本機鏡像
+
+    index.json 記錄每個圖片網址對應的檔案與驗證資訊：
+        {網址: {"file": 檔名, "etag": ..., "last_modified": ..., "checked_at": ...}}
+    檔名為內容的 SHA-256，相同內容（例如共用的 product-fail 預設圖）只存一份。
+    已鏡像的網址下次以條件式請求重新驗證，伺服器回 304 時不重新下載；
+    請求失敗時沿用既有檔案，從未下載成功的網址則維持原本的遠端網址。
+    """
+
+    def __init__(self, directory=IMAGE_DIR, pool=None, concurrency=IMAGE_CONCURRENCY):
+        self.directory = Path(directory)
+        self.pool = pool or HttpConnectionPool(max_per_host=concurrency, headers=IMAGE_HEADERS)
+        self.concurrency = max(1, concurrency)
+        self.entries = {}
+        self.stats = {'downloaded': 0, 'deduplicated': 0, 'not_modified': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self):
+        return self.directory / IMAGE_INDEX_FILE
+
+    @classmethod
+    def load(cls, directory=IMAGE_DIR, **kwargs):
+        mirror = cls(directory, **kwargs)
+        if mirror.index_path.exists():
+            try:
+                with open(mirror.index_path, 'r', encoding='utf-8') as f:
+                    mirror.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"圖片索引無法讀取，將重新下載: {e}")
+        return mirror
+
+    def save(self):
+        """寫回 index.json（先寫暫存檔再取代）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def local_path(self, url):
+        """已鏡像圖片的相對路徑（未鏡像回傳 None）"""
+        entry = self.entries.get(url)
+        if entry is None or not (self.directory / entry['file']).exists():
+            return None
+        return f"{self.directory.as_posix()}/{entry['file']}"
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _store(self, body, content_type, url):
+        digest = hashlib.sha256(body).hexdigest()
+        filename = digest[:20] + image_extension(content_type, url)
+        path = self.directory / filename
+        with self._lock:
+            if path.exists():
+                self.stats['deduplicated'] += 1
+            else:
+                tmp_path = path.with_name(filename + ".tmp")
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+        return filename
+
+    def fetch_sync(self, url):
+        """下載或重新驗證單一圖片，回傳是否有可用的本機檔案"""
+        entry = self.entries.get(url)
+        has_file = entry is not None and (self.directory / entry['file']).exists()
+        headers = {}
+        if has_file:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            status, body, response_headers = self.pool.get(url, headers=headers)
+        except Exception as e:
+            print(f"  圖片下載失敗: {url} ({e})")
+            self._count('failed')
+            return has_file
+
+        if status == 304 and has_file:
+            self._count('not_modified')
+            entry['checked_at'] = now_iso()
+            return True
+        if status != 200 or not body:
+            print(f"  圖片狀態碼 {status}: {url}")
+            self._count('failed')
+            return has_file
+
+        filename = self._store(body, response_headers.get('content-type'), url)
+        self.entries[url] = {
+            'file': filename,
+            'etag': response_headers.get('etag', ''),
+            'last_modified': response_headers.get('last-modified', ''),
+            'checked_at': now_iso(),
+        }
+        self._count('downloaded')
+        return True
+
+    async def mirror(self, urls):
+        """同時下載多張圖片（最多 concurrency 張），回傳 {網址: 本機相對路徑}"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        unique_urls = list(dict.fromkeys(url for url in urls if url and url.startswith("http")))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                await asyncio.to_thread(self.fetch_sync, url)
+
+        await asyncio.gather(*(fetch(url) for url in unique_urls))
+        return {url: path for url in unique_urls if (path := self.local_path(url))}
+
+    def retain(self, urls):
+        """只保留 urls 的索引紀錄（已下架書籍的封面不再重新驗證），回傳移除的網址數"""
+        keep = set(urls)
+        stale = [url for url in self.entries if url not in keep]
+        for url in stale:
+            del self.entries[url]
+        return len(stale)
+
+    def prune(self):
+        """刪除 index.json 已不再引用的圖片檔，回傳刪除數量"""
+        referenced = {entry['file'] for entry in self.entries.values()}
+        removed = 0
+        for path in self.directory.iterdir():
+            if path.is_file() and path.name != IMAGE_INDEX_FILE and path.name not in referenced:
+                path.unlink()
+                removed += 1
+        return removed
+
+    def close(self):
+        self.pool.close()
+
+    def summary(self):
+        files = len({entry['file'] for entry in self.entries.values()})
+        return (f"封面圖片: 下載 {self.stats['downloaded']} 張（其中 {self.stats['deduplicated']} 張與既有檔案相同），"
+                f"未變更 {self.stats['not_modified']} 張，失敗 {self.stats['failed']} 張；"
+                f"{len(self.entries)} 個網址共 {files} 個檔案")
+
+
+async def mirror_book_images(books, directory=IMAGE_DIR):
+    """鏡像書籍列表的封面圖片，回傳 {圖片網址: 本機相對路徑}
+
+    books 應為完整的書目：不在其中的封面會從索引移除並刪除檔案，圖片目錄只保留目前書籍的封面。
+    """
+    mirror = ImageMirror.load(directory)
+    urls = [book.get('image', '') for book in books]
+    try:
+        image_paths = await mirror.mirror(urls)
+    finally:
+        mirror.close()
+    dropped = mirror.retain(urls)
+    mirror.save()
+    removed = await asyncio.to_thread(mirror.prune)
+    print(mirror.summary())
+    if dropped or removed:
+        print(f"  移除 {dropped} 個已不使用的封面網址，刪除 {removed} 個圖片檔")
+    return image_paths
@@ -0,0 +1,115 @@
+"""
+誠品寵物書籍 - 書籍分類索引
+分類完成後建立一次：每個動物種類 / 主題分類對應一個 bitset（以 Python int 表示，
+第 i 個位元代表第 i 本書），篩選、組合條件與統計都以位元運算完成，不再重複掃描書籍列表
+"""
+
+# 建立索引的書籍欄位，以及沒有該欄位時的預設值（與 print_summary 的統計方式相同）
+INDEX_FIELDS = {
+    'animal_types': ["通用"],
+    'topics': ["其他"],
+    'categories': [],
+}
+
+# 每個位元組中為 1 的位元位置
+BYTE_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def bitset_from_positions(positions, size):
+    """由遞增的位置列表建立 bitset（先寫入 bytearray，避免逐位元建立大整數）"""
+    data = bytearray((size + 7) // 8)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def iter_positions(bits):
+    """依序產生 bitset 中為 1 的位置"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        if byte:
+            base = byte_index << 3
+            for bit in BYTE_POSITIONS[byte]:
+                yield base + bit
+
+
+class BookIndex:
+    """書籍列表的分類 bitset 索引
+
+    bits(欄位, 值) 取得單一分類的 bitset，以 & | 與 negate() 組合 AND / OR / NOT：
+
+        index = BookIndex(books)
+        cat_care = index.bits('animal_types', '貓') & index.bits('topics', '照護飼養')
+        index.books_of(cat_care & index.negate(index.bits('topics', '醫療健康')))
+
+    各分類的書籍數在建立時計算，value_counts() 直接回傳；
+    組合結果的書籍數以 count()（popcount）計算。
+    """
+
+    def __init__(self, books, fields=INDEX_FIELDS):
+        self.books = list(books)
+        self.all_bits = (1 << len(self.books)) - 1
+        self.bitsets = {}
+        self.counts = {}
+
+        for field, default in fields.items():
+            positions = {}
+            for position, book in enumerate(self.books):
+                for value in book.get(field, default):
+                    positions.setdefault(value, []).append(position)
+            self.bitsets[field] = {
+                value: bitset_from_positions(value_positions, len(self.books))
+                for value, value_positions in positions.items()
+            }
+            self.counts[field] = {value: len(value_positions)
+                                  for value, value_positions in positions.items()}
+
+    def __len__(self):
+        return len(self.books)
+
+    def bits(self, field, value):
+        """某分類的 bitset（沒有這個分類時為 0）"""
+        return self.bitsets[field].get(value, 0)
+
+    def negate(self, bits):
+        """NOT：不在 bits 中的書籍"""
+        return self.all_bits & ~bits
+
+    def match(self, all_of=(), any_of=(), none_of=()):
+        """組合條件，各參數為 [(欄位, 值), ...]
+
+        all_of 全部符合（AND）、any_of 至少符合一個（OR，空白表示不限）、
+        none_of 都不符合（NOT），回傳 bitset。
+        """
+        bits = self.all_bits
+        for field, value in all_of:
+            bits &= self.bits(field, value)
+        if any_of:
+            any_bits = 0
+            for field, value in any_of:
+                any_bits |= self.bits(field, value)
+            bits &= any_bits
+        for field, value in none_of:
+            bits &= ~self.bits(field, value)
+        return bits
+
+    @staticmethod
+    def count(bits):
+        return bits.bit_count()
+
+    def value_counts(self, field):
+        """{值: 書籍數}（依值首次出現的順序）"""
+        return dict(self.counts[field])
+
+    def books_of(self, bits, limit=None):
+        """bits 中的書籍（保持原列表順序），可只取前 limit 本"""
+        books = []
+        for position in iter_positions(bits):
+            if limit is not None and len(books) >= limit:
+                break
+            books.append(self.books[position])
+        return books
+
+    def filter(self, field, value):
+        """單一分類的書籍"""
+        return self.books_of(self.bits(field, value))
@@ -6,16 +6,22 @@
 import asyncio
 import os
 import sys
+import time
 from datetime import datetime
-from pet_books_scraper import EslitePetBooksScraper, CATEGORIES
+from pet_books_catalog import CATALOG_DB, Catalog
+from pet_books_daemon import daemon_available, submit_job
+from pet_books_export import XlsxSink
+from pet_books_scraper import TOPIC_CATEGORIES, EslitePetBooksScraper, collect_and_export
 
 try:
-    from playwright.async_api import async_playwright
-    import pandas as pd
+    from pet_books_frame import BookFrame
 except ImportError:
     print("缺少必要套件，請先執行 setup.bat 安裝")
     sys.exit(1)
 
+# 篩選結果最多顯示的書籍數
+SHOW_LIMIT = 20
+
 
 def clear_screen():
     """清除螢幕"""
@@ -40,7 +46,7 @@ def print_menu():
 def print_categories_menu():
     """顯示分類選單"""
     print("\n可用分類：")
-    categories = list(CATEGORIES.keys()) + ["其他", "全部"]
+    categories = list(TOPIC_CATEGORIES.keys()) + ["其他", "全部"]
     for i, cat in enumerate(categories, 1):
         print(f"  {i}. {cat}")
     return categories
@@ -52,11 +58,21 @@ class InteractiveBookManager:
     def __init__(self):
         self.scraper = EslitePetBooksScraper()
         self.books = []
-        self.data_file = "pet_books_data.json"
+        self.book_frame = None
+        self.catalog = Catalog(CATALOG_DB)
+
+    def reload_frame(self):
+        """從書目資料庫重新建立書籍 DataFrame 與分類遮罩"""
+        start = time.perf_counter()
+        self.book_frame = BookFrame.from_catalog(self.catalog)
+        print(f"從 {CATALOG_DB} 載入 {len(self.book_frame)} 本書籍"
+              f"（{time.perf_counter() - start:.2f} 秒）")
 
     def load_existing_data(self):
-        """載入已存在的資料"""
-        import json
+        """從書目資料庫載入資料（資料庫為空時直接讀取最新的 CSV）"""
+        if self.catalog.count():
+            self.reload_frame()
+            return True
 
         # 尋找最新的 CSV 檔案
         csv_files = [f for f in os.listdir('.') if f.startswith('pet_books_') and f.endswith('.csv')]
@@ -65,134 +81,100 @@ class InteractiveBookManager:
             print("找不到已存在的資料檔案")
             return False
 
-        # 選擇最新的檔案
-        latest_file = sorted(csv_files)[-1]
-        print(f"載入檔案: {latest_file}")
-
+        latest_file = max(csv_files, key=os.path.getmtime)
+        start = time.perf_counter()
         try:
-            df = pd.read_csv(latest_file)
-            self.books = []
-
-            for _, row in df.iterrows():
-                book = {
-                    'title': row.get('書名', ''),
-                    'author': row.get('作者', ''),
-                    'price': row.get('價格', ''),
-                    'category_str': row.get('分類', '其他'),
-                    'url': row.get('連結', ''),
-                    'image': row.get('圖片', '')
-                }
-                # 解析分類
-                book['categories'] = book['category_str'].split(', ') if book['category_str'] else ['其他']
-                self.books.append(book)
-
-            print(f"成功載入 {len(self.books)} 本書籍")
-            return True
-
+            self.book_frame = BookFrame.from_csv(latest_file)
         except Exception as e:
             print(f"載入失敗: {e}")
             return False
+        print(f"書目資料庫為空，從 {latest_file} 載入 {len(self.book_frame)} 本書籍"
+              f"（{time.perf_counter() - start:.2f} 秒）")
+        return True
 
     async def collect_books(self):
-        """收集書籍"""
-        async with async_playwright() as p:
-            print("\n正在啟動瀏覽器...")
-            browser = await p.chromium.launch(headless=True)
-
-            context = await browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
-
-            page = await context.new_page()
-
-            try:
-                print("開始收集書籍...")
-                self.books = await self.scraper.scrape_multiple_keywords(page)
-
-                if self.books:
-                    self.books = self.scraper.categorize_all_books(self.books)
-                    self.scraper.print_summary(self.books)
-
-                    # 自動儲存
-                    self.scraper.export_to_excel(self.books)
-                    self.scraper.export_to_csv(self.books)
-                else:
-                    print("未收集到任何書籍")
+        """收集書籍（常駐服務執行中時交給常駐服務，否則在本機收集）"""
+        if daemon_available():
+            print("\n常駐服務執行中，送出收集工作...")
+            payload = submit_job('collect')
+            print(f"常駐服務已收集 {payload['result']['books']} 本書籍"
+                  f"（耗時 {payload['elapsed']:.1f} 秒）")
+            self.reload_frame()
+            return
 
-            finally:
-                await browser.close()
+        print("開始收集書籍...")
+        self.books = await collect_and_export(self.scraper, source='interactive')
+        if self.books:
+            self.reload_frame()
+        else:
+            print("未收集到任何書籍")
 
     def show_statistics(self):
         """顯示統計資訊"""
-        if not self.books:
+        if self.book_frame is None or not len(self.book_frame):
             print("尚未載入任何書籍資料")
             return
 
-        self.scraper.print_summary(self.books)
+        print("\n" + "="*60)
+        print("書籍收集統計")
+        print("="*60)
+        print(f"總共收集: {len(self.book_frame)} 本書")
+        for column in ("動物種類", "主題分類"):
+            print(f"\n【{column}】")
+            for name, count in self.book_frame.counts(column).items():
+                if count:
+                    print(f"  {name}: {count} 本")
+        print("="*60)
+
+    def select_category(self, category):
+        """依主題分類選取書籍（「全部」為所有書籍）"""
+        if category == "全部":
+            return self.book_frame.frame
+        return self.book_frame.select("主題分類", category)
 
     def filter_and_show(self, category):
         """篩選並顯示特定分類的書籍"""
-        if not self.books:
+        if self.book_frame is None or not len(self.book_frame):
             print("尚未載入任何書籍資料")
             return
 
-        if category == "全部":
-            filtered = self.books
-        else:
-            filtered = [b for b in self.books if category in b.get('categories', [])]
+        filtered = self.select_category(category)
 
-        if not filtered:
+        if filtered.empty:
             print(f"沒有找到【{category}】分類的書籍")
             return
 
         print(f"\n【{category}】書籍列表 (共 {len(filtered)} 本)")
         print("-"*60)
 
-        for i, book in enumerate(filtered, 1):
-            print(f"\n{i}. {book['title'][:50]}")
-            if book.get('author'):
-                print(f"   作者: {book['author']}")
-            if book.get('price'):
-                print(f"   價格: {book['price']}")
-            print(f"   分類: {book.get('category_str', '其他')}")
+        shown = filtered.head(SHOW_LIMIT)
+        for i, (title, author, price, topics) in enumerate(
+                zip(shown["書名"], shown["作者"], shown["售價"], shown["主題分類"]), 1):
+            print(f"\n{i}. {title[:50]}")
+            if author:
+                print(f"   作者: {author}")
+            if price:
+                print(f"   價格: {price}")
+            print(f"   分類: {topics}")
 
-            if i >= 20:
-                remaining = len(filtered) - 20
-                if remaining > 0:
-                    print(f"\n... 還有 {remaining} 本書籍")
-                break
+        remaining = len(filtered) - len(shown)
+        if remaining > 0:
+            print(f"\n... 還有 {remaining} 本書籍")
 
     def export_category(self, category):
-        """匯出指定分類的書籍"""
-        if not self.books:
+        """匯出指定分類的書籍（欄位與爬蟲匯出的 Excel 相同）"""
+        if self.book_frame is None or not len(self.book_frame):
             print("尚未載入任何書籍資料")
             return
 
-        if category == "全部":
-            filtered = self.books
-            filename = f"pet_books_全部_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        else:
-            filtered = [b for b in self.books if category in b.get('categories', [])]
-            filename = f"pet_books_{category}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        filtered = self.select_category(category)
+        filename = f"pet_books_{category}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
-        if not filtered:
+        if filtered.empty:
             print(f"沒有【{category}】分類的書籍可匯出")
             return
 
-        # 匯出
-        export_data = []
-        for book in filtered:
-            export_data.append({
-                "書名": book.get('title', ''),
-                "作者": book.get('author', ''),
-                "價格": book.get('price', ''),
-                "分類": book.get('category_str', ''),
-                "連結": book.get('url', ''),
-            })
-
-        df = pd.DataFrame(export_data)
-        df.to_excel(filename, index=False, engine='openpyxl')
+        XlsxSink().write(BookFrame.to_export_table(filtered), filename)
         print(f"已匯出 {len(filtered)} 本書籍到: {filename}")
 
 
@@ -0,0 +1,151 @@
+"""
+誠品寵物書籍 - 爬取進度日誌
+每抓完一頁就把該頁的書籍附加寫入本機 JSON Lines 日誌，瀏覽器當掉或頁面逾時後
+以 --resume 重新執行時，已完成的頁面直接從日誌取得，只抓取尚未完成的頁面
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+# pet_books_scraper 與 new_books_checker 各自的日誌檔
+CRAWL_JOURNAL_FILE = "crawl_journal.jsonl"
+CHECK_JOURNAL_FILE = "check_journal.jsonl"
+
+
+class CrawlJournal:
+    """只附加寫入的爬取日誌，以分類網址 + 頁碼記錄每一頁的結果
+
+    每行一筆 JSON：
+        {"event": "start", "at": ...}                            開始新的爬取
+        {"event": "page", "url": ..., "page": 3, "books": [...]}  該頁已完成
+        {"event": "failed", "url": ..., "page": 4, "error": ...}  該頁抓取失敗
+        {"event": "aborted", "url": ..., "page": 5}               該分類從這一頁起未抓取
+        {"event": "finish", "at": ...}                            所有頁面皆已完成
+
+    每筆寫入後立即 flush 並 fsync，程式中斷時最多損失寫到一半的最後一行（讀取時略過）。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.pages = {}
+        self.failed = {}
+        self.aborted = {}
+        self.resumed_pages = 0
+        self._file = None
+
+    @classmethod
+    def open(cls, path, resume=False):
+        """開啟日誌：resume 時載入上次未完成的爬取並接著寫入，否則開始新的日誌"""
+        journal = cls(path)
+        if resume and journal.path.exists():
+            finished = journal._replay()
+            if finished:
+                print(f"上次爬取已完成，重新開始（{journal.path}）")
+                journal = cls(path)
+            else:
+                journal.resumed_pages = sum(len(pages) for pages in journal.pages.values())
+                print(f"從 {journal.path} 繼續上次的爬取：已完成 {journal.resumed_pages} 頁")
+                journal._file = open(journal.path, 'a', encoding='utf-8')
+                return journal
+        elif resume:
+            print(f"找不到 {journal.path}，從頭開始爬取")
+
+        journal._file = open(journal.path, 'w', encoding='utf-8')
+        journal._append({'event': 'start', 'at': datetime.now().isoformat(timespec='seconds')})
+        return journal
+
+    def _replay(self):
+        """讀取既有日誌，回傳最後一次爬取是否已完成"""
+        finished = False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                event = record.get('event')
+                if event == 'start':
+                    self.pages, self.failed, self.aborted = {}, {}, {}
+                    finished = False
+                elif event == 'page':
+                    self._set_page(record['url'], record['page'], record['books'])
+                elif event == 'failed':
+                    self.failed.setdefault(record['url'], {})[record['page']] = record.get('error', '')
+                elif event == 'aborted':
+                    self.aborted[record['url']] = record['page']
+                elif event == 'finish':
+                    finished = True
+        return finished
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def completed(self, url):
+        """某分類已完成的頁面 {頁碼: 書籍列表}"""
+        return dict(self.pages.get(url, {}))
+
+    def _set_page(self, url, page_number, books):
+        self.pages.setdefault(url, {})[page_number] = books
+        if self.aborted.get(url, page_number + 1) <= page_number:
+            del self.aborted[url]
+
+    def record_page(self, url, page_number, books):
+        self._set_page(url, page_number, books)
+        self._append({'event': 'page', 'url': url, 'page': page_number, 'books': books})
+
+    def record_failure(self, url, page_number, error=''):
+        self.failed.setdefault(url, {})[page_number] = str(error)
+        self._append({'event': 'failed', 'url': url, 'page': page_number, 'error': str(error)})
+
+    def record_abort(self, url, page_number):
+        """分類在 page_number 頁中止（之後的頁面未抓取）"""
+        self.aborted[url] = page_number
+        self._append({'event': 'aborted', 'url': url, 'page': page_number})
+
+    def missing_pages(self):
+        """{分類網址: 失敗後仍未完成的頁碼列表}"""
+        missing = {}
+        for url, failed in self.failed.items():
+            pages = sorted(n for n in failed if n not in self.pages.get(url, {}))
+            if pages:
+                missing[url] = pages
+        return missing
+
+    @property
+    def complete(self):
+        return not self.missing_pages() and not self.aborted
+
+    def summary(self, names=None):
+        """爬取結果摘要：完成頁數，以及缺少的頁面與中止位置"""
+        names = names or {}
+        done = sum(len(pages) for pages in self.pages.values())
+        lines = [f"爬取日誌: 完成 {done} 頁（其中 {self.resumed_pages} 頁沿用上次結果）"]
+        missing = self.missing_pages()
+        for url in sorted(set(missing) | set(self.aborted)):
+            label = names.get(url, url)
+            if url in missing:
+                lines.append(f"  [{label}] 缺少第 {', '.join(map(str, missing[url]))} 頁")
+            if url in self.aborted:
+                lines.append(f"  [{label}] 第 {self.aborted[url]} 頁起未抓取")
+        if len(lines) > 1:
+            lines.append("  以 --resume 重新執行可只補抓缺少的頁面")
+        return "\n".join(lines)
+
+    def close(self, finished=True):
+        """關閉日誌；爬取正常結束且所有頁面皆完成時寫入完成紀錄"""
+        if self._file is None:
+            return
+        if finished and self.complete:
+            self._append({'event': 'finish', 'at': datetime.now().isoformat(timespec='seconds')})
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(finished=exc_type is None)
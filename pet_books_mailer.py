@@ -0,0 +1,357 @@
+"""
+誠品寵物書籍 - 通知信發送
+信件內容只產生一次，以少量已登入的 SMTP 連線依速率限制批次發送，
+每位收件人的結果記錄在寄件匣資料庫中，失敗的下次執行再重寄
+"""
+
+import queue
+import smtplib
+import sqlite3
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from html import escape
+
+from pet_books_catalog import now_iso
+
+# 寄件匣資料庫（含訂閱者 Email，與會提交到版本庫的書目資料庫分開存放）
+OUTBOX_DB = "outbox.db"
+
+# 同一封信最多嘗試寄送的次數（跨多次執行）
+OUTBOX_MAX_ATTEMPTS = 5
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    text_body TEXT NOT NULL,
+    html_body TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outbox_deliveries (
+    message_id INTEGER NOT NULL,
+    recipient TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (message_id, recipient)
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_status ON outbox_deliveries(status);
+"""
+
+# 連線中斷類的錯誤：重新連線後重試（SMTPException 也是 OSError 的子類別，需先排除）
+RECONNECT_SMTP_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+EMAIL_STYLE = """
+            body { font-family: Arial, sans-serif; background: #f5f5f5; padding: 20px; }
+            .container { max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 20px; }
+            h1 { color: #E8913A; }
+            .book-card { border: 1px solid #ddd; border-radius: 8px; padding: 15px; margin: 15px 0; display: flex; gap: 15px; }
+            .book-card img { width: 80px; height: 120px; object-fit: cover; border-radius: 4px; }
+            .book-info h3 { margin: 0 0 8px 0; color: #333; }
+            .book-info p { margin: 4px 0; color: #666; font-size: 14px; }
+            .price { color: #e53935; font-weight: bold; font-size: 18px; }
+            .btn { display: inline-block; background: #E8913A; color: white; padding: 8px 16px; border-radius: 5px; text-decoration: none; margin-top: 10px; }
+"""
+
+
+def render_new_books_email(new_books, preference_label=""):
+    """產生新書通知信的 (主旨, 純文字內容, HTML 內容)
+
+    preference_label 為訂閱的分類（例如「貓、狗｜照護飼養」），會顯示在主旨與內文。
+    """
+    subject = f'📚 誠品寵物書籍新書通知 - {len(new_books)} 本新書上架！'
+    preference_text = ""
+    preference_html = ""
+    if preference_label:
+        subject += f'（{preference_label}）'
+        preference_text = f"您訂閱的分類：{preference_label}\n"
+        preference_html = f"<p>您訂閱的分類：{escape(preference_label)}</p>"
+
+    text_parts = [f"誠品寵物書籍有 {len(new_books)} 本新書上架！\n{preference_text}\n"]
+    for book in new_books:
+        text_parts.append(
+            f"書名：{book['title']}\n"
+            f"作者：{book['author']}\n"
+            f"售價：${book['price']}\n"
+            f"連結：{book['url']}\n\n"
+        )
+
+    html_parts = [f"""
+    <html>
+    <head>
+        <style>{EMAIL_STYLE}        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>📚 誠品寵物書籍新書通知</h1>
+            <p>有 <strong>{len(new_books)}</strong> 本新書上架！</p>
+            {preference_html}
+    """]
+    for book in new_books:
+        title = escape(book['title'])
+        html_parts.append(f"""
+            <div class="book-card">
+                <img src="{escape(book['image'])}" alt="{title}" onerror="this.style.display='none'">
+                <div class="book-info">
+                    <h3>{title}</h3>
+                    <p>作者：{escape(book['author'])}</p>
+                    <p class="price">${escape(str(book['price']))}</p>
+                    <a href="{escape(book['url'])}" class="btn">前往購買</a>
+                </div>
+            </div>
+        """)
+    html_parts.append("""
+            <p style="color: #999; font-size: 12px; margin-top: 30px;">
+                此郵件由誠品寵物書籍新書通知系統自動發送<br>
+                如需取消訂閱，請回覆此郵件
+            </p>
+        </div>
+    </body>
+    </html>
+    """)
+
+    return subject, "".join(text_parts), "".join(html_parts)
+
+
+def build_message_bytes(subject, text_body, html_body, sender):
+    """將信件編碼一次，回傳不含 To 標頭的位元組（寄送時再加上收件人）"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
+    msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    return msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+
+
+def address_message(message_bytes, recipient):
+    """在已編碼的信件前加上 To 標頭"""
+    return f"To: {recipient}\r\n".encode('utf-8') + message_bytes
+
+
+class RateLimiter:
+    """所有連線共用的發送速率限制（每分鐘最多 per_minute 封）"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(now, self._next)
+            self._next = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+
+class SmtpMailer:
+    """以少量持續連線寄送同一封信給多位收件人
+
+    pool_size 個執行緒各自維持一條已登入的 SMTP 連線，從佇列取出收件人寄送；
+    連線中斷時重新連線並重寄一次，每條連線寄出 messages_per_connection 封後換新連線。
+    smtp_factory 可替換為指向本機測試伺服器的連線方式。
+    """
+
+    def __init__(self, host, port, username="", password="", sender="", pool_size=2,
+                 per_minute=60, starttls=True, timeout=30, messages_per_connection=50,
+                 smtp_factory=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.pool_size = max(1, pool_size)
+        self.rate_limiter = RateLimiter(per_minute)
+        self.starttls = starttls
+        self.timeout = timeout
+        self.messages_per_connection = max(1, messages_per_connection)
+        self.smtp_factory = smtp_factory
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        server = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        with self._lock:
+            self.connections_opened += 1
+        return server
+
+    @staticmethod
+    def _disconnect(server):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def send_many(self, message_bytes, recipients):
+        """寄出同一封已編碼的信件，回傳 {收件人: None（成功）或錯誤訊息}"""
+        recipients = list(dict.fromkeys(recipients))
+        results = {}
+        work = queue.Queue()
+        for recipient in recipients:
+            work.put(recipient)
+
+        def worker():
+            server = None
+            sent_on_connection = 0
+            try:
+                while True:
+                    try:
+                        recipient = work.get_nowait()
+                    except queue.Empty:
+                        return
+                    if server is not None and sent_on_connection >= self.messages_per_connection:
+                        self._disconnect(server)
+                        server = None
+                    self.rate_limiter.wait()
+
+                    error = None
+                    for attempt in range(2):
+                        try:
+                            if server is None:
+                                server = self._connect()
+                                sent_on_connection = 0
+                            server.sendmail(self.sender, [recipient],
+                                            address_message(message_bytes, recipient))
+                            sent_on_connection += 1
+                            error = None
+                            break
+                        except smtplib.SMTPRecipientsRefused as e:
+                            error = f"收件人被拒絕: {e.recipients}"
+                            break
+                        except RECONNECT_SMTP_ERRORS as e:
+                            # 連線中斷：丟棄連線，重新連線後再試一次
+                            error = str(e) or e.__class__.__name__
+                            self._disconnect(server)
+                            server = None
+                        except smtplib.SMTPException as e:
+                            error = str(e) or e.__class__.__name__
+                            break
+                        except OSError as e:
+                            error = str(e) or e.__class__.__name__
+                            self._disconnect(server)
+                            server = None
+                    results[recipient] = error
+            finally:
+                self._disconnect(server)
+
+        threads = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(min(self.pool_size, len(recipients)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+class Outbox:
+    """SQLite 寄件匣
+
+    每封信（主旨與內容）存一次，收件人各自記錄狀態：pending → sent，
+    失敗時累計嘗試次數，達到 OUTBOX_MAX_ATTEMPTS 後標記為 failed 不再重寄。
+    """
+
+    def __init__(self, path=OUTBOX_DB, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.conn = sqlite3.connect(str(path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(OUTBOX_SCHEMA)
+        self.max_attempts = max_attempts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, subject, text_body, html_body, recipients):
+        """加入一封待寄的信，回傳信件 ID"""
+        created_at = now_iso()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO outbox_messages (subject, text_body, html_body, created_at) VALUES (?, ?, ?, ?)",
+                (subject, text_body, html_body, created_at))
+            message_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO outbox_deliveries (message_id, recipient, updated_at) VALUES (?, ?, ?)",
+                [(message_id, recipient, created_at) for recipient in dict.fromkeys(recipients)])
+        return message_id
+
+    def pending(self):
+        """待寄送的信件：[(信件 row, [收件人, ...]), ...]，依建立順序"""
+        rows = self.conn.execute(
+            "SELECT message_id, recipient FROM outbox_deliveries WHERE status = 'pending' "
+            "ORDER BY message_id, recipient").fetchall()
+        recipients = {}
+        for row in rows:
+            recipients.setdefault(row['message_id'], []).append(row['recipient'])
+        messages = []
+        for message_id, message_recipients in recipients.items():
+            message = self.conn.execute(
+                "SELECT * FROM outbox_messages WHERE id = ?", (message_id,)).fetchone()
+            messages.append((message, message_recipients))
+        return messages
+
+    def record_results(self, message_id, results):
+        """記錄寄送結果 {收件人: None 或錯誤訊息}"""
+        updated_at = now_iso()
+        with self.conn:
+            for recipient, error in results.items():
+                if error is None:
+                    self.conn.execute(
+                        "UPDATE outbox_deliveries SET status = 'sent', attempts = attempts + 1, "
+                        "last_error = NULL, updated_at = ? WHERE message_id = ? AND recipient = ?",
+                        (updated_at, message_id, recipient))
+                else:
+                    self.conn.execute(
+                        "UPDATE outbox_deliveries SET attempts = attempts + 1, last_error = ?, "
+                        "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END, "
+                        "updated_at = ? WHERE message_id = ? AND recipient = ?",
+                        (error, self.max_attempts, updated_at, message_id, recipient))
+
+    def counts(self):
+        """各狀態的收件人數"""
+        counts = {'pending': 0, 'sent': 0, 'failed': 0}
+        for row in self.conn.execute(
+                "SELECT status, COUNT(*) AS n FROM outbox_deliveries GROUP BY status"):
+            counts[row['status']] = row['n']
+        return counts
+
+
+def deliver_pending(outbox, mailer):
+    """寄出寄件匣中所有待寄的信，回傳 (成功數, 失敗數)"""
+    sent = failed = 0
+    for message, recipients in outbox.pending():
+        message_bytes = build_message_bytes(
+            message['subject'], message['text_body'], message['html_body'], mailer.sender)
+        started = time.monotonic()
+        results = mailer.send_many(message_bytes, recipients)
+        outbox.record_results(message['id'], results)
+
+        for recipient, error in results.items():
+            if error is None:
+                print(f"  ✅ 已發送給 {recipient}")
+                sent += 1
+            else:
+                print(f"  ❌ 發送給 {recipient} 失敗: {error}")
+                failed += 1
+        print(f"  信件 #{message['id']}: {len(recipients)} 位收件人，"
+              f"{time.monotonic() - started:.1f} 秒")
+    return sent, failed
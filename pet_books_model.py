@@ -0,0 +1,140 @@
+"""
+誠品寵物書籍 - 書籍資料模型
+分類後的書籍以 Book（__slots__）保存：分類只存一個 bitmask，
+分類名稱列表與各種字串欄位依 bitmask 在分類表中共用一份，並提供與原本 dict 相同的讀寫方式
+"""
+
+from collections.abc import Mapping
+
+# 未命中任何動物種類 / 主題分類時的預設值
+DEFAULT_ANIMAL_TYPE = "通用"
+DEFAULT_TOPIC = "其他"
+
+
+class Taxonomy:
+    """分類名稱表：bitmask 與分類名稱互轉
+
+    位元配置與 KeywordMatcher 相同：動物種類在低位，主題分類接在後面。
+    同一個 bitmask 的名稱 tuple 與字串只建立一次，所有書籍共用。
+    """
+
+    def __init__(self, animal_names, topic_names):
+        self.animal_names = list(animal_names)
+        self.topic_names = list(topic_names)
+        self.bits = {name: 1 << bit for bit, name in enumerate(self.animal_names)}
+        offset = len(self.animal_names)
+        self.topic_bits = {name: 1 << (offset + bit) for bit, name in enumerate(self.topic_names)}
+        self._labels = {}
+
+    def encode(self, animal_types, topics):
+        """分類名稱 → bitmask（預設值與未知名稱不佔位元）"""
+        mask = 0
+        for name in animal_types:
+            mask |= self.bits.get(name, 0)
+        for name in topics:
+            mask |= self.topic_bits.get(name, 0)
+        return mask
+
+    def labels(self, mask):
+        """bitmask → 書籍的分類欄位 {欄位: 值}（同一個 bitmask 共用同一份）"""
+        labels = self._labels.get(mask)
+        if labels is None:
+            offset = len(self.animal_names)
+            animal_types = tuple(name for bit, name in enumerate(self.animal_names)
+                                 if mask >> bit & 1) or (DEFAULT_ANIMAL_TYPE,)
+            topics = tuple(name for bit, name in enumerate(self.topic_names)
+                           if mask >> (offset + bit) & 1) or (DEFAULT_TOPIC,)
+            topic_str = ", ".join(topics)
+            labels = self._labels[mask] = {
+                'animal_types': animal_types,
+                'topics': topics,
+                'categories': topics,
+                'animal_type_str': ", ".join(animal_types),
+                'topic_str': topic_str,
+                'category_str': topic_str,
+                'combined_category': ", ".join(
+                    f"{animal}-{topic}" for animal in animal_types for topic in topics),
+            }
+        return labels
+
+
+class Book(Mapping):
+    """分類後的書籍
+
+    基本欄位直接存在 slot 中，分類欄位（animal_types、topic_str、combined_category ...）
+    由 category_mask 查 Taxonomy 取得；其他欄位存在 extra。
+    可像 dict 一樣以 book['title'] / book.get() / 'topics' in book 讀取，
+    指定 animal_types 或 topics 時會更新 bitmask。
+    """
+
+    __slots__ = ('title', 'author', 'price', 'originalPrice', 'discount', 'url', 'image',
+                 'category_mask', 'taxonomy', 'extra')
+
+    FIELDS = ('title', 'author', 'price', 'originalPrice', 'discount', 'url', 'image')
+    CATEGORY_FIELDS = ('animal_types', 'topics', 'categories', 'animal_type_str', 'topic_str',
+                       'category_str', 'combined_category')
+
+    def __init__(self, taxonomy, category_mask=0, title='', author='', price='',
+                 originalPrice='', discount='', url='', image='', extra=None):
+        self.taxonomy = taxonomy
+        self.category_mask = category_mask
+        self.title = title
+        self.author = author
+        self.price = price
+        self.originalPrice = originalPrice
+        self.discount = discount
+        self.url = url
+        self.image = image
+        self.extra = extra or None
+
+    @classmethod
+    def from_mapping(cls, book, category_mask, taxonomy):
+        """由爬蟲的書籍 dict 建立（dict 中舊的分類欄位會被捨棄）"""
+        extra = {key: value for key, value in book.items()
+                 if key not in cls.FIELDS and key not in cls.CATEGORY_FIELDS}
+        fields = {field: book[field] for field in cls.FIELDS if field in book}
+        return cls(taxonomy, category_mask, extra=extra, **fields)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if key in self.CATEGORY_FIELDS:
+            return self.taxonomy.labels(self.category_mask)[key]
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        elif key == 'animal_types':
+            self.category_mask = self.taxonomy.encode(value, self['topics'])
+        elif key in ('topics', 'categories'):
+            self.category_mask = self.taxonomy.encode(self['animal_types'], value)
+        elif key in self.CATEGORY_FIELDS:
+            raise KeyError(f"{key} 由 animal_types / topics 產生，不能直接指定")
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __iter__(self):
+        yield from self.FIELDS
+        yield from self.CATEGORY_FIELDS
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return len(self.FIELDS) + len(self.CATEGORY_FIELDS) + len(self.extra or ())
+
+    def __repr__(self):
+        return f"Book({self.title!r}, {self['combined_category']!r})"
+
+    def to_dict(self):
+        return dict(self.items())
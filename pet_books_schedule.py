@@ -0,0 +1,249 @@
+"""
+誠品寵物書籍 - 多分類爬取排程
+多個分類的分頁放進同一個工作佇列，由共用的 worker 以 HTTP 抓取，所有請求依主機共用速率上限；
+跨分類重複出現的商品只保留一筆，並記錄來源分類
+"""
+
+import asyncio
+import os
+import time
+from urllib.parse import urlsplit
+
+from pet_books_adaptive import AdaptiveConcurrency, retry_with_backoff
+from pet_books_catalog import parse_product_id
+from pet_books_crawler import build_page_url
+
+# 誠品寵物書籍分類頁面
+PET_CATEGORY_URL = "https://www.eslite.com/category/3/123"
+
+# 要爬取的分類，格式為「名稱=網址」並以逗號分隔，例如
+#   CRAWL_CATEGORIES="寵物=https://www.eslite.com/category/3/123,水族=https://www.eslite.com/category/..."
+# 只寫網址時以網址路徑作為名稱；未設定時只爬取寵物分類
+CRAWL_CATEGORIES_ENV = os.environ.get("CRAWL_CATEGORIES", "")
+
+# 起始的同時抓取頁數（之後由 AdaptiveConcurrency 依延遲與錯誤調整），
+# 以及每個主機每秒最多送出的請求數（與可累積的突發量）
+CRAWL_WORKERS = int(os.environ.get("CRAWL_WORKERS", "6"))
+HOST_RATE_PER_SECOND = float(os.environ.get("HOST_RATE_PER_SECOND", "4"))
+HOST_BURST = int(os.environ.get("HOST_BURST", "4"))
+
+
+def parse_categories(value, default_url=PET_CATEGORY_URL):
+    """解析分類設定，回傳 [(名稱, 網址), ...]（名稱不重複）"""
+    categories = {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, url = item.partition("=")
+        if not separator or name.startswith("http"):
+            name, url = urlsplit(item).path.strip("/"), item
+        categories.setdefault(name.strip(), url.strip())
+    return list(categories.items()) or [("寵物", default_url)]
+
+
+CRAWL_CATEGORIES = parse_categories(CRAWL_CATEGORIES_ENV)
+
+
+class HostRateLimiter:
+    """每個主機一個 token bucket：每秒補充 rate 個請求額度，最多累積 burst 個
+
+    rate 小於等於 0 時不限速。
+    """
+
+    def __init__(self, rate=HOST_RATE_PER_SECOND, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.requests = {}
+        self.waited = 0.0
+        self._buckets = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, url):
+        """等到 url 的主機有請求額度為止"""
+        host = urlsplit(url).netloc
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                tokens, updated = self._buckets.get(host, (self.burst, now))
+                if self.rate > 0:
+                    tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                if self.rate <= 0 or tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    self.requests[host] = self.requests.get(host, 0) + 1
+                    return
+                self._buckets[host] = (tokens, now)
+                delay = (1 - tokens) / self.rate
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+
+class CrawlScheduler:
+    """多分類的分頁排程
+
+    先把每個分類的第 1 頁放進佇列，取得總頁數後再把其餘分頁加入同一個佇列，
+    worker 不分分類依序抓取，每個請求前先向 HostRateLimiter 取得額度。
+    增加分類會增加可同時抓取的頁面，總請求速率仍受主機上限控制。
+
+    同時進行的請求數由 controller（AdaptiveConcurrency，預設從 workers 開始）依延遲與
+    錯誤 / 429 比例調整；連線錯誤、429 與 5xx 以帶抖動的指數退避重試，重試仍失敗的頁面視為解析失敗。
+
+    backend 需提供 async fetch_listing(url, raise_errors=True) → (書籍列表, 總頁數) 或 None，
+    請求失敗時拋出 FetchError（同 HttpListingBackend）。
+    run() 回傳 {分類名稱: {頁碼: 書籍列表}}，解析失敗的頁面為 None；
+    第 1 頁就失敗的分類為 {}，由呼叫端改用瀏覽器。
+
+    傳入 journal（CrawlJournal）時每頁結果寫入日誌，日誌中已完成的頁面不再抓取
+    （第 1 頁仍會抓取以取得總頁數）。
+
+    run(should_stop) 為增量模式：各分類依頁碼順序每次只把 stop_batch 頁加入佇列，
+    這一批的結果都取得並檢查停止條件後才加入下一批，不會在條件成立前多抓後面的頁面。
+    """
+
+    def __init__(self, backend, categories, workers=CRAWL_WORKERS, limiter=None, max_pages=50,
+                 journal=None, controller=None, stop_batch=1):
+        self.backend = backend
+        self.categories = list(categories)
+        self.controller = controller or AdaptiveConcurrency(initial=workers, label="同時抓取頁數")
+        self.workers = self.controller.maximum
+        self.limiter = limiter or HostRateLimiter()
+        self.max_pages = max_pages
+        self.journal = journal
+        self.stop_batch = max(1, stop_batch)
+        self.total_pages = {}
+        self.skipped = {}
+        self.elapsed = 0.0
+        self._pending = {}
+        self._in_batch = {}
+
+    async def _fetch(self, url):
+        try:
+            return await retry_with_backoff(
+                lambda: self.backend.fetch_listing(url, raise_errors=True), url,
+                controller=self.controller, before_attempt=lambda: self.limiter.acquire(url))
+        except Exception as e:
+            print(f"  HTTP 抓取失敗: {url} ({e})")
+            return None
+
+    async def run(self, should_stop=None):
+        """抓取所有分類；傳入 should_stop(page_results) 時，條件成立的分類不再抓取後面的頁面"""
+        started = time.monotonic()
+        results = {name: {} for name, _ in self.categories}
+        queue = asyncio.Queue()
+        for name, url in self.categories:
+            queue.put_nowait((name, url, 1))
+
+        async def worker():
+            while True:
+                name, url, page_number = await queue.get()
+                try:
+                    page_results = results[name]
+                    result = await self._fetch(build_page_url(url, page_number))
+                    if page_number == 1:
+                        self._start_category(name, url, result, results, queue, should_stop)
+                        continue
+                    if result is None:
+                        print(f"  [{name}] 第 {page_number} 頁 HTTP 解析失敗，稍後改用瀏覽器")
+                        page_results[page_number] = None
+                        if self.journal is not None:
+                            self.journal.record_failure(url, page_number, "HTTP 解析失敗")
+                    else:
+                        page_results[page_number] = result[0]
+                        if self.journal is not None:
+                            self.journal.record_page(url, page_number, result[0])
+                    if should_stop is not None:
+                        self._in_batch[name] -= 1
+                        if not self._in_batch[name]:
+                            self._next_batch(name, url, page_results, queue, should_stop)
+                finally:
+                    queue.task_done()
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.elapsed = time.monotonic() - started
+        for name, count in self.skipped.items():
+            if count:
+                print(f"  [{name}] 抓取到第 {max(results[name])} 頁即停止")
+        return results
+
+    def _start_category(self, name, url, result, results, queue, should_stop=None):
+        """處理分類第 1 頁：記錄結果並把其餘分頁加入佇列（增量模式只加入第一批）"""
+        if result is None:
+            print(f"  [{name}] HTTP 無法解析第 1 頁，改用瀏覽器")
+            return
+        # 沒有分頁按鈕時總頁數為 1，第 1 頁的結果即為整個分類
+        books, total_pages = result
+        total_pages = min(total_pages, self.max_pages)
+        print(f"  [{name}] 共 {total_pages} 頁")
+        self.total_pages[name] = total_pages
+        results[name][1] = books
+        completed = {}
+        if self.journal is not None:
+            self.journal.record_page(url, 1, books)
+            completed = self.journal.completed(url)
+        pending = []
+        for page_number in range(2, total_pages + 1):
+            if page_number in completed:
+                results[name][page_number] = completed[page_number]
+            else:
+                pending.append(page_number)
+
+        if should_stop is None:
+            for page_number in pending:
+                queue.put_nowait((name, url, page_number))
+        else:
+            self._pending[name] = pending
+            self._next_batch(name, url, results[name], queue, should_stop)
+
+    def _next_batch(self, name, url, page_results, queue, should_stop):
+        """增量模式：停止條件不成立時依頁碼順序加入下一批分頁"""
+        pending = self._pending.get(name) or []
+        if not pending:
+            return
+        if should_stop(page_results):
+            self.skipped[name] = len(pending)
+            self._pending[name] = []
+            return
+        batch, self._pending[name] = pending[:self.stop_batch], pending[self.stop_batch:]
+        self._in_batch[name] = len(batch)
+        for page_number in batch:
+            queue.put_nowait((name, url, page_number))
+
+    def summary(self):
+        pages = sum(self.total_pages.values())
+        requests = sum(self.limiter.requests.values())
+        rate = f"{self.limiter.rate:g} 次/秒" if self.limiter.rate > 0 else "不限"
+        return (f"多分類排程: {len(self.categories)} 個分類共 {pages} 頁，{requests} 次請求，"
+                f"每主機 {rate}（限速等待累計 {self.limiter.waited:.1f} 秒），耗時 {self.elapsed:.1f} 秒\n"
+                f"{self.controller.summary()}")
+
+
+def merge_category_books(category_books, categories):
+    """合併各分類的書籍並以商品 ID 去重
+
+    category_books 為 {分類名稱: 書籍列表}，依 categories 的順序合併；
+    每本書加上 source_category（出現過的分類名稱，以「, 」分隔，依 categories 順序）。
+    回傳 (書籍列表, 重複數)。
+    """
+    merged = {}
+    sources = {}
+    duplicates = 0
+    for name, _ in categories:
+        for book in category_books.get(name) or []:
+            product_id = parse_product_id(book.get('url') or book.get('link'))
+            if product_id in merged:
+                duplicates += 1
+            else:
+                merged[product_id] = book
+                sources[product_id] = []
+            if name not in sources[product_id]:
+                sources[product_id].append(name)
+    for product_id, book in merged.items():
+        book['source_category'] = ", ".join(sources[product_id])
+    return list(merged.values()), duplicates
@@ -4,11 +4,36 @@
 """
 
 import asyncio
+import os
 import re
+import sys
 import json
+import time
 from datetime import datetime
 from playwright.async_api import async_playwright
-import pandas as pd
+
+from pet_books_adaptive import (
+    CRAWL_MAX_CONCURRENCY, THROTTLE_STATUSES, AdaptiveConcurrency, FetchError, parse_retry_after,
+    retry_with_backoff,
+)
+from pet_books_cache import CATEGORY_CACHE_FILE, CategoryCache, taxonomy_hash
+from pet_books_catalog import CATALOG_DB, Catalog
+from pet_books_crawler import (
+    BROWSER_RETRYABLE_ERRORS, MAX_CONSECUTIVE_FAILURES, PagePool, ResourcePolicy, build_page_url, extract_product_cards,
+    format_wait_summary, get_total_pages, wait_for_product_grid,
+)
+from pet_books_export import (
+    BOOKS_DATA_JS, CATALOG_DATA_DIR, BooksDataJsSink, CsvSink, ExportTable, JsonLinesSink,
+    ShardedCatalogSink, XlsxSink, format_export_report, run_export,
+)
+from pet_books_http import HttpConnectionPool, HttpListingBackend
+from pet_books_images import mirror_book_images
+from pet_books_index import BookIndex
+from pet_books_journal import CRAWL_JOURNAL_FILE, CrawlJournal
+from pet_books_model import Book, Taxonomy
+from pet_books_schedule import (
+    CRAWL_CATEGORIES, PET_CATEGORY_URL, CrawlScheduler, merge_category_books,
+)
 
 
 # ===== 動物種類分類 =====
@@ -121,139 +146,210 @@ TOPIC_CATEGORIES = {
     ],
 }
 
-# 保留舊的 CATEGORIES 供相容性（合併動物和主題）
-CATEGORIES = {**{k: v for k, v in TOPIC_CATEGORIES.items()}}
+class KeywordMatcher:
+    """動物種類與主題分類共用的關鍵字比對器，每本書只掃描一次文字
+
+    以所有關鍵字的首字組成單一字元集合正規表示式找出候選位置，每個位置只比對
+    以該字開頭的關鍵字（由長到短）。命中最長的關鍵字時，同位置較短的前綴關鍵字
+    也必定命中，因此預先把前綴關鍵字的分類併入。分類以 bitmask 累計，輸出順序
+    與 ANIMAL_TYPES / TOPIC_CATEGORIES 的定義順序相同（與逐一比對的結果一致）。
+    """
+
+    def __init__(self, animal_types=None, topic_categories=None):
+        animal_types = ANIMAL_TYPES if animal_types is None else animal_types
+        topic_categories = TOPIC_CATEGORIES if topic_categories is None else topic_categories
+        self.animal_names = list(animal_types.keys())
+        self.topic_names = list(topic_categories.keys())
+
+        # 關鍵字 → 分類 bitmask（動物種類在低位，主題分類接在後面）
+        keyword_masks = {}
+        categories = list(animal_types.values()) + list(topic_categories.values())
+        for bit, keywords in enumerate(categories):
+            for keyword in keywords:
+                keyword = keyword.lower()
+                keyword_masks[keyword] = keyword_masks.get(keyword, 0) | (1 << bit)
+
+        self.keyword_masks = {}
+        for keyword in keyword_masks:
+            mask = 0
+            for end in range(1, len(keyword) + 1):
+                mask |= keyword_masks.get(keyword[:end], 0)
+            self.keyword_masks[keyword] = mask
+
+        self.keywords_by_first = {}
+        for keyword in sorted(keyword_masks, key=len, reverse=True):
+            self.keywords_by_first.setdefault(keyword[0], []).append(keyword)
+        self.first_char_pattern = re.compile(
+            "[" + "".join(re.escape(c) for c in self.keywords_by_first) + "]"
+        )
+        self._decoded = {}
+
+    @staticmethod
+    def book_text(book):
+        """比對用的文字（書名 + 作者，轉小寫）"""
+        return f"{book.get('title', '')} {book.get('author', '')}".lower()
+
+    def match_mask(self, text):
+        """回傳 text 命中的分類 bitmask"""
+        mask = 0
+        for m in self.first_char_pattern.finditer(text):
+            start = m.start()
+            for keyword in self.keywords_by_first[m.group()]:
+                if text.startswith(keyword, start):
+                    mask |= self.keyword_masks[keyword]
+                    break
+        return mask
+
+    def decode(self, mask):
+        """bitmask 轉為 (動物種類列表, 主題分類列表)，不含「通用」/「其他」預設值"""
+        decoded = self._decoded.get(mask)
+        if decoded is None:
+            animal_count = len(self.animal_names)
+            animals = [name for bit, name in enumerate(self.animal_names) if mask >> bit & 1]
+            topics = [name for bit, name in enumerate(self.topic_names)
+                      if mask >> (animal_count + bit) & 1]
+            decoded = self._decoded[mask] = (animals, topics)
+        return decoded
+
+    def match(self, book):
+        """回傳書籍命中的 (動物種類列表, 主題分類列表)"""
+        return self.decode(self.match_mask(self.book_text(book)))
+
 
-# 誠品寵物書籍分類頁面
-PET_CATEGORY_URL = "https://www.eslite.com/category/3/123"
+# 改用就緒等待前每頁固定等待的秒數（5 秒渲染 + 2 秒捲動），用於比較
+FIXED_PAGE_DELAY = 7
+
+# 同時開啟的分頁數（並行爬取）
+PAGE_POOL_SIZE = int(os.environ.get("PAGE_POOL_SIZE", "4"))
+
+# 分類頁面抓取方式：http（先以 HTTP 解析，失敗的頁面改用瀏覽器）或 browser
+FETCH_BACKEND = os.environ.get("FETCH_BACKEND", "http")
+
+# 是否將封面圖片下載到本機（網頁改用本機圖片）；images/ 不提交到版本庫，
+# 只在網站與 images/ 一起部署時開啟，預設網頁仍使用誠品的圖片網址
+MIRROR_IMAGES = os.environ.get("MIRROR_IMAGES", "0") == "1"
+
+# Excel 分類工作表：(欄名, 分類名稱, 工作表名稱格式)
+EXPORT_SHEET_GROUPS = [
+    ("動物種類", list(ANIMAL_TYPES.keys()) + ["通用"], "【{}】"),
+    ("主題分類", list(TOPIC_CATEGORIES.keys()) + ["其他"], "主題-{}"),
+]
 
 
 class EslitePetBooksScraper:
     """誠品寵物書籍爬蟲類別"""
 
-    def __init__(self):
+    def __init__(self, category_url=PET_CATEGORY_URL, journal=None):
         self.books = []
         self.base_url = "https://www.eslite.com"
+        self.category_url = category_url
+        self.journal = journal
+        self.matcher = KeywordMatcher()
+        self.taxonomy = Taxonomy(self.matcher.animal_names, self.matcher.topic_names)
+        self.page_wait_times = {}
+        self._book_index = None
+        self._indexed_books = None
+
+    async def _load_listing_page(self, page, url, page_number=None):
+        """載入分類頁面並等待產品卡片渲染完成，回傳實際等待秒數
+
+        伺服器回應 429 / 503 時拋出 FetchError，由 retry_with_backoff 退避後重試。
+        """
+        response = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+        if response is not None and response.status in THROTTLE_STATUSES:
+            raise FetchError(url, response.status, parse_retry_after(response.headers.get("retry-after")))
+
+        # 等待卡片出現並捲動到底部，直到卡片數量穩定
+        waited = await wait_for_product_grid(page)
+        self.page_wait_times[page_number or url] = waited
+        return waited
+
+    async def _extract_books(self, page):
+        """抓取目前頁面上的書籍"""
+        return await extract_product_cards(page)
+
+    async def _load_and_extract(self, page, url, page_number):
+        """載入分類頁面並抓取書籍（重試時整個重做）"""
+        await self._load_listing_page(page, url, page_number)
+        return await self._extract_books(page)
+
+    def _merge_books(self, books, seen_urls, all_books):
+        """去重並加入，回傳本頁新增數量"""
+        page_new_count = 0
+        for book in books:
+            if book['url'] not in seen_urls and book['title']:
+                seen_urls.add(book['url'])
+                all_books.append(book)
+                page_new_count += 1
+        return page_new_count
+
+    def _completed_pages(self):
+        """爬取日誌中本分類已完成的頁面（沒有日誌時為空）"""
+        return self.journal.completed(self.category_url) if self.journal is not None else {}
+
+    def _journal_page(self, page_number, books):
+        if self.journal is not None:
+            self.journal.record_page(self.category_url, page_number, books)
+
+    def _journal_failure(self, page_number, error):
+        if self.journal is not None:
+            self.journal.record_failure(self.category_url, page_number, error)
+
+    def _journal_abort(self, page_number):
+        if self.journal is not None:
+            self.journal.record_abort(self.category_url, page_number)
+
+    async def scrape_category_page(self, page, max_pages=50, concurrency=1):
+        """爬取寵物分類頁面的所有書籍（支援分頁）
+
+        concurrency 大於 1 時改用並行模式，見 scrape_category_page_concurrent。
+        有爬取日誌（journal）時，日誌中已完成的頁面直接沿用；載入失敗的頁面以指數退避重試，
+        仍失敗時記錄後略過，連續 MAX_CONSECUTIVE_FAILURES 頁失敗才停止。
+        """
+        if concurrency > 1:
+            return await self.scrape_category_page_concurrent(page, max_pages, concurrency)
 
-    async def scrape_category_page(self, page, max_pages=50):
-        """爬取寵物分類頁面的所有書籍（支援分頁）"""
         all_books = []
         seen_urls = set()
         current_page = 1
+        failures = 0
+        completed = self._completed_pages()
+        self.page_wait_times = {}
 
-        print(f"正在爬取分類頁面: {PET_CATEGORY_URL}")
+        print(f"正在爬取分類頁面: {self.category_url}")
 
         while current_page <= max_pages:
             # 構建分頁 URL
-            if current_page == 1:
-                url = PET_CATEGORY_URL
-            else:
-                url = f"{PET_CATEGORY_URL}?page={current_page}"
+            url = build_page_url(self.category_url, current_page)
 
-            print(f"\n正在訪問第 {current_page} 頁: {url}")
-
-            try:
-                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                await asyncio.sleep(5)  # 等待 JavaScript 渲染
-
-                # 滾動頁面確保所有內容載入
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(2)
-
-            except Exception as e:
-                print(f"  載入頁面失敗: {e}")
-                break
-
-            # 抓取目前頁面上的書籍
-            books = await page.evaluate("""
-                () => {
-                    const books = [];
-
-                    // 找所有產品卡片
-                    const productCards = document.querySelectorAll('a.product-item[href*="/product/"]');
-
-                    productCards.forEach(card => {
-                        try {
-                            const href = card.href || '';
-                            if (!href.includes('/product/')) return;
-
-                            // 取得書名 - 使用 product-name class
-                            let title = '';
-                            const nameEl = card.querySelector('.product-name');
-                            if (nameEl) {
-                                title = nameEl.textContent.trim();
-                            }
-                            // 備用：從 title 屬性取得
-                            if (!title) {
-                                const imgWrap = card.querySelector('.product-image');
-                                if (imgWrap) {
-                                    title = imgWrap.getAttribute('title') || '';
-                                }
-                            }
-
-                            // 取得作者 - 使用 product-author class
-                            let author = '';
-                            const authorEl = card.querySelector('.product-author');
-                            if (authorEl) {
-                                author = authorEl.textContent.trim();
-                            }
-
-                            // 取得價格 - 使用 slider-price class (折後價)
-                            let price = '';
-                            let originalPrice = '';
-                            let discount = '';
-
-                            const priceEl = card.querySelector('.slider-price');
-                            if (priceEl) {
-                                price = priceEl.textContent.trim();
-                            }
-
-                            // 取得折扣
-                            const discountEl = card.querySelector('.discount');
-                            if (discountEl) {
-                                discount = discountEl.textContent.trim() + '折';
-                            }
-
-                            // 取得原價 (從 pre-price 屬性)
-                            const priceWrap = card.querySelector('[pre-price]');
-                            if (priceWrap) {
-                                originalPrice = priceWrap.getAttribute('pre-price') || '';
-                            }
-
-                            // 取得圖片
-                            let image = '';
-                            const imgEl = card.querySelector('img');
-                            if (imgEl) {
-                                image = imgEl.src || imgEl.dataset.src || '';
-                            }
-
-                            if (title && title.length > 2) {
-                                books.push({
-                                    title: title.substring(0, 200),
-                                    author: author,
-                                    price: price,
-                                    originalPrice: originalPrice,
-                                    discount: discount,
-                                    url: href,
-                                    image: image
-                                });
-                            }
-                        } catch (e) {}
-                    });
-
-                    return books;
-                }
-            """)
-
-            # 去重並加入
-            page_new_count = 0
-            for book in books:
-                if book['url'] not in seen_urls and book['title']:
-                    seen_urls.add(book['url'])
-                    all_books.append(book)
-                    page_new_count += 1
-
-            print(f"  第 {current_page} 頁收集: {page_new_count} 本新書，累計: {len(all_books)} 本")
+            if current_page in completed:
+                books = completed[current_page]
+                waited = "沿用爬取日誌"
+            else:
+                print(f"\n正在訪問第 {current_page} 頁: {url}")
+                try:
+                    books = await retry_with_backoff(
+                        lambda: self._load_and_extract(page, url, current_page), f"第 {current_page} 頁",
+                        retry_on=BROWSER_RETRYABLE_ERRORS)
+                except Exception as e:
+                    # 記錄失敗的頁面並繼續下一頁，連續失敗才停止
+                    print(f"  載入頁面失敗: {e}")
+                    self._journal_failure(current_page, e)
+                    failures += 1
+                    current_page += 1
+                    if failures >= MAX_CONSECUTIVE_FAILURES:
+                        print(f"  連續 {failures} 頁載入失敗，停止爬取")
+                        self._journal_abort(current_page)
+                        break
+                    continue
+                self._journal_page(current_page, books)
+                waited = f"等待 {self.page_wait_times[current_page]:.1f} 秒"
+            failures = 0
+
+            page_new_count = self._merge_books(books, seen_urls, all_books)
+
+            print(f"  第 {current_page} 頁收集: {page_new_count} 本新書，累計: {len(all_books)} 本"
+                  f"（{waited}）")
 
             # 如果這一頁沒有新書，表示已經到最後了
             if page_new_count == 0:
@@ -264,82 +360,149 @@ class EslitePetBooksScraper:
             current_page += 1
 
         print(f"\n分類頁面共收集: {len(all_books)} 本書")
+        print(format_wait_summary(self.page_wait_times, FIXED_PAGE_DELAY))
         return all_books
 
-    async def _scroll_page(self, page, scroll_times=5):
-        """滾動頁面以載入更多內容"""
-        for i in range(scroll_times):
-            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            await asyncio.sleep(1)
-            print(f"  滾動頁面 {i+1}/{scroll_times}")
-
-    def categorize_animal_type(self, book):
-        """根據書名判斷動物種類"""
-        text = f"{book.get('title', '')} {book.get('author', '')}".lower()
-
-        matched_types = []
-        for animal_type, keywords in ANIMAL_TYPES.items():
-            for keyword in keywords:
-                if keyword.lower() in text:
-                    if animal_type not in matched_types:
-                        matched_types.append(animal_type)
-                    break
+    async def scrape_category_page_concurrent(self, page, max_pages=50, pool_size=4):
+        """並行爬取分類頁面
 
-        return matched_types if matched_types else ["通用"]
+        先用第 1 頁判斷總頁數，其餘分頁（爬取日誌中已完成的除外）交給同一個 context 內的分頁池抓取，
+        最後依頁碼順序合併並以 URL 去重（與逐頁模式的 seen_urls 規則相同）。
+        """
+        print(f"正在爬取分類頁面: {self.category_url}（並行 {pool_size} 個分頁）")
+        self.page_wait_times = {}
 
-    def categorize_topic(self, book):
-        """根據書名判斷主題分類"""
-        text = f"{book.get('title', '')} {book.get('author', '')}".lower()
+        try:
+            await retry_with_backoff(
+                lambda: self._load_listing_page(page, self.category_url, 1), "第 1 頁",
+                retry_on=BROWSER_RETRYABLE_ERRORS)
+        except Exception as e:
+            print(f"  載入頁面失敗: {e}")
+            self._journal_failure(1, e)
+            self._journal_abort(2)
+            return []
+
+        total_pages = min(await get_total_pages(page), max_pages)
+        if total_pages <= 1:
+            print("  無法判斷總頁數，改用逐頁模式")
+            return await self.scrape_category_page(page, max_pages)
+
+        print(f"  共 {total_pages} 頁")
+        page_results = self._completed_pages()
+        page_results[1] = await self._extract_books(page)
+        self._journal_page(1, page_results[1])
+        if len(page_results) > 1:
+            print(f"  沿用爬取日誌中的 {len(page_results) - 1} 頁")
+        page_results.update(await self.scrape_pages_with_browser(
+            page.context, [n for n in range(2, total_pages + 1) if n not in page_results], pool_size))
+
+        all_books = self.merge_page_results(page_results)
+        print(f"\n分類頁面共收集: {len(all_books)} 本書")
+        print(format_wait_summary(self.page_wait_times, FIXED_PAGE_DELAY))
+        return all_books
 
-        matched_topics = []
-        for topic, keywords in TOPIC_CATEGORIES.items():
-            for keyword in keywords:
-                if keyword.lower() in text:
-                    if topic not in matched_topics:
-                        matched_topics.append(topic)
-                    break
+    async def scrape_pages_with_browser(self, context, page_numbers, pool_size=4):
+        """以分頁池抓取指定頁碼，回傳 {頁碼: 書籍列表}（重試後仍載入失敗的頁面為 None）
 
-        return matched_topics if matched_topics else ["其他"]
+        同時載入的分頁數由 AdaptiveConcurrency 在 1 到 pool_size 之間依延遲與錯誤調整。
+        """
+        page_numbers = list(page_numbers)
+        if not page_numbers:
+            return {}
 
-    def categorize_book(self, book):
-        """根據書名和作者判斷書籍分類（相容舊版）"""
-        return self.categorize_topic(book)
+        pool_size = min(pool_size, len(page_numbers))
+        controller = AdaptiveConcurrency(initial=pool_size, maximum=pool_size, label="同時載入分頁數")
 
-    def categorize_all_books(self, books):
-        """為所有書籍進行雙層分類"""
-        for book in books:
-            # 動物種類
-            book['animal_types'] = self.categorize_animal_type(book)
-            book['animal_type_str'] = ", ".join(book['animal_types'])
+        async def fetch(pool_page, page_number):
+            url = build_page_url(self.category_url, page_number)
+            try:
+                books = await retry_with_backoff(
+                    lambda: self._load_and_extract(pool_page, url, page_number), f"第 {page_number} 頁",
+                    controller=controller, retry_on=BROWSER_RETRYABLE_ERRORS)
+            except Exception as e:
+                print(f"  第 {page_number} 頁載入失敗: {e}")
+                self._journal_failure(page_number, e)
+                return None
+            self._journal_page(page_number, books)
+            print(f"  第 {page_number} 頁取得 {len(books)} 本（等待 {self.page_wait_times[page_number]:.1f} 秒）")
+            return books
+
+        pool = PagePool(context, pool_size)
+        await pool.open()
+        try:
+            results = await pool.map(page_numbers, fetch)
+        finally:
+            await pool.close()
+        print(controller.summary())
+        return dict(zip(page_numbers, results))
 
-            # 主題分類
-            book['topics'] = self.categorize_topic(book)
-            book['topic_str'] = ", ".join(book['topics'])
+    def merge_page_results(self, page_results):
+        """依頁碼順序合併各頁書籍，並以 URL 去重"""
+        all_books = []
+        seen_urls = set()
+        for page_number in sorted(page_results):
+            books = page_results[page_number]
+            if books is None:
+                print(f"  第 {page_number} 頁沒有資料")
+                continue
+            page_new_count = self._merge_books(books, seen_urls, all_books)
+            if page_new_count == 0:
+                print(f"  第 {page_number} 頁沒有新書")
+        return all_books
 
-            # 組合分類（動物-主題）
-            combined = []
-            for animal in book['animal_types']:
-                for topic in book['topics']:
-                    combined.append(f"{animal}-{topic}")
-            book['combined_category'] = ", ".join(combined)
+    def categorize_all_books(self, books, cache=None):
+        """為所有書籍進行雙層分類，回傳 Book 列表
 
-            # 保留舊欄位供相容性
-            book['categories'] = book['topics']
-            book['category_str'] = book['topic_str']
+        分類以 bitmask 存在 Book 中，animal_types / topic_str / combined_category 等欄位
+        由分類表產生並共用。傳入 CategoryCache 時，書名與作者未變更的書籍直接使用快取結果。
+        """
+        categorized = []
+        for book in books:
+            text = self.matcher.book_text(book)
+            cached = cache.get(text) if cache is not None else None
 
-        return books
+            if cached is not None:
+                animal_types, topics, _ = cached
+                mask = self.taxonomy.encode(animal_types, topics)
+            else:
+                # 一次比對同時取得動物種類與主題分類
+                mask = self.matcher.match_mask(text)
+                if cache is not None:
+                    labels = self.taxonomy.labels(mask)
+                    cache.put(text, labels['animal_types'], labels['topics'],
+                              labels['combined_category'])
+
+            categorized.append(Book.from_mapping(book, mask, self.taxonomy))
+
+        self.book_index(categorized, rebuild=True)
+        return categorized
+
+    def book_index(self, books, rebuild=False):
+        """books 的分類索引（同一個列表只建立一次，列表長度改變時重建）"""
+        index = self._book_index
+        if rebuild or index is None or self._indexed_books is not books or len(index) != len(books):
+            self._book_index = index = BookIndex(books)
+            self._indexed_books = books
+        return index
 
     def filter_by_category(self, books, category):
         """根據分類篩選書籍"""
-        return [book for book in books if category in book.get('categories', [])]
+        return self.book_index(books).filter('categories', category)
 
     def filter_by_animal_type(self, books, animal_type):
         """根據動物種類篩選書籍"""
-        return [book for book in books if animal_type in book.get('animal_types', [])]
+        return self.book_index(books).filter('animal_types', animal_type)
 
     def filter_by_topic(self, books, topic):
         """根據主題篩選書籍"""
-        return [book for book in books if topic in book.get('topics', [])]
+        return self.book_index(books).filter('topics', topic)
+
+    def _export(self, books, targets):
+        results = run_export(ExportTable.from_books(books), targets)
+        for result in results:
+            if result['error'] is not None:
+                print(f"\n匯出失敗: {result['path']} ({result['error']})")
+        return results
 
     def export_to_excel(self, books, filename=None):
         """匯出書籍資料到 Excel（含雙層分類）"""
@@ -347,46 +510,7 @@ class EslitePetBooksScraper:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"pet_books_{timestamp}.xlsx"
 
-        # 準備資料
-        export_data = []
-        for book in books:
-            export_data.append({
-                "書名": book.get('title', ''),
-                "作者": book.get('author', ''),
-                "售價": book.get('price', ''),
-                "原價": book.get('originalPrice', ''),
-                "折扣": book.get('discount', ''),
-                "動物種類": book.get('animal_type_str', ''),
-                "主題分類": book.get('topic_str', ''),
-                "組合分類": book.get('combined_category', ''),
-                "連結": book.get('url', ''),
-                "圖片": book.get('image', '')
-            })
-
-        df = pd.DataFrame(export_data)
-
-        # 創建 Excel 並分工作表
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-            # 全部書籍
-            df.to_excel(writer, sheet_name='全部書籍', index=False)
-
-            # 依動物種類分頁
-            for animal_type in list(ANIMAL_TYPES.keys()) + ["通用"]:
-                animal_books = [b for b in export_data if animal_type in b['動物種類']]
-                if animal_books:
-                    animal_df = pd.DataFrame(animal_books)
-                    # Excel 工作表名稱限制 31 字元
-                    sheet_name = f"【{animal_type}】"[:31]
-                    animal_df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            # 依主題分類分頁
-            for topic in list(TOPIC_CATEGORIES.keys()) + ["其他"]:
-                topic_books = [b for b in export_data if topic in b['主題分類']]
-                if topic_books:
-                    topic_df = pd.DataFrame(topic_books)
-                    sheet_name = f"主題-{topic}"[:31]
-                    topic_df.to_excel(writer, sheet_name=sheet_name, index=False)
-
+        self._export(books, [(XlsxSink(EXPORT_SHEET_GROUPS), filename)])
         print(f"\n已匯出到: {filename}")
         return filename
 
@@ -396,27 +520,42 @@ class EslitePetBooksScraper:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"pet_books_{timestamp}.csv"
 
-        export_data = []
-        for book in books:
-            export_data.append({
-                "書名": book.get('title', ''),
-                "作者": book.get('author', ''),
-                "售價": book.get('price', ''),
-                "原價": book.get('originalPrice', ''),
-                "折扣": book.get('discount', ''),
-                "動物種類": book.get('animal_type_str', ''),
-                "主題分類": book.get('topic_str', ''),
-                "組合分類": book.get('combined_category', ''),
-                "連結": book.get('url', ''),
-                "圖片": book.get('image', '')
-            })
-
-        df = pd.DataFrame(export_data)
-        df.to_csv(filename, index=False, encoding='utf-8-sig')
-
+        self._export(books, [(CsvSink(), filename)])
         print(f"\n已匯出到: {filename}")
         return filename
 
+    def export_all(self, books, basename=None, books_data_js=BOOKS_DATA_JS,
+                   catalog_data_dir=CATALOG_DATA_DIR, image_paths=None):
+        """一次匯出 Excel、CSV、JSON Lines 與網頁用的 books_data.js、分片資料
+
+        書籍只轉換一次，各格式同時寫出，並列出每個格式的耗時。
+        傳入 image_paths（{圖片網址: 本機路徑}）時，網頁用的資料改用本機圖片，
+        Excel / CSV / JSON Lines 仍保留原始網址。
+        回傳 {格式名稱: 檔名}（不含失敗的格式）。
+        """
+        if not basename:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            basename = f"pet_books_{timestamp}"
+
+        start = time.perf_counter()
+        table = ExportTable.from_books(books)
+        web_table = table
+        if image_paths:
+            web_table = table.with_column(
+                "圖片", (image_paths.get(url, url) for url in table.data["圖片"]))
+
+        targets = [
+            (XlsxSink(EXPORT_SHEET_GROUPS), f"{basename}.xlsx"),
+            (CsvSink(), f"{basename}.csv"),
+            (JsonLinesSink(), f"{basename}.jsonl"),
+            (BooksDataJsSink(), books_data_js, web_table),
+            (ShardedCatalogSink(EXPORT_SHEET_GROUPS), catalog_data_dir, web_table),
+        ]
+        results = run_export(table, targets)
+        print(f"\n已匯出 {len(books)} 本書（共 {time.perf_counter() - start:.2f} 秒）:")
+        print(format_export_report(results))
+        return {result['sink']: result['path'] for result in results if result['error'] is None}
+
     def print_summary(self, books):
         """印出統計摘要（雙層分類）"""
         print("\n" + "="*60)
@@ -424,100 +563,232 @@ class EslitePetBooksScraper:
         print("="*60)
         print(f"總共收集: {len(books)} 本書")
 
+        index = self.book_index(books)
+
         # 動物種類統計
         print("\n【動物種類】")
-        animal_counts = {}
-        for book in books:
-            for animal in book.get('animal_types', ['通用']):
-                animal_counts[animal] = animal_counts.get(animal, 0) + 1
-
+        animal_counts = index.value_counts('animal_types')
         for animal, count in sorted(animal_counts.items(), key=lambda x: -x[1]):
             print(f"  {animal}: {count} 本")
 
         # 主題分類統計
         print("\n【主題分類】")
-        topic_counts = {}
-        for book in books:
-            for topic in book.get('topics', ['其他']):
-                topic_counts[topic] = topic_counts.get(topic, 0) + 1
-
+        topic_counts = index.value_counts('topics')
         for topic, count in sorted(topic_counts.items(), key=lambda x: -x[1]):
             print(f"  {topic}: {count} 本")
 
         print("="*60)
 
 
-async def main():
-    """主程式"""
-    print("="*60)
-    print("誠品書局寵物書籍爬蟲")
-    print(f"分類頁面: {PET_CATEGORY_URL}")
-    print("="*60)
+async def launch_browser_context(playwright):
+    """啟動 Chromium 並建立爬取用的 context，回傳 (browser, context, resource_policy)"""
+    browser = await playwright.chromium.launch(
+        headless=True,  # 設為 False 可以看到瀏覽器操作
+    )
+
+    context = await browser.new_context(
+        viewport={'width': 1920, 'height': 1080},
+        user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    )
+
+    # 攔截圖片、字型與追蹤腳本
+    resource_policy = await ResourcePolicy().install(context)
+    return browser, context, resource_policy
+
+
+async def scrape_with_context(scraper, context, page_results=None):
+    """以已開啟的 context 抓取分類頁面（page_results 有值時只補抓其中為 None 的頁面）"""
+    if page_results:
+        missing_pages = [n for n, books in page_results.items() if books is None]
+        print(f"以瀏覽器補抓 {len(missing_pages)} 頁: {missing_pages}")
+        page_results.update(await scraper.scrape_pages_with_browser(
+            context, missing_pages, PAGE_POOL_SIZE))
+        return scraper.merge_page_results(page_results)
+
+    page = await context.new_page()
+    try:
+        return await scraper.scrape_category_page(page, concurrency=PAGE_POOL_SIZE)
+    finally:
+        await page.close()
 
-    scraper = EslitePetBooksScraper()
+
+async def collect_with_browser(scraper, page_results=None, context=None):
+    """以瀏覽器抓取分類頁面
+
+    page_results 有值時（HTTP 模式的結果）只補抓其中為 None 的頁面。
+    傳入 context（常駐模式已啟動的瀏覽器）時直接使用，否則啟動新的瀏覽器並在結束後關閉。
+    """
+    if context is not None:
+        return await scrape_with_context(scraper, context, page_results)
 
     async with async_playwright() as p:
         # 啟動瀏覽器
         print("\n正在啟動瀏覽器...")
-        browser = await p.chromium.launch(
-            headless=True,  # 設為 False 可以看到瀏覽器操作
-        )
+        browser, context, resource_policy = await launch_browser_context(p)
+        try:
+            books = await scrape_with_context(scraper, context, page_results)
+            print(resource_policy.summary())
+        finally:
+            await browser.close()
+            print("\n瀏覽器已關閉")
+
+    return books
 
-        context = await browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
 
-        page = await context.new_page()
+async def collect_category_books(scraper, categories=CRAWL_CATEGORIES, context=None, journal=None):
+    """收集所有分類的書籍：HTTP 模式優先，解析失敗的頁面才啟動瀏覽器
 
+    多個分類的分頁由同一個排程依主機速率上限共同抓取，跨分類重複的商品只保留一筆。
+    scraper 的分類網址與 categories 中的分類相同時沿用該 scraper，其餘分類各自建立。
+    context 為常駐模式已啟動的瀏覽器 context（見 collect_with_browser）。
+    journal（CrawlJournal）記錄每頁結果，已完成的頁面不再抓取；
+    瀏覽器爬取失敗的分類保留已取得的頁面，缺少的頁面列在日誌摘要中。
+    """
+    def category_scraper(url):
+        target = scraper if url == scraper.category_url else EslitePetBooksScraper(url)
+        target.journal = journal
+        return target
+
+    async def browser_fallback(name, url, page_results=None):
+        try:
+            return await collect_with_browser(category_scraper(url), page_results, context)
+        except Exception as e:
+            print(f"[{name}] 瀏覽器爬取失敗: {e}")
+            if journal is not None and not page_results:
+                journal.record_abort(url, 1)
+            return scraper.merge_page_results(page_results) if page_results else []
+
+    category_books = {}
+    if FETCH_BACKEND != "http":
+        for name, url in categories:
+            print(f"\n[{name}] {url}")
+            category_books[name] = await browser_fallback(name, url)
+    else:
+        backend = HttpListingBackend(HttpConnectionPool(max_per_host=CRAWL_MAX_CONCURRENCY))
+        scheduler = CrawlScheduler(backend, categories, journal=journal)
         try:
-            # 從分類頁面收集書籍
-            print("\n開始從分類頁面收集寵物書籍...")
-            books = await scraper.scrape_category_page(page)
-
-            if books:
-                # 分類書籍
-                print("\n正在分類書籍...")
-                books = scraper.categorize_all_books(books)
-
-                # 印出統計
-                scraper.print_summary(books)
-
-                # 匯出結果
-                print("\n正在匯出結果...")
-                scraper.export_to_excel(books)
-                scraper.export_to_csv(books)
-
-                # 顯示各動物種類的書籍範例
-                print("\n\n========== 各動物種類書籍範例 ==========")
-                for animal_type in list(ANIMAL_TYPES.keys()) + ["通用"]:
-                    animal_books = scraper.filter_by_animal_type(books, animal_type)
-                    if animal_books:
-                        print(f"\n【{animal_type}】({len(animal_books)} 本)")
-                        for book in animal_books[:2]:
-                            print(f"  - {book['title'][:45]}")
-
-                # 顯示各主題的書籍範例
-                print("\n\n========== 各主題分類書籍範例 ==========")
-                for topic in list(TOPIC_CATEGORIES.keys()) + ["其他"]:
-                    topic_books = scraper.filter_by_topic(books, topic)
-                    if topic_books:
-                        print(f"\n【{topic}】({len(topic_books)} 本)")
-                        for book in topic_books[:2]:
-                            print(f"  - {book['title'][:45]}")
+            print(f"正在以 HTTP 抓取 {len(categories)} 個分類: {', '.join(name for name, _ in categories)}")
+            results = await scheduler.run()
+        finally:
+            backend.close()
+        print(scheduler.summary())
+
+        for name, url in categories:
+            page_results = results[name]
+            if page_results and all(books is not None for books in page_results.values()):
+                category_books[name] = scraper.merge_page_results(page_results)
             else:
-                print("\n無法收集到書籍資料，可能是網站結構有變化。")
-                print(f"建議手動檢查 {PET_CATEGORY_URL}")
+                print(f"\n[{name}] 改用瀏覽器")
+                category_books[name] = await browser_fallback(name, url, page_results or None)
+
+    books, duplicates = merge_category_books(category_books, categories)
+    counts = "，".join(f"{name} {len(category_books.get(name) or [])} 本" for name, _ in categories)
+    print(f"\n分類頁面共收集: {len(books)} 本書（{counts}；跨分類重複 {duplicates} 本）")
+    if journal is not None:
+        print(journal.summary({url: name for name, url in categories}))
+    return books
+
+
+def store_books(books, source):
+    """寫入書目資料庫並記錄這次爬取，回傳 (新增數, 更新數)"""
+    with Catalog(CATALOG_DB) as catalog:
+        inserted, updated = catalog.upsert_books(books)
+        catalog.record_crawl(source, len(books))
+    return inserted, updated
+
+
+async def collect_and_export(scraper, context=None, cache=None, source='scraper', resume=False):
+    """收集所有分類的書籍、分類、寫入書目資料庫並匯出
+
+    context 為常駐模式已啟動的瀏覽器 context，cache 為常駐的 CategoryCache
+    （未傳入時從檔案載入）。回傳分類後的書籍，沒有收集到書籍時回傳空列表。
+    每頁結果寫入爬取日誌，resume 時沿用上次未完成的日誌；有頁面缺少時仍寫入書目資料庫，
+    但不匯出檔案，避免以不完整的資料覆蓋網站資料。
+    寫入資料庫與匯出在執行緒中執行，不阻塞事件迴圈（常駐模式的控制介面仍可回應）。
+    """
+    # 從分類頁面收集書籍
+    print("\n開始從分類頁面收集寵物書籍...")
+    with CrawlJournal.open(CRAWL_JOURNAL_FILE, resume) as journal:
+        books = await collect_category_books(scraper, context=context, journal=journal)
+    if not books:
+        return []
+
+    # 分類書籍
+    print("\n正在分類書籍...")
+    if cache is None:
+        cache = CategoryCache.load(
+            CATEGORY_CACHE_FILE, taxonomy_hash(ANIMAL_TYPES, TOPIC_CATEGORIES))
+    texts = [scraper.matcher.book_text(book) for book in books]
+    books = scraper.categorize_all_books(books, cache)
+    # 只有所有頁面都完成時才能確定哪些書已下架，缺少頁面時保留全部快取
+    dropped = cache.retain(texts) if journal.complete else 0
+    await asyncio.to_thread(cache.save)
+    print(cache.summary())
+    if dropped:
+        print(f"  移除 {dropped} 筆已不在書目中的分類快取")
+
+    # 印出統計
+    scraper.print_summary(books)
+
+    # 寫入書目資料庫
+    inserted, updated = await asyncio.to_thread(store_books, books, source)
+    print(f"\n已寫入 {CATALOG_DB}: 新增 {inserted} 本，更新 {updated} 本")
+
+    if not journal.complete:
+        print("\n部分頁面未完成，本次不匯出；以 --resume 補抓缺少的頁面後會一併匯出")
+        return books
 
-        except Exception as e:
-            print(f"\n執行時發生錯誤: {e}")
-            import traceback
-            traceback.print_exc()
+    # 匯出結果
+    print("\n正在匯出結果...")
+    image_paths = None
+    if MIRROR_IMAGES:
+        print("\n正在下載封面圖片...")
+        image_paths = await mirror_book_images(books)
+    await asyncio.to_thread(scraper.export_all, books, image_paths=image_paths)
+    return books
 
-        finally:
-            await browser.close()
-            print("\n瀏覽器已關閉")
+
+async def main(resume=False):
+    """主程式（resume 時從上次中斷的爬取日誌繼續）"""
+    print("="*60)
+    print("誠品書局寵物書籍爬蟲")
+    for name, url in CRAWL_CATEGORIES:
+        print(f"分類頁面: {name} {url}")
+    print("="*60)
+
+    scraper = EslitePetBooksScraper()
+
+    try:
+        books = await collect_and_export(scraper, resume=resume)
+
+        if books:
+            # 顯示各動物種類的書籍範例（由分類索引直接取得數量與前兩本）
+            index = scraper.book_index(books)
+            print("\n\n========== 各動物種類書籍範例 ==========")
+            for animal_type in list(ANIMAL_TYPES.keys()) + ["通用"]:
+                bits = index.bits('animal_types', animal_type)
+                if bits:
+                    print(f"\n【{animal_type}】({index.count(bits)} 本)")
+                    for book in index.books_of(bits, limit=2):
+                        print(f"  - {book['title'][:45]}")
+
+            # 顯示各主題的書籍範例
+            print("\n\n========== 各主題分類書籍範例 ==========")
+            for topic in list(TOPIC_CATEGORIES.keys()) + ["其他"]:
+                bits = index.bits('topics', topic)
+                if bits:
+                    print(f"\n【{topic}】({index.count(bits)} 本)")
+                    for book in index.books_of(bits, limit=2):
+                        print(f"  - {book['title'][:45]}")
+        else:
+            print("\n無法收集到書籍資料，可能是網站結構有變化。")
+            print(f"建議手動檢查 {PET_CATEGORY_URL}")
+
+    except Exception as e:
+        print(f"\n執行時發生錯誤: {e}")
+        import traceback
+        traceback.print_exc()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(resume='--resume' in sys.argv[1:]))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+誠品寵物書籍 - 本機測試用分類頁面伺服器
+產生與誠品分類頁面相同結構的 HTML，可注入延遲、錯誤與 429，
+用來觀察重試與自適應並行（pet_books_adaptive）的行為，不必對真實網站送出大量請求
+
+    python pet_books_standin.py      # 啟動伺服器並以 CrawlScheduler 爬取，印出並行數的調整紀錄
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from pet_books_adaptive import CRAWL_MAX_CONCURRENCY, AdaptiveConcurrency
+from pet_books_http import HttpConnectionPool, HttpListingBackend
+from pet_books_schedule import CrawlScheduler, HostRateLimiter
+
+
+class StandInListingServer:
+    """模擬分類頁面的本機 HTTP 伺服器
+
+    同時處理的請求超過 capacity 時，每多一個請求延遲增加 overload_latency 秒；
+    超過 throttle_above 時回應 429（附 Retry-After）；另以 error_rate 的機率回應 500。
+    fail_pages 為 {頁碼: 次數}，該頁的前幾次請求固定回應 500（用於測試重試）。
+    requested_pages 記錄每一頁被請求的次數。
+    """
+
+    def __init__(self, total_pages=40, books_per_page=20, latency=0.05, capacity=6,
+                 overload_latency=0.3, throttle_above=None, retry_after=1, error_rate=0.0, seed=0,
+                 fail_pages=None):
+        self.total_pages = total_pages
+        self.books_per_page = books_per_page
+        self.latency = latency
+        self.capacity = capacity
+        self.overload_latency = overload_latency
+        self.throttle_above = throttle_above
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.fail_pages = dict(fail_pages or {})
+        self.requested_pages = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.statuses = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def render_page(self, page_number):
+        """分類頁面 HTML（卡片與分頁按鈕的結構與誠品相同）"""
+        if page_number > self.total_pages:
+            return "<html><body><div class='product-list'></div></body></html>"
+        cards = "".join(
+            f'<a class="product-item" href="/product/{page_number}-{i}">'
+            f'<img src="/images/{page_number}-{i}.jpg">'
+            f'<div class="product-name">測試寵物書 第 {page_number} 頁 {i}</div>'
+            f'<div class="product-author">測試作者</div>'
+            f'<div class="slider-price">$300</div></a>'
+            for i in range(self.books_per_page))
+        pages = "".join(f"<a>{n}</a>" for n in range(1, self.total_pages + 1))
+        return f"<html><body>{cards}<div class='pagination'>{pages}</div></body></html>"
+
+    def handle(self, path):
+        """處理一個請求，回傳 (狀態碼, 標頭, 內容)"""
+        query = parse_qs(urlsplit(path).query)
+        page_number = int(query.get("page", ["1"])[0])
+        with self._lock:
+            self.in_flight += 1
+            in_flight = self.in_flight
+            self.max_in_flight = max(self.max_in_flight, in_flight)
+            self.requested_pages[page_number] += 1
+            failed = self._random.random() < self.error_rate
+            if self.fail_pages.get(page_number, 0) > 0:
+                self.fail_pages[page_number] -= 1
+                failed = True
+        try:
+            if self.throttle_above is not None and in_flight > self.throttle_above:
+                return 429, {"Retry-After": str(self.retry_after)}, b"too many requests"
+            time.sleep(self.latency + self.overload_latency * max(0, in_flight - self.capacity))
+            if failed:
+                return 500, {}, b"internal error"
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, \
+                self.render_page(page_number).encode("utf-8")
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def start(self):
+        """在背景執行緒啟動伺服器（隨機埠號），回傳網址"""
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status, headers, body = standin.handle(self.path)
+                with standin._lock:
+                    standin.statuses[status] += 1
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def summary(self):
+        statuses = "，".join(f"{status} ×{count}" for status, count in sorted(self.statuses.items()))
+        return f"測試伺服器: 最多同時處理 {self.max_in_flight} 個請求，回應 {statuses}"
+
+
+async def crawl_standin(server, controller=None):
+    """以 CrawlScheduler 爬取測試伺服器（不限主機速率），回傳 (scheduler, 各頁結果)"""
+    category = ("測試", f"{server.base_url}/category/test")
+    backend = HttpListingBackend(HttpConnectionPool(max_per_host=CRAWL_MAX_CONCURRENCY))
+    scheduler = CrawlScheduler(backend, [category], limiter=HostRateLimiter(rate=0),
+                               max_pages=server.total_pages, controller=controller)
+    try:
+        results = await scheduler.run()
+    finally:
+        backend.close()
+    return scheduler, results["測試"]
+
+
+def main():
+    scenarios = [
+        ("超過 6 個請求後延遲增加（目標延遲 1 秒）", dict(capacity=6, overload_latency=0.3)),
+        ("超過 8 個請求回應 429，另有 5% 錯誤", dict(capacity=8, throttle_above=8, error_rate=0.05)),
+    ]
+    for title, options in scenarios:
+        print(f"\n===== {title} =====")
+        server = StandInListingServer(total_pages=120, **options)
+        server.start()
+        try:
+            started = time.monotonic()
+            controller = AdaptiveConcurrency(initial=4, latency_target=1.0, label="同時抓取頁數")
+            scheduler, page_results = asyncio.run(crawl_standin(server, controller))
+            elapsed = time.monotonic() - started
+        finally:
+            server.stop()
+        missing = [n for n in range(1, server.total_pages + 1) if not page_results.get(n)]
+        print(scheduler.summary())
+        print(server.summary())
+        print(f"取得 {server.total_pages - len(missing)}/{server.total_pages} 頁"
+              f"{f'，缺少 {missing}' if missing else ''}，耗時 {elapsed:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
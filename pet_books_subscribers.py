@@ -0,0 +1,263 @@
+"""
+誠品寵物書籍 - 訂閱者名單
+以 Google Sheets 為來源，同一次執行只讀取一次，並在本機保存快照：
+快照未過期直接使用，過期時先比對試算表的修改時間，有變更才重新下載；
+試算表無法連線時改用快照。
+訂閱者可在試算表中勾選想收到的動物種類 / 主題分類，偏好相同的訂閱者分為同一組
+"""
+
+import json
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from pet_books_catalog import now_iso
+
+# 訂閱者快照（含 Email，不提交到版本庫）
+SUBSCRIBER_SNAPSHOT = "subscribers_snapshot.json"
+
+# 快照有效分鐘數，過期後以修改時間檢查是否需要重新下載
+SUBSCRIBER_TTL_MINUTES = int(os.environ.get("SUBSCRIBER_TTL_MINUTES", "60"))
+
+# Google Sheets API 逾時秒數
+SHEETS_TIMEOUT = float(os.environ.get("SHEETS_TIMEOUT", "20"))
+
+# 偏好欄位：標題包含這些文字的欄位（例如 Google 表單的問題「想收到的動物種類」）
+PREFERENCE_COLUMNS = {"animal_types": "動物種類", "topics": "主題分類"}
+
+# 表示不限分類的填答
+PREFERENCE_ANY = {"", "全部", "不限"}
+
+# Google 表單核取方塊以「, 」串接；也接受手動輸入的頓號、分號
+PREFERENCE_SEPARATOR = re.compile(r"[,，、;；]")
+
+# 沒有任何偏好（收到所有新書）的分組
+NO_PREFERENCE = ((), ())
+
+
+class GoogleSheetsSource:
+    """以 Service Account 讀取 Google Sheets 第一個工作表
+
+    revision() 回傳試算表最後修改時間（需要 Drive 中繼資料權限，取不到時回傳 None），
+    fetch_rows() 回傳所有儲存格值（第一列為標題）。
+    其他提供相同兩個方法的物件都可代替本類別，例如測試用的 StaticSubscriberSource。
+    """
+
+    name = "Google Sheets"
+
+    def __init__(self, sheets_id, credentials_json, timeout=SHEETS_TIMEOUT):
+        self.sheets_id = sheets_id
+        self.credentials_json = credentials_json
+        self.timeout = timeout
+        self._spreadsheet = None
+
+    def _open(self):
+        if self._spreadsheet is None:
+            import gspread
+            from google.oauth2.service_account import Credentials
+
+            credentials = Credentials.from_service_account_info(
+                json.loads(self.credentials_json),
+                scopes=[
+                    'https://www.googleapis.com/auth/spreadsheets.readonly',
+                    'https://www.googleapis.com/auth/drive.metadata.readonly',
+                ],
+            )
+            client = gspread.authorize(credentials)
+            if hasattr(client, 'set_timeout'):
+                client.set_timeout(self.timeout)
+            self._spreadsheet = client.open_by_key(self.sheets_id)
+        return self._spreadsheet
+
+    def revision(self):
+        try:
+            return self._open().lastUpdateTime
+        except ImportError:
+            raise
+        except Exception:
+            return None
+
+    def fetch_rows(self):
+        return self._open().sheet1.get_all_values()
+
+
+class StaticSubscriberSource:
+    """固定內容的訂閱者來源（本機測試用）"""
+
+    name = "static"
+
+    def __init__(self, rows, revision=None):
+        self.rows = rows
+        self._revision = revision
+        self.fetches = 0
+
+    def revision(self):
+        return self._revision
+
+    def fetch_rows(self):
+        self.fetches += 1
+        return [list(row) for row in self.rows]
+
+
+def parse_preference(value):
+    """解析偏好欄位的填答，回傳排序後的分類 tuple（空 tuple 代表不限）"""
+    choices = {choice.strip() for choice in PREFERENCE_SEPARATOR.split(value or "")}
+    if choices & (PREFERENCE_ANY - {""}):
+        return ()
+    return tuple(sorted(choices - PREFERENCE_ANY))
+
+
+def parse_subscriber_rows(rows):
+    """從試算表資料取出訂閱者偏好 {Email: (動物種類, 主題分類)}
+
+    Email 在第一欄，第一列為標題；沒有偏好欄位或未填寫時代表不限。
+    同一 Email 出現多次時以最後一列為準。
+    """
+    if not rows:
+        return {}
+    header = rows[0]
+    columns = [
+        next((i for i, title in enumerate(header) if keyword in title), None)
+        for keyword in PREFERENCE_COLUMNS.values()
+    ]
+
+    preferences = {}
+    for row in rows[1:]:
+        if row and row[0]:
+            email = row[0].strip()
+            if '@' in email:
+                preferences.pop(email, None)
+                preferences[email] = tuple(
+                    parse_preference(row[i]) if i is not None and i < len(row) else ()
+                    for i in columns
+                )
+    return preferences
+
+
+def group_by_preference(preferences):
+    """依偏好把訂閱者分組，回傳 {(動物種類, 主題分類): [Email, ...]}"""
+    segments = {}
+    for email, signature in preferences.items():
+        segments.setdefault(signature, []).append(email)
+    return segments
+
+
+def matches_preference(book, signature):
+    """書籍是否符合分組偏好（書籍需有 animal_types / topics 欄位）"""
+    animal_types, topics = signature
+    return ((not animal_types or not set(animal_types).isdisjoint(book['animal_types']))
+            and (not topics or not set(topics).isdisjoint(book['topics'])))
+
+
+def plan_digests(new_books, segments):
+    """決定每組訂閱者要收到的新書
+
+    回傳 [(分組偏好, 新書列表, Email 列表)]，沒有符合的新書的分組不寄送。
+    篩選次數只與分組數量有關，與訂閱者人數無關。
+    """
+    digests = []
+    for signature, emails in segments.items():
+        books = [book for book in new_books if matches_preference(book, signature)]
+        if books:
+            digests.append((signature, books, emails))
+    return digests
+
+
+def format_preference(signature):
+    """分組偏好的顯示文字，例如「貓、狗｜照護飼養」（不限時為空字串）"""
+    return "｜".join("、".join(choices) for choices in signature if choices)
+
+
+class SubscriberDirectory:
+    """訂閱者名單（記憶體快取 + 磁碟快照）
+
+    preferences() / subscribers() 在同一個物件中只會查詢來源一次。查詢順序：
+      1. 快照未超過 ttl 秒 → 直接使用
+      2. 來源的 revision 與快照相同 → 沿用快照並更新檢查時間
+      3. 重新下載整份名單並寫入快照
+    來源發生錯誤時使用快照（即使已過期）；沒有快照則只有 extra_recipients。
+    """
+
+    def __init__(self, source=None, snapshot_path=SUBSCRIBER_SNAPSHOT,
+                 ttl=SUBSCRIBER_TTL_MINUTES * 60, extra_recipients=()):
+        self.source = source
+        self.snapshot_path = Path(snapshot_path)
+        self.ttl = ttl
+        self.extra_recipients = [email for email in extra_recipients if email]
+        self.origin = None
+        self._subscribers = None
+
+    def _load_snapshot(self):
+        if not self.snapshot_path.exists():
+            return None
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"訂閱者快照無法讀取: {e}")
+            return None
+
+    def _save_snapshot(self, snapshot):
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _snapshot_age(self, snapshot):
+        try:
+            return (datetime.now() - datetime.fromisoformat(snapshot['checked_at'])).total_seconds()
+        except (KeyError, ValueError):
+            return float('inf')
+
+    def _load_rows(self):
+        snapshot = self._load_snapshot()
+        if snapshot is not None and self._snapshot_age(snapshot) < self.ttl:
+            self.origin = "快照"
+            return snapshot['rows']
+
+        try:
+            started = time.monotonic()
+            revision = self.source.revision()
+            if snapshot is not None and revision and revision == snapshot.get('revision'):
+                snapshot['checked_at'] = now_iso()
+                self._save_snapshot(snapshot)
+                self.origin = f"快照（{self.source.name} 未變更）"
+                return snapshot['rows']
+
+            rows = self.source.fetch_rows()
+            self._save_snapshot({'revision': revision, 'checked_at': now_iso(), 'rows': rows})
+            self.origin = f"{self.source.name}（{time.monotonic() - started:.1f} 秒）"
+            return rows
+        except ImportError:
+            print("警告: 未安裝 gspread 或 google-auth，無法讀取 Google Sheets")
+        except Exception as e:
+            print(f"讀取 {self.source.name} 時發生錯誤: {e}")
+
+        if snapshot is not None:
+            self.origin = f"快照（{snapshot.get('checked_at')}，{self.source.name} 無法連線）"
+            return snapshot['rows']
+        self.origin = f"{self.source.name}（無法連線，沒有快照）"
+        return []
+
+    def preferences(self):
+        """取得所有訂閱者的偏好 {Email: (動物種類, 主題分類)}
+
+        extra_recipients 不在試算表中時視為不限分類。
+        """
+        if self._subscribers is None:
+            subscribers = {}
+            if self.source is None:
+                print("未設定 Google Sheets，跳過從試算表讀取訂閱者")
+            else:
+                subscribers = parse_subscriber_rows(self._load_rows())
+                print(f"從 {self.origin} 讀取到 {len(subscribers)} 位訂閱者")
+            for email in self.extra_recipients:
+                subscribers.setdefault(email, NO_PREFERENCE)
+            self._subscribers = subscribers
+        return dict(self._subscribers)
+
+    def subscribers(self):
+        """取得所有訂閱者 Email（去除重複，保留順序）"""
+        return list(self.preferences())
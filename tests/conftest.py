@@ -0,0 +1,34 @@
+"""測試共用設定：專案模組位於上一層目錄，並提供本機測試伺服器"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from pet_books_standin import StandInListingServer  # noqa: E402
+
+
+@pytest.fixture
+def standin():
+    """啟動 StandInListingServer 的工廠，測試結束時關閉所有伺服器"""
+    servers = []
+
+    def start(**options):
+        server = StandInListingServer(**options)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    """重試不實際等待（保留 Retry-After 之外的退避邏輯由 backoff_delay 的單元測試涵蓋）"""
+    import pet_books_adaptive
+    monkeypatch.setattr(pet_books_adaptive, "backoff_delay", lambda *args, **kwargs: 0.01)
@@ -0,0 +1,191 @@
+"""自適應並行與重試：AIMD 調整、退避時間，以及對本機測試伺服器的爬取情境"""
+
+import asyncio
+import random
+
+import pytest
+
+from pet_books_adaptive import AdaptiveConcurrency, FetchError, backoff_delay, retry_with_backoff
+from pet_books_standin import crawl_standin
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+# ===== 退避時間 =====
+
+def test_backoff_delay_grows_with_jitter_and_cap():
+    rng = random.Random(1)
+    for attempt in range(6):
+        full = min(8, 1 * 2 ** attempt)
+        delay = backoff_delay(attempt, base=1, cap=8, rng=rng)
+        assert full / 2 <= delay <= full
+
+
+def test_backoff_delay_respects_retry_after():
+    assert backoff_delay(0, base=1, cap=30, retry_after=5, rng=random.Random(0)) == 5
+    # Retry-After 也受上限限制
+    assert backoff_delay(0, base=1, cap=10, retry_after=120, rng=random.Random(0)) == 10
+
+
+# ===== AIMD =====
+
+class FakeClock:
+    """取代 pet_books_adaptive 的 time，讓測試直接指定每個請求的延遲"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import pet_books_adaptive
+    fake = FakeClock()
+    monkeypatch.setattr(pet_books_adaptive, "time", fake)
+    return fake
+
+
+async def finish(controller, clock, count, latency=0.0, error=None):
+    """模擬同時送出 count 個請求，經過 latency 秒後全部完成"""
+    started = [await controller.acquire() for _ in range(count)]
+    clock.now += latency
+    for value in started:
+        await controller.release(value, error)
+
+
+def test_limit_grows_while_healthy(clock):
+    async def scenario():
+        controller = AdaptiveConcurrency(initial=4, maximum=6, latency_target=1.0, min_samples=4)
+        for _ in range(3):
+            await finish(controller, clock, controller.limit, latency=0.1)
+        return controller
+
+    controller = run(scenario())
+    assert controller.limit == 6
+    assert [decision[1:3] for decision in controller.decisions] == [(4, 5), (5, 6)]
+
+
+def test_limit_halves_on_slow_responses(clock):
+    async def scenario():
+        controller = AdaptiveConcurrency(initial=8, latency_target=1.0, min_samples=4)
+        await finish(controller, clock, 8, latency=2.0)
+        return controller
+
+    assert run(scenario()).limit == 4
+
+
+def test_limit_halves_on_errors(clock):
+    async def scenario():
+        controller = AdaptiveConcurrency(initial=4, error_threshold=0.1, min_samples=4)
+        await finish(controller, clock, 3, latency=0.1)
+        await finish(controller, clock, 1, latency=0.1, error=FetchError("u", 500))
+        return controller
+
+    controller = run(scenario())
+    assert controller.limit == 2
+    assert controller.errors == 1
+
+
+def test_throttle_decreases_once_per_burst(clock):
+    async def scenario():
+        controller = AdaptiveConcurrency(initial=8, min_samples=4)
+        started = [await controller.acquire() for _ in range(4)]
+        clock.now += 0.1
+        # 同一批送出的請求都收到 429，只減少一次
+        for value in started:
+            await controller.release(value, FetchError("u", 429))
+        return controller
+
+    controller = run(scenario())
+    assert controller.limit == 4
+    assert controller.throttled == 4
+    assert len(controller.decisions) == 1
+
+
+# ===== 重試 =====
+
+def attempts_failing_with(*errors, result="ok"):
+    calls = []
+
+    async def attempt():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return attempt, calls
+
+
+def test_retries_transient_errors(fast_backoff):
+    attempt, calls = attempts_failing_with(FetchError("u", 500), OSError("reset"), FetchError("u", 429))
+    assert run(retry_with_backoff(attempt, "測試", retries=3)) == "ok"
+    assert len(calls) == 4
+
+
+def test_gives_up_after_retries(fast_backoff):
+    attempt, calls = attempts_failing_with(*[FetchError("u", 503)] * 5)
+    with pytest.raises(FetchError):
+        run(retry_with_backoff(attempt, "測試", retries=2))
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("error", [FetchError("u", 404), TypeError("bug"), KeyError("title")])
+def test_does_not_retry_permanent_or_programming_errors(fast_backoff, error):
+    attempt, calls = attempts_failing_with(error)
+    with pytest.raises(type(error)):
+        run(retry_with_backoff(attempt, "測試", retries=3))
+    assert len(calls) == 1
+
+
+def test_rate_token_is_taken_after_concurrency_slot(fast_backoff):
+    async def scenario():
+        controller = AdaptiveConcurrency(initial=1, maximum=1)
+        events = []
+
+        async def before_attempt():
+            events.append(("token", controller.in_flight))
+
+        async def attempt():
+            events.append(("send", controller.in_flight))
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(retry_with_backoff(attempt, "測試", controller=controller,
+                                                  before_attempt=before_attempt) for _ in range(3)))
+        return events
+
+    events = run(scenario())
+    # 每次取得速率額度時都已佔用並行名額，不會有多個請求先拿額度再排隊
+    assert events == [("token", 1), ("send", 1)] * 3
+
+
+# ===== 本機測試伺服器情境 =====
+
+def test_standin_overload_lowers_concurrency(standin, fast_backoff):
+    server = standin(total_pages=100, books_per_page=2, latency=0.01, capacity=4, overload_latency=0.1)
+    controller = AdaptiveConcurrency(initial=4, maximum=12, latency_target=0.2, label="同時抓取頁數")
+    _, page_results = run(crawl_standin(server, controller))
+
+    assert all(page_results.get(n) for n in range(1, 101))
+    assert controller.peak > 4
+    assert any("延遲中位數" in reason and "秒 >" in reason for *_, reason in controller.decisions)
+    # 延遲過高時減少並行數，伺服器同時處理的請求數不會一直停在上限
+    assert controller.limit < 12
+
+
+def test_standin_throttling_and_errors_are_retried(standin, fast_backoff):
+    server = standin(total_pages=60, books_per_page=2, latency=0.1, capacity=12,
+                     throttle_above=6, retry_after=0, fail_pages={40: 2, 55: 1})
+    controller = AdaptiveConcurrency(initial=4, maximum=12, latency_target=1.0, label="同時抓取頁數")
+    _, page_results = run(crawl_standin(server, controller))
+
+    assert all(page_results.get(n) for n in range(1, 61))
+    assert server.statuses[429] >= 1
+    assert server.statuses[500] == 3
+    assert server.requested_pages[40] == 3
+    assert controller.throttled == server.statuses[429]
+    assert any("429" in reason for *_, reason in controller.decisions)
+    assert controller.retries == server.statuses[429] + server.statuses[500]
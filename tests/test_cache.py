@@ -0,0 +1,33 @@
+"""分類快取：完整爬取後只保留目前書目的分類結果"""
+
+from pet_books_cache import CategoryCache
+
+
+def test_retain_prunes_entries_of_removed_books(tmp_path):
+    path = tmp_path / "category_cache.json"
+    cache = CategoryCache.load(path, "v1")
+    for text in ("貓咪飼養 作者", "狗狗訓練 作者", "鳥類圖鑑 作者"):
+        cache.put(text, ["貓"], ["照護飼養"], "貓-照護飼養")
+    cache.save()
+
+    cache = CategoryCache.load(path, "v1")
+    assert cache.retain(["貓咪飼養 作者", "鳥類圖鑑 作者", "新書 作者"]) == 1
+    cache.save()
+
+    cache = CategoryCache.load(path, "v1")
+    assert len(cache.entries) == 2
+    assert cache.get("狗狗訓練 作者") is None
+    assert cache.get("鳥類圖鑑 作者") == [["貓"], ["照護飼養"], "貓-照護飼養"]
+
+
+def test_retain_without_stale_entries_does_not_rewrite(tmp_path):
+    path = tmp_path / "category_cache.json"
+    cache = CategoryCache.load(path, "v1")
+    cache.put("貓咪飼養 作者", ["貓"], ["照護飼養"], "貓-照護飼養")
+    cache.save()
+    mtime = path.stat().st_mtime_ns
+
+    cache = CategoryCache.load(path, "v1")
+    assert cache.retain(["貓咪飼養 作者"]) == 0
+    cache.save()
+    assert path.stat().st_mtime_ns == mtime
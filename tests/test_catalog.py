@@ -0,0 +1,93 @@
+"""書目資料庫：變動事件的查詢與舊版資料表的清除"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from pet_books_catalog import Catalog
+from pet_books_delta import EVENT_ADDED, EVENT_DISCOUNT_CHANGED, EVENT_PRICE_CHANGED, diff_catalog
+
+
+def make_book(product_id, price="300", discount=""):
+    return {
+        'title': f"書籍 {product_id}",
+        'price': price,
+        'discount': discount,
+        'url': f"https://www.eslite.com/product/{product_id}",
+    }
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    with Catalog(tmp_path / "pet_books.db") as catalog:
+        yield catalog
+
+
+def test_events_since_filters_by_time_type_and_product(catalog):
+    catalog.upsert_books([make_book("A"), make_book("B")], "2026-01-01T00:00:00")
+    catalog.record_events(diff_catalog([make_book("A"), make_book("B")], []), "2026-01-01T00:00:00")
+    current = [make_book("A", price="250"), make_book("B", discount="79"), make_book("C")]
+    catalog.record_events(diff_catalog(current, catalog.load_books()), "2026-02-01T00:00:00")
+
+    events = catalog.events_since("2026-01-15T00:00:00")
+    assert [(event['product_id'], event['event_type']) for event in events] == [
+        ("A", EVENT_PRICE_CHANGED), ("B", EVENT_DISCOUNT_CHANGED), ("C", EVENT_ADDED)]
+    assert events[0]['old_value'] == "300" and events[0]['new_value'] == "250"
+    assert events[0]['title'] == "書籍 A"
+    # 尚未寫入 books 的商品仍會回傳，書名為空字串
+    assert events[2]['title'] == ""
+
+    assert len(catalog.events_since("2026-01-01T00:00:00")) == 5
+    assert [event['product_id'] for event in
+            catalog.events_since("2026-01-01T00:00:00", event_type=EVENT_ADDED)] == ["A", "B", "C"]
+    assert [event['event_type'] for event in
+            catalog.events_since("2026-01-01T00:00:00", product_id="A")] == [EVENT_ADDED, EVENT_PRICE_CHANGED]
+
+
+def test_cleared_discount_records_a_single_event(catalog):
+    catalog.upsert_books([make_book("A", discount="79折")], "2026-01-01T00:00:00")
+    events = diff_catalog([make_book("A")], catalog.load_books())
+    catalog.record_events(events, "2026-01-02T00:00:00")
+    catalog.upsert_books([make_book("A")], "2026-01-02T00:00:00")
+
+    assert [event['event_type'] for event in catalog.events_since("2026-01-01T00:00:00")] == [
+        EVENT_DISCOUNT_CHANGED]
+    assert diff_catalog([make_book("A")], catalog.load_books()) == []
+
+
+def test_opening_an_old_database_drops_unused_category_tables(tmp_path):
+    path = tmp_path / "pet_books.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE book_animal_types (product_id TEXT, animal_type TEXT);
+        CREATE INDEX idx_animal_type ON book_animal_types(animal_type);
+        CREATE TABLE book_topics (product_id TEXT, topic TEXT);
+        CREATE INDEX idx_topic ON book_topics(topic);
+    """)
+    conn.close()
+
+    with Catalog(path) as catalog:
+        names = {row[0] for row in catalog.conn.execute("SELECT name FROM sqlite_master")}
+    assert not names & {"book_animal_types", "book_topics", "idx_animal_type", "idx_topic"}
+    assert {"books", "book_events", "idx_events_occurred_at", "idx_events_product"} <= names
+
+
+def test_daemon_events_job_reads_recent_events(tmp_path, monkeypatch):
+    import pet_books_daemon
+
+    path = tmp_path / "pet_books.db"
+    with Catalog(path) as catalog:
+        catalog.record_events(diff_catalog([make_book("A"), make_book("B")], []), "2026-01-01T00:00:00")
+        catalog.record_events(diff_catalog([make_book("A", price="250")], [make_book("A")]),
+                              "2026-02-01T00:00:00")
+    monkeypatch.setattr(pet_books_daemon, "CATALOG_DB", str(path))
+
+    daemon = pet_books_daemon.CrawlDaemon()
+    result = asyncio.run(daemon.job_events({'since': "2026-01-01T00:00:00", 'limit': 2}))
+    assert result['count'] == 3
+    assert result['counts'] == {EVENT_ADDED: 2, EVENT_PRICE_CHANGED: 1}
+    assert [event['product_id'] for event in result['events']] == ["B", "A"]
+
+    result = asyncio.run(daemon.job_events({'since': "2026-01-01T00:00:00", 'type': EVENT_PRICE_CHANGED}))
+    assert [(event['old_value'], event['new_value']) for event in result['events']] == [("300", "250")]
@@ -0,0 +1,69 @@
+"""常駐服務：瀏覽器中斷後重新啟動，以及耗時摘要的估計值標示"""
+
+import asyncio
+
+import playwright.async_api
+
+import pet_books_daemon
+from pet_books_daemon import JobTimer, WarmBrowser, format_timings
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePlaywright:
+    stopped = 0
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        FakePlaywright.stopped += 1
+
+
+def test_warm_browser_relaunches_after_disconnect(monkeypatch):
+    browsers = []
+
+    async def launch(playwright):
+        browsers.append(FakeBrowser())
+        return browsers[-1], object(), None
+
+    monkeypatch.setattr(playwright.async_api, "async_playwright", FakePlaywright)
+    monkeypatch.setattr(pet_books_daemon, "launch_browser_context", launch)
+    FakePlaywright.stopped = 0
+
+    async def scenario():
+        browser = WarmBrowser()
+        first = await browser.context()
+        assert await browser.context() is first
+        assert browser.launches == 1
+
+        browsers[0].connected = False
+        second = await browser.context()
+        assert second is not first
+        assert browser.launches == 2
+        assert FakePlaywright.stopped == 1
+
+        await browser.close()
+        assert browsers[1].closed
+        assert FakePlaywright.stopped == 2
+
+    asyncio.run(scenario())
+
+
+def test_timings_label_standalone_cost_as_estimate():
+    timer = JobTimer()
+    assert timer.record("check", 2.0) is False
+    assert timer.record("check", 1.0) is True
+    summary = timer.summary(startup_seconds=3.0)
+    assert summary["check"] == {'runs': 2, 'first': 2.0, 'standalone_estimate': 5.0, 'warm': 1.0}
+    assert "估計值" in format_timings(summary)
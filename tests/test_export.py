@@ -0,0 +1,74 @@
+"""匯出：分片資料的固定檔名、內容雜湊網址與穩定的搜尋索引，Excel 標題列樣式"""
+
+import json
+
+import pytest
+
+from pet_books_export import ExportTable, ShardedCatalogSink, XlsxSink, build_ngram_index
+
+
+def make_table(titles):
+    return ExportTable.from_books([
+        {'title': title, 'author': "作者", 'url': f"https://www.eslite.com/product/{number}",
+         'animal_type_str': "貓", 'topic_str': "照護飼養"}
+        for number, title in enumerate(titles)
+    ])
+
+
+def read_manifest(directory):
+    return json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+
+
+def test_shard_names_stay_fixed_across_exports(tmp_path):
+    sink = ShardedCatalogSink([("主題分類", ["照護飼養"])], shard_size=2)
+    sink.write(make_table(["貓咪飼養", "狗狗訓練", "鳥類圖鑑"]), tmp_path)
+    first = read_manifest(tmp_path)
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert [shard['file'].split("?v=")[0] for shard in first['shards']] == [
+        "books-0000.json", "books-0001.json"]
+
+    mtime = (tmp_path / "books-0000.json").stat().st_mtime_ns
+    sink.write(make_table(["貓咪飼養", "狗狗訓練", "魚類水族"]), tmp_path)
+    second = read_manifest(tmp_path)
+
+    # 檔名不變；內容未變的分片網址相同且不重寫，內容改變的分片只換 ?v=
+    assert sorted(path.name for path in tmp_path.iterdir()) == files
+    assert second['shards'][0]['file'] == first['shards'][0]['file']
+    assert (tmp_path / "books-0000.json").stat().st_mtime_ns == mtime
+    assert second['shards'][1]['file'] != first['shards'][1]['file']
+
+
+def test_removed_shards_and_old_hashed_files_are_deleted(tmp_path):
+    (tmp_path / "books-0000.5f81c2cd3a10.json").write_text("[]")
+    (tmp_path / "books-0000.5f81c2cd3a10.json.gz").write_bytes(b"")
+    sink = ShardedCatalogSink(shard_size=1, compress=False)
+    sink.write(make_table(["貓咪飼養", "狗狗訓練"]), tmp_path)
+    sink.write(make_table(["貓咪飼養"]), tmp_path)
+
+    names = {path.name for path in tmp_path.iterdir()}
+    assert "books-0000.json" in names
+    assert "books-0001.json" not in names
+    assert not any(name.startswith("books-0000.5f81") for name in names)
+
+
+def test_ngram_index_keeps_first_occurrence_order():
+    index = build_ngram_index(make_table(["貓狗", "狗貓"]), columns=("書名",))
+    assert list(index) == ["貓", "狗", "貓狗", "狗貓"]
+    assert index["貓"] == [0, 1]
+
+
+def test_xlsx_header_matches_pandas_style(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    pd = pytest.importorskip("pandas")
+
+    table = make_table(["貓咪飼養"])
+    XlsxSink().write(table, tmp_path / "sink.xlsx")
+    pd.DataFrame(table.records()).to_excel(tmp_path / "pandas.xlsx", index=False)
+
+    def header_style(path):
+        cell = openpyxl.load_workbook(path).worksheets[0]["A1"]
+        return (cell.value, cell.font.b, cell.border.left.style, cell.border.bottom.style,
+                cell.alignment.horizontal, cell.alignment.vertical)
+
+    assert header_style(tmp_path / "sink.xlsx") == header_style(tmp_path / "pandas.xlsx")
+    assert header_style(tmp_path / "sink.xlsx")[1] is True
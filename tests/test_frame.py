@@ -0,0 +1,27 @@
+"""互動版書籍資料：從匯出的 CSV 直接建立 BookFrame"""
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from pet_books_export import CsvSink, ExportTable  # noqa: E402
+from pet_books_frame import BookFrame  # noqa: E402
+
+
+def test_from_csv_builds_masks_from_exported_csv(tmp_path):
+    table = ExportTable.from_books([
+        {'title': "貓咪飼養", 'price': "1,200", 'url': "https://www.eslite.com/product/1",
+         'animal_type_str': "貓, 狗", 'topic_str': "照護飼養"},
+        {'title': "鳥類圖鑑", 'price': "350", 'url': "https://www.eslite.com/product/2",
+         'animal_type_str': "", 'topic_str': ""},
+    ])
+    path = tmp_path / "pet_books_test.csv"
+    CsvSink().write(table, path)
+
+    frame = BookFrame.from_csv(path)
+    assert len(frame) == 2
+    assert frame.select("動物種類", "狗")["書名"].tolist() == ["貓咪飼養"]
+    # 空白分類改為預設值
+    assert frame.select("主題分類", "其他")["書名"].tolist() == ["鳥類圖鑑"]
+    assert frame.frame["售價數值"].tolist() == [1200, 350]
+    assert BookFrame.to_export_table(frame.frame).data["連結"] == table.data["連結"]
@@ -0,0 +1,113 @@
+"""HTTP 抓取後端：分類頁面解析與透過本機測試伺服器抓取"""
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from pet_books_adaptive import FetchError
+from pet_books_http import HttpConnectionPool, HttpListingBackend, parse_listing_html
+
+FIXTURE = Path(__file__).parent / "fixtures" / "listing_page.html"
+PAGE_URL = "https://www.eslite.com/category/3/123"
+
+
+def parse_fixture():
+    return parse_listing_html(FIXTURE.read_text(encoding="utf-8"), PAGE_URL)
+
+
+def test_parses_cards_and_total_pages():
+    books, total_pages = parse_fixture()
+
+    assert total_pages == 12
+    assert [book["url"].rsplit("/", 1)[-1] for book in books] == [
+        "10012345", "10023456", "10034567", "10045678", "10056789", "10067890",
+    ]
+    first = books[0]
+    assert first == {
+        "title": "貓咪家庭醫學大百科",
+        "author": "林政毅",
+        "price": "695",
+        "originalPrice": "880",
+        "discount": "79折",
+        "url": "https://www.eslite.com/product/10012345",
+        "image": "https://s.eslite.com/b2b/newItem/2024/10012345.jpg",
+    }
+    # 價格去除 $ 與千分位，相對路徑的圖片（data-src）補成完整網址
+    assert books[1]["price"] == "1200"
+    assert books[1]["image"] == "https://www.eslite.com/images/10023456.jpg"
+    # .product-card 版型由卡片內的連結取得商品網址
+    assert books[5]["title"] == "倉鼠小日子"
+    assert books[5]["url"] == "https://www.eslite.com/product/10067890"
+
+
+def test_malformed_cards_are_not_merged():
+    books, _ = parse_fixture()
+    by_id = {book["url"].rsplit("/", 1)[-1]: book for book in books}
+
+    # 商品名稱的 div 未關閉：欄位仍屬於同一張卡片，後面的卡片不會併入
+    unclosed = by_id["10034567"]
+    assert unclosed["title"].startswith("兔兔飼養完全手冊")
+    assert unclosed["author"] == "陳大文"
+    assert unclosed["price"] == "420"
+
+    # 漏寫 </a>：下一張卡片開始時前一張即結束，兩本書各自保留自己的欄位
+    assert by_id["10045678"]["title"] == "水族造景入門"
+    assert by_id["10045678"]["price"] == "350"
+    assert by_id["10056789"]["title"] == "鸚鵡的語言"
+    assert by_id["10056789"]["price"] == "380"
+
+
+def test_unclosed_last_card_is_kept():
+    html = '<a class="product-item" href="/product/1"><div class="product-name">最後一本書'
+    books, total_pages = parse_listing_html(html, PAGE_URL)
+
+    assert [book["title"] for book in books] == ["最後一本書"]
+    assert total_pages == 1
+
+
+def test_fetch_through_standin(standin):
+    server = standin(total_pages=3, books_per_page=5, latency=0)
+    backend = HttpListingBackend(HttpConnectionPool(max_per_host=2))
+    try:
+        books, total_pages = asyncio.run(backend.fetch_listing(f"{server.base_url}/category/test?page=2"))
+        missing = asyncio.run(backend.fetch_listing(f"{server.base_url}/category/test?page=9"))
+    finally:
+        backend.close()
+
+    assert total_pages == 3
+    assert [book["title"] for book in books] == [f"測試寵物書 第 2 頁 {i}" for i in range(5)]
+    assert books[0]["url"] == f"{server.base_url}/product/2-0"
+    assert books[0]["price"] == "300"
+    # 沒有產品卡片的頁面回傳 None，由呼叫端改用瀏覽器
+    assert missing is None
+
+
+def test_fetch_errors_raise_fetch_error_when_requested(standin):
+    server = standin(total_pages=2, latency=0, fail_pages={1: 1})
+    backend = HttpListingBackend(HttpConnectionPool(max_per_host=1))
+    try:
+        with pytest.raises(FetchError) as error:
+            backend.fetch_listing_sync(f"{server.base_url}/category/test", raise_errors=True)
+        books, _ = backend.fetch_listing_sync(f"{server.base_url}/category/test", raise_errors=True)
+    finally:
+        backend.close()
+
+    assert error.value.status == 500 and error.value.retryable
+    assert len(books) == 20
+
+
+def test_pool_release_after_close_closes_connection():
+    class Connection:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    pool = HttpConnectionPool()
+    pool._acquire(("http", "example.com"))
+    pool.close()
+    connection = Connection()
+    pool._release(("http", "example.com"), connection)
+
+    assert connection.closed
@@ -0,0 +1,64 @@
+"""新書檢查：增量模式只抓取前幾頁、完整爬取的判斷"""
+
+import asyncio
+
+import new_books_checker
+from new_books_checker import is_full_crawl_due, make_incremental_stop
+
+
+def use_standin(monkeypatch, server):
+    monkeypatch.setattr(new_books_checker, "LISTING_CATEGORIES",
+                        [("測試", f"{server.base_url}/category/test")])
+    monkeypatch.setattr(new_books_checker, "FETCH_BACKEND", "http")
+
+
+def test_incremental_check_fetches_only_leading_pages(standin, monkeypatch):
+    server = standin(total_pages=50, books_per_page=3, latency=0.02)
+    use_standin(monkeypatch, server)
+    known = {f"{page}-{i}" for page in range(1, 51) for i in range(3)}
+    known -= {"1-0"}
+
+    books = asyncio.run(new_books_checker.scrape_all_books(make_incremental_stop(known, 2)))
+
+    # 第 1 頁有新書，第 2、3 頁皆為已知書籍即停止；全部以 HTTP 取得，不啟動瀏覽器
+    assert sum(server.requested_pages.values()) == 3
+    assert len(books) == 9
+    assert books[0]["url"].endswith("/product/1-0")
+
+
+def test_full_check_fetches_every_page(standin, monkeypatch):
+    server = standin(total_pages=8, books_per_page=3, latency=0)
+    use_standin(monkeypatch, server)
+
+    books = asyncio.run(new_books_checker.scrape_all_books())
+
+    assert sorted(server.requested_pages) == list(range(1, 9))
+    assert len(books) == 24
+
+
+class FakeCatalog:
+    def __init__(self, books=10, last_full="2999-01-01T00:00:00"):
+        self.books = books
+        self.last_full = last_full
+
+    def count(self):
+        return self.books
+
+    def last_crawl(self, source=None):
+        return self.last_full
+
+
+def test_full_crawl_without_sort_query(monkeypatch):
+    monkeypatch.setattr(new_books_checker, "LISTING_SORT_QUERY", "")
+    monkeypatch.setattr(new_books_checker, "FULL_CRAWL", False)
+
+    assert is_full_crawl_due(FakeCatalog())
+
+
+def test_incremental_only_with_sort_query(monkeypatch):
+    monkeypatch.setattr(new_books_checker, "LISTING_SORT_QUERY", "sort=new")
+    monkeypatch.setattr(new_books_checker, "FULL_CRAWL", False)
+
+    assert not is_full_crawl_due(FakeCatalog())
+    assert is_full_crawl_due(FakeCatalog(books=0))
+    assert is_full_crawl_due(FakeCatalog(last_full="2000-01-01T00:00:00"))
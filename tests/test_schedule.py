@@ -0,0 +1,89 @@
+"""多分類排程：完整與增量爬取時抓取的頁面"""
+
+import asyncio
+
+import pytest
+
+from pet_books_adaptive import AdaptiveConcurrency
+from pet_books_catalog import parse_product_id
+from pet_books_http import HttpConnectionPool, HttpListingBackend
+from pet_books_schedule import CrawlScheduler, HostRateLimiter, merge_category_books
+
+
+def known_ids(server):
+    """測試伺服器所有書籍的商品 ID（視為已在書目資料庫中）"""
+    return {f"{page}-{i}" for page in range(1, server.total_pages + 1) for i in range(server.books_per_page)}
+
+
+def crawl(server, rate=0, should_stop=None, categories=None, **options):
+    categories = categories or [("測試", f"{server.base_url}/category/test")]
+    backend = HttpListingBackend(HttpConnectionPool(max_per_host=12))
+    scheduler = CrawlScheduler(backend, categories, limiter=HostRateLimiter(rate=rate, burst=4),
+                               max_pages=server.total_pages, **options)
+    try:
+        results = asyncio.run(scheduler.run(should_stop))
+    finally:
+        backend.close()
+    return scheduler, results
+
+
+def test_full_crawl_fetches_every_page(standin):
+    server = standin(total_pages=30, books_per_page=3, latency=0)
+    scheduler, results = crawl(server)
+
+    assert sorted(results["測試"]) == list(range(1, 31))
+    assert sorted(server.requested_pages) == list(range(1, 31))
+    assert scheduler.total_pages == {"測試": 30}
+
+
+@pytest.mark.parametrize("rate", [0, 4])
+def test_incremental_crawl_stops_after_known_pages(standin, rate):
+    from new_books_checker import make_incremental_stop
+
+    server = standin(total_pages=50, books_per_page=3, latency=0.02)
+    should_stop = make_incremental_stop(known_ids(server), 2)
+    scheduler, results = crawl(server, rate=rate, should_stop=should_stop)
+
+    # 第 1、2 頁都是已知書籍即停止，不會在檢查停止條件之前先抓後面的頁面
+    assert sorted(results["測試"]) == [1, 2]
+    assert sum(server.requested_pages.values()) == 2
+    assert scheduler.skipped == {"測試": 48}
+
+
+def test_incremental_crawl_continues_past_new_books(standin):
+    from new_books_checker import make_incremental_stop
+
+    server = standin(total_pages=20, books_per_page=3, latency=0)
+    known = known_ids(server) - {"2-1", "3-0"}
+    _, results = crawl(server, should_stop=make_incremental_stop(known, 2))
+
+    # 第 2、3 頁有新書，連續兩頁皆為已知書籍要到第 4、5 頁
+    assert sorted(results["測試"]) == [1, 2, 3, 4, 5]
+    assert sum(server.requested_pages.values()) == 5
+
+
+def test_incremental_batches_keep_page_order(standin):
+    from new_books_checker import make_incremental_stop
+
+    server = standin(total_pages=40, books_per_page=3, latency=0.02)
+    should_stop = make_incremental_stop(known_ids(server), 2)
+    _, results = crawl(server, should_stop=should_stop, stop_batch=4)
+
+    # 每批 4 頁：第 1 頁之後抓第 2–5 頁，檢查停止條件成立即停止
+    assert sorted(results["測試"]) == [1, 2, 3, 4, 5]
+
+
+def test_categories_share_queue_and_merge_duplicates(standin):
+    first = standin(total_pages=4, books_per_page=2, latency=0)
+    second = standin(total_pages=2, books_per_page=2, latency=0)
+    categories = [("甲", f"{first.base_url}/category/a"), ("乙", f"{second.base_url}/category/b")]
+    _, results = crawl(first, categories=categories,
+                       controller=AdaptiveConcurrency(initial=2, maximum=4))
+
+    category_books = {name: [book for page in sorted(pages) for book in pages[page]]
+                      for name, pages in results.items()}
+    # 兩個伺服器的商品路徑相同（/product/1-0 ...），以商品 ID 去重後保留第一個分類
+    books, duplicates = merge_category_books(category_books, categories)
+    assert len(books) == 8
+    assert duplicates == 4
+    assert {book["source_category"] for book in books if parse_product_id(book["url"]) == "1-0"} == {"甲, 乙"}